@@ -0,0 +1,149 @@
+"""
+Benchmark de resolución de metadatos
+----------------------------------------------------
+Resuelve una lista de videos contra un servidor local que imita YouTube
+(página /watch y respuesta JSON de /youtubei/v1/player, con latencia) y
+compara:
+  - un hilo por búsqueda, como hacían las interfaces,
+  - AsyncEngine con distintos límites de consultas en curso.
+
+Muestra resoluciones por segundo y el máximo de hilos vivos.
+
+Uso:
+    python benchmarks/async_resolve.py [--videos 1000] [--latency-ms 50]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_server import FixtureServer  # noqa: E402
+from ytmp3 import net  # noqa: E402
+from ytmp3.aio import AsyncEngine  # noqa: E402
+from ytmp3.engine import Engine  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+
+WATCH_PAGE = b"<html><head><title>Video de prueba - YouTube</title></head><body></body></html>"
+PLAYER_RESPONSE = json.dumps({
+    "playabilityStatus": {"status": "OK"},
+    "streamingData": {"adaptiveFormats": [
+        {"itag": 251, "mimeType": 'audio/webm; codecs="opus"', "bitrate": 160000,
+         "contentLength": "3500000", "url": "http://127.0.0.1/audio/251"},
+        {"itag": 140, "mimeType": 'audio/mp4; codecs="mp4a.40.2"', "bitrate": 128000,
+         "contentLength": "3000000", "url": "http://127.0.0.1/audio/140"},
+    ]},
+}).encode()
+
+
+class MockEngine(Engine):
+    """Engine que consulta el servidor local con las mismas dos peticiones que pytubefix"""
+
+    base_url = None
+
+    def _fetch_info(self, url, video_id):
+        with net.urlopen(f"{self.base_url}watch?v={video_id}", timeout=30) as response:
+            title = re.search(rb"<title>(.*?) - YouTube</title>", response.read()).group(1).decode()
+        body = json.dumps({"videoId": video_id}).encode()
+        with net.urlopen(f"{self.base_url}youtubei/v1/player", body, timeout=30) as response:
+            formats = json.loads(response.read())["streamingData"]["adaptiveFormats"]
+        streams = [
+            StreamInfo(f["itag"], f"{f['bitrate'] // 1000}kbps", f["mimeType"].split(";")[0],
+                       int(f["contentLength"]), url=f["url"])
+            for f in formats
+        ]
+        return VideoInfo(video_id, url, title, streams)
+
+
+def client_threads():
+    """Hilos vivos sin contar los del servidor local"""
+    return sum(1 for thread in threading.enumerate() if "process_request_thread" not in thread.name)
+
+
+class ThreadCounter:
+    """Muestrea los hilos del cliente y guarda el máximo"""
+
+    def __init__(self):
+        self.peak = client_threads()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(0.005):
+            self.peak = max(self.peak, client_threads())
+
+
+def video_urls(count):
+    return [f"https://www.youtube.com/watch?v={index:011d}" for index in range(count)]
+
+
+def resolve_with_threads(engine, urls):
+    results = []
+
+    def worker(url):
+        results.append(engine.resolve(url))
+
+    threads = [threading.Thread(target=worker, args=(url,), daemon=True) for url in urls]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def resolve_with_asyncio(aio, urls):
+    async def resolve_all():
+        return await asyncio.gather(*(aio.resolve(url) for url in urls))
+
+    return asyncio.run(resolve_all())
+
+
+def measure(name, function, count):
+    with ThreadCounter() as counter:
+        start = time.perf_counter()
+        results = function()
+        elapsed = time.perf_counter() - start
+    assert len(results) == count
+    print(f"{name:<22} {count / elapsed:>12.0f} {counter.peak:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=1000)
+    parser.add_argument("--latency-ms", type=int, default=50, help="latencia de cada respuesta")
+    parser.add_argument("--limits", default="8,64,256", help="límites de consultas en curso a probar")
+    args = parser.parse_args()
+
+    limits = [int(limit) for limit in args.limits.split(",")]
+    urls = video_urls(args.videos)
+    files = {"watch": WATCH_PAGE, "youtubei/v1/player": PLAYER_RESPONSE}
+
+    with FixtureServer(files, latency=args.latency_ms / 1000) as server:
+        MockEngine.base_url = server.url()
+        # El pool no debe ser el cuello de botella en ninguna variante
+        net.configure(max_per_host=args.videos)
+
+        print(f"{'variante':<22} {'resol./s':>12} {'hilos máx.':>12}")
+        measure("un hilo por búsqueda", lambda: resolve_with_threads(MockEngine(), urls), len(urls))
+        for limit in limits:
+            with AsyncEngine(MockEngine(), max_in_flight=limit) as aio:
+                measure(f"asyncio, límite {limit}", lambda: resolve_with_asyncio(aio, urls), len(urls))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""
+Utilidades comunes de los benchmarks
+----------------------------------------------------
+Muestras de audio sintéticas y un transcodificador que no convierte nada.
+Se importa como local_server, después de añadir la raíz del repositorio a
+sys.path:
+    from common import CopyTranscoder, generate_sample
+"""
+
+import shutil
+
+from ytmp3.ffmpeg import FFmpegProcess
+from ytmp3.transcoders import Transcoder
+
+# Estéreo en AAC, como el itag 140 de YouTube
+AAC_OPTIONS = ["-ac", "2", "-c:a", "aac", "-b:a", "160k"]
+
+
+def generate_sample(path, seconds, options=AAC_OPTIONS, source=None):
+    """
+    Genera un audio sintético con ffmpeg y devuelve su contenido.
+    source es la fuente lavfi (un tono de 440 Hz si no se indica) y options
+    lo que va entre la entrada y el archivo de salida.
+    """
+    source = source or f"sine=frequency=440:duration={seconds}"
+    process = FFmpegProcess(["-f", "lavfi", "-i", source] + list(options) + [path])
+    if process.wait() != 0:
+        raise SystemExit(process.error_output)
+    with open(path, "rb") as handle:
+        return handle.read()
+
+
+class CopyTranscoder(Transcoder):
+    """Sin conversión real: solo mueve el archivo, para medir únicamente la descarga"""
+
+    name = "copy"
+
+    def transcode(self, source_file, output_file, source_codec=None, duration=None, on_progress=None,
+                  cancel=None, segments=None, tags=None):
+        shutil.move(source_file, output_file)
+        return output_file
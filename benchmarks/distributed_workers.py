@@ -0,0 +1,144 @@
+"""
+Prueba del modo distribuido en una sola máquina
+----------------------------------------------------
+Crea una cola SQLite, encola videos falsos y lanza varios procesos
+trabajadores que los descargan de un servidor local y los convierten. Para
+ejercitar los mecanismos de recuperación:
+  - algunos videos fallan al resolverse en el primer intento (se reintentan),
+  - uno de los trabajadores muere con SIGKILL a mitad del lote (sus tareas
+    vuelven a la cola cuando vence el arrendamiento).
+
+Al final comprueba que cada video se completó exactamente una vez y muestra
+el tiempo total, los intentos y cuántas tareas hizo cada trabajador.
+
+Uso:
+    python benchmarks/distributed_workers.py [--workers 4] [--videos 40]
+"""
+
+import argparse
+import collections
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.broker import Broker, TaskState  # noqa: E402
+from ytmp3.engine import Engine  # noqa: E402
+from ytmp3.errors import TransientError  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.worker import Worker  # noqa: E402
+
+SAMPLE_SECONDS = 5
+
+
+class MockEngine(Engine):
+    """Engine que resuelve cada video a un archivo del servidor local"""
+
+    def __init__(self, base_url, size, flaky_dir, **options):
+        super().__init__(**options)
+        self.base_url = base_url
+        self.size = size
+        self.flaky_dir = flaky_dir
+
+    def _fetch_info(self, url, video_id):
+        # Los videos "flaky" fallan la primera vez que se resuelven, en cualquier trabajador
+        if video_id.startswith("flaky"):
+            marker = os.path.join(self.flaky_dir, video_id)
+            if not os.path.exists(marker):
+                open(marker, "w").close()
+                raise TransientError("Error al conectar con YouTube: fallo simulado")
+        stream = StreamInfo(140, "128kbps", "audio/mp4", self.size, url=f"{self.base_url}sample.m4a",
+                            codec="mp4a.40.2")
+        return VideoInfo(video_id, url, f"Video {video_id}", [stream], duration=SAMPLE_SECONDS)
+
+
+def run_worker(broker_path, base_url, size, flaky_dir, name, lease_time):
+    """Proceso trabajador: lo mismo que 'ytmp3.distributed worker' con el motor falso"""
+    broker = Broker(broker_path, retry_delay=0.5)
+    engine = MockEngine(base_url, size, flaky_dir, download_workers=2, convert_workers=1)
+    worker = Worker(broker, engine, name=name, lease_time=lease_time, poll_interval=0.2)
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    with engine:
+        worker.run(exit_when_idle=True)
+
+
+
+def video_urls(count, flaky):
+    """URLs con IDs de 11 caracteres; flaky de ellas, repartidas por la lista, fallan una vez"""
+    step = max(1, count // max(1, flaky))
+    flaky_indexes = set(range(0, count, step)[:flaky])
+    return [
+        f"https://www.youtube.com/watch?v={'flaky' if index in flaky_indexes else 'video'}{index:06d}"
+        for index in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--videos", type=int, default=40)
+    parser.add_argument("--flaky", type=int, default=5, help="videos que fallan en el primer intento")
+    parser.add_argument("--lease-time", type=float, default=3.0)
+    parser.add_argument("--kill-after", type=int, default=10, help="matar un trabajador tras N tareas completadas")
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as directory:
+        data = generate_sample(os.path.join(directory, "sample.m4a"), SAMPLE_SECONDS)
+        output_dir = os.path.join(directory, "out")
+        flaky_dir = os.path.join(directory, "flaky")
+        os.makedirs(output_dir)
+        os.makedirs(flaky_dir)
+
+        with FixtureServer({"sample.m4a": data}) as server:
+            broker = Broker(os.path.join(directory, "queue.sqlite3"))
+            ids = broker.submit(video_urls(args.videos, args.flaky), output_dir)
+
+            start = time.perf_counter()
+            processes = [
+                context.Process(
+                    target=run_worker,
+                    args=(broker.path, server.url(), len(data), flaky_dir, f"worker-{index}", args.lease_time),
+                )
+                for index in range(args.workers)
+            ]
+            for process in processes:
+                process.start()
+
+            killed = False
+            while any(process.is_alive() for process in processes):
+                if not killed and broker.counts()[TaskState.DONE] >= args.kill_after:
+                    os.kill(processes[0].pid, signal.SIGKILL)
+                    killed = True
+                    print(f"worker-0 muerto tras {args.kill_after} tareas completadas", file=sys.stderr)
+                time.sleep(0.1)
+            elapsed = time.perf_counter() - start
+
+            tasks = broker.tasks(ids)
+            broker.close()
+
+    done = [task for task in tasks if task.state == TaskState.DONE]
+    failed = [task for task in tasks if task.state == TaskState.FAILED]
+    outputs = collections.Counter(task.output_file for task in done)
+    attempts = collections.Counter(task.attempts for task in tasks)
+    by_worker = collections.Counter(task.worker for task in done)
+
+    print(f"{len(tasks)} tareas en {elapsed:.2f} s con {args.workers} trabajadores")
+    print(f"  completadas: {len(done)}, fallidas: {len(failed)}")
+    print("  intentos: " + ", ".join(f"{count} con {n}" for n, count in sorted(attempts.items())))
+    print("  por trabajador: " + ", ".join(f"{name} {count}" for name, count in sorted(by_worker.items())))
+    for task in failed:
+        print(f"  [{task.id}] {task.url}: {task.error}")
+    assert len(outputs) == len(done), "dos tareas escribieron el mismo archivo"
+    assert not failed, "quedaron tareas fallidas"
+
+
+if __name__ == "__main__":
+    main()
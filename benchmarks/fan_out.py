@@ -0,0 +1,123 @@
+"""
+Varias salidas de una sola descarga
+----------------------------------------------------
+Convierte un lote de videos falsos (servidos por local_server.py) a varios
+formatos de dos maneras:
+  1. un motor por formato, como habría que hacerlo sin FanOutTranscoder:
+     cada formato descarga y decodifica el audio otra vez;
+  2. un solo motor con FanOutTranscoder: una descarga y una decodificación
+     por video, y todas las salidas a la vez en el mismo proceso de ffmpeg.
+Muestra el tiempo, los bytes servidos y el tiempo de CPU de ffmpeg, y
+comprueba el formato, el bitrate y la frecuencia de muestreo de cada archivo.
+
+Uso:
+    python benchmarks/fan_out.py [--outputs mp3:320k,mp3:128k,opus] [--videos 4] [--seconds 60]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.ffmpeg import find_ffmpeg  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.transcoders import FanOutTranscoder, parse_outputs  # noqa: E402
+
+
+
+def children_cpu():
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def run_batch(server, data, seconds, videos, transcoder, output_dir):
+    """Descarga y convierte el lote; devuelve (segundos, bytes servidos, CPU de ffmpeg, trabajos)"""
+    sent = server.bytes_sent
+    cpu = children_cpu()
+    start = time.perf_counter()
+    with Engine(transcoder=transcoder, download_workers=videos) as engine:
+        jobs = []
+        for index in range(videos):
+            stream = StreamInfo(140, "160kbps", "audio/mp4", len(data), url=server.url("sample.m4a"),
+                                codec="mp4a.40.2")
+            info = VideoInfo(f"video{index:06d}", stream.url, f"Video {index}", [stream], duration=seconds)
+            jobs.append(engine.submit(Job(info.url, output_dir, info=info, stream=stream)))
+        engine.wait(jobs)
+    for job in jobs:
+        if job.error is not None:
+            raise SystemExit(f"Falló {job.title}: {job.error}")
+    return time.perf_counter() - start, server.bytes_sent - sent, children_cpu() - cpu, jobs
+
+
+def probe(path):
+    """(códec, kb/s, Hz) del audio del archivo según ffmpeg"""
+    stderr = subprocess.run([find_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True).stderr
+    match = re.search(r"Audio: (\w+).*?, (\d+) Hz.*?(?:, (\d+) kb/s)?$", stderr, re.MULTILINE)
+    codec, rate, bitrate = match.groups()
+    if bitrate is None:
+        bitrate = re.search(r"bitrate: (\d+) kb/s", stderr).group(1)
+    return codec, int(bitrate), int(rate)
+
+
+def check_outputs(transcoder, jobs):
+    ok = True
+    for output, path in zip(transcoder.outputs, jobs[0].output_files):
+        codec, bitrate, rate = probe(path)
+        expected_rate = output.output_sample_rate
+        passed = os.path.basename(path).endswith(f".{output.extension}") and rate == expected_rate
+        if output.bitrate:
+            # El bitrate medido de un archivo corto varía un poco respecto al pedido
+            wanted = int(output.bitrate.rstrip("k"))
+            passed = passed and abs(bitrate - wanted) <= wanted * 0.1
+        ok = ok and passed
+        print(f"  {'OK   ' if passed else 'FALLO'} {output.label:<14} {os.path.basename(path):<22} "
+              f"{codec} {bitrate} kb/s {rate} Hz")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--outputs", default="mp3:320k,mp3:128k,opus", help="salidas, como en --outputs")
+    parser.add_argument("--videos", type=int, default=4)
+    parser.add_argument("--seconds", type=int, default=60, help="duración de cada audio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = generate_sample(os.path.join(directory, "sample.m4a"), args.seconds)
+        with FixtureServer({"sample.m4a": data}) as server:
+            separate = [0.0, 0, 0.0]
+            for index, output in enumerate(parse_outputs(args.outputs)):
+                output_dir = os.path.join(directory, f"separate{index}")
+                os.makedirs(output_dir)
+                result = run_batch(server, data, args.seconds, args.videos, output, output_dir)
+                separate = [total + value for total, value in zip(separate, result[:3])]
+
+            output_dir = os.path.join(directory, "fanout")
+            os.makedirs(output_dir)
+            transcoder = FanOutTranscoder(parse_outputs(args.outputs))
+            *fan_out, jobs = run_batch(server, data, args.seconds, args.videos, transcoder, output_dir)
+
+        outputs = len(transcoder.outputs)
+        print(f"{args.videos} videos de {args.seconds} s a {outputs} salidas ({args.outputs})")
+        print(f"{'':<18} {'tiempo':>8} {'MB servidos':>12} {'CPU ffmpeg':>11}")
+        for name, (elapsed, sent, cpu) in (("un motor por salida", separate), ("FanOutTranscoder", fan_out)):
+            print(f"{name:<18} {elapsed:>7.2f}s {sent / 1024 / 1024:>12.1f} {cpu:>10.2f}s")
+        print("Salidas del primer video:")
+        ok = check_outputs(transcoder, jobs)
+        ok = ok and fan_out[1] * outputs == separate[1]
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Benchmark del pool de conexiones HTTP
+----------------------------------------------------
+Compara peticiones por segundo contra el servidor local usando
+urllib.request.urlopen (una conexión nueva por petición) y ytmp3.net
+(conexiones keep-alive reutilizadas), en secuencia y con varios hilos.
+
+Uso:
+    python benchmarks/http_pool.py [--requests 2000] [--threads 8]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_server import FixtureServer  # noqa: E402
+from ytmp3 import net  # noqa: E402
+
+
+def run(opener, url, requests, threads):
+    """Devuelve peticiones por segundo repartiendo las peticiones entre hilos"""
+    per_thread = requests // threads
+
+    def worker():
+        for _ in range(per_thread):
+            with opener(url, timeout=10) as response:
+                response.read()
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return per_thread * threads / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--size", type=int, default=4096, help="bytes de cada respuesta")
+    args = parser.parse_args()
+
+    pool = net.ConnectionPool(max_per_host=args.threads)
+    pooled = net.build_opener(pool).open
+    with FixtureServer({"item": os.urandom(args.size)}) as server:
+        url = server.url("item")
+        print(f"{'cliente':<10} {'hilos':>5} {'peticiones/s':>13} {'conexiones':>11}")
+        for threads in (1, args.threads):
+            for name, opener in (("urllib", urllib.request.urlopen), ("pool", pooled)):
+                before = server.connections
+                rate = run(opener, url, args.requests, threads)
+                print(f"{name:<10} {threads:>5} {rate:>13.0f} {server.connections - before:>11}")
+
+
+if __name__ == "__main__":
+    main()
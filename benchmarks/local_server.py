@@ -0,0 +1,195 @@
+"""
+Servidor HTTP local para pruebas y benchmarks
+----------------------------------------------------
+Sirve archivos de prueba desde memoria con soporte de Range y keep-alive,
+y permite simular una red mala: limitar la velocidad por conexión, cortar
+la conexión tras enviar cierto número de bytes o responder con errores.
+
+Ejemplo:
+    with FixtureServer({"a.webm": data}, throttle=512 * 1024, drop_after=100000) as server:
+        url = server.url("a.webm")
+"""
+
+import re
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    # Admite ráfagas de cientos de conexiones simultáneas
+    request_queue_size = 256
+
+
+class FixtureServer:
+    """
+    files: nombre -> bytes servidos en /<nombre>
+    throttle: bytes por segundo por conexión (None = sin límite)
+    drop_after: cierra la conexión tras enviar esos bytes de una respuesta
+    fail_statuses: códigos HTTP con los que responder a las primeras peticiones
+    retry_after: valor de la cabecera Retry-After en respuestas 429/503
+    ranges: si es False, ignora Range y responde siempre 200 con todo el archivo
+    latency: segundos de espera antes de cada respuesta
+    outage: durante esos segundos desde start() responde 503 a todo (servidor caído)
+    """
+
+    def __init__(self, files, throttle=None, drop_after=None, fail_statuses=None, retry_after=None,
+                 ranges=True, latency=None, outage=None):
+        self.files = files
+        self.throttle = throttle
+        self.drop_after = drop_after
+        self.fail_statuses = list(fail_statuses or [])
+        self.retry_after = retry_after
+        self.ranges = ranges
+        self.latency = latency
+        self.outage = outage
+        self.started_at = None
+
+        self.requests = 0
+        self.connections = 0
+        self.bytes_sent = 0
+        # Respuestas de error enviadas (fail_statuses u outage)
+        self.failures_sent = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        self.started_at = time.monotonic()
+        self._server = _Server(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def url(self, name=""):
+        return f"http://127.0.0.1:{self.port}/{name}"
+
+    def _count(self, requests=0, connections=0, bytes_sent=0, failures_sent=0):
+        with self._lock:
+            self.failures_sent += failures_sent
+            self.requests += requests
+            self.connections += connections
+            self.bytes_sent += bytes_sent
+
+    def _next_failure(self):
+        if self.outage and time.monotonic() - self.started_at < self.outage:
+            return 503
+        with self._lock:
+            if self.fail_statuses:
+                return self.fail_statuses.pop(0)
+        return None
+
+    def _handler_class(self):
+        fixture = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                # Como cualquier servidor real: sin Nagle, las respuestas keep-alive
+                # no esperan al ACK retrasado del cliente
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                fixture._count(connections=1)
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self.respond(send_body=False)
+
+            def do_GET(self):
+                self.respond(send_body=True)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                self.respond(send_body=True)
+
+            def respond(self, send_body):
+                fixture._count(requests=1)
+                if fixture.latency:
+                    time.sleep(fixture.latency)
+                status = fixture._next_failure()
+                if status is not None:
+                    fixture._count(failures_sent=1)
+                    self.send_response(status)
+                    if fixture.retry_after is not None and status in (429, 503):
+                        self.send_header("Retry-After", str(fixture.retry_after))
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                data = fixture.files.get(self.path.lstrip("/").split("?")[0])
+                if data is None:
+                    self.send_error(404)
+                    return
+
+                start, end = 0, len(data) - 1
+                range_header = self.headers.get("Range")
+                match = re.match(r"bytes=(\d+)-(\d*)", range_header or "")
+                if match and fixture.ranges:
+                    start = int(match.group(1))
+                    end = min(int(match.group(2)), end) if match.group(2) else end
+                    if start > end:
+                        self.send_response(416)
+                        self.send_header("Content-Range", f"bytes */{len(data)}")
+                        self.send_header("Content-Length", "0")
+                        self.end_headers()
+                        return
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    self.send_response(200)
+                self.send_header("Content-Length", str(end - start + 1))
+                self.send_header("Accept-Ranges", "bytes")
+                self.end_headers()
+                if send_body:
+                    self.send_body(data, start, end)
+
+            def send_body(self, data, start, end):
+                sent = 0
+                started = time.monotonic()
+                block = 16 * 1024
+                offset = start
+                while offset <= end:
+                    if fixture.drop_after is not None and sent >= fixture.drop_after:
+                        # Simula un corte de red a mitad de respuesta
+                        self.close_connection = True
+                        self.connection.close()
+                        return
+                    piece = data[offset:min(offset + block, end + 1)]
+                    if fixture.drop_after is not None:
+                        piece = piece[:fixture.drop_after - sent]
+                    try:
+                        self.wfile.write(piece)
+                    except OSError:
+                        return
+                    sent += len(piece)
+                    offset += len(piece)
+                    fixture._count(bytes_sent=len(piece))
+                    if fixture.throttle:
+                        delay = sent / fixture.throttle - (time.monotonic() - started)
+                        if delay > 0:
+                            time.sleep(delay)
+
+        return Handler
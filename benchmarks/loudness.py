@@ -0,0 +1,160 @@
+"""
+Prueba de la normalización de volumen y el recorte de silencios
+----------------------------------------------------
+1. Genera con ffmpeg pistas a niveles muy distintos, con silencio al
+   principio y al final, las convierte con Normalizer y comprueba con el
+   filtro ebur128 de ffmpeg (una medida independiente) que la salida queda
+   a --target LUFS (±1 LU) y que dura lo que el audio sin silencios.
+2. Mide la memoria del análisis con un PCM corto y otro largo (--long-minutes)
+   en procesos aparte: el pico de memoria no debe crecer con la duración.
+
+Uso:
+    python benchmarks/loudness.py [--target -14] [--long-minutes 60]
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ytmp3.ffmpeg import FFmpegProcess, find_ffmpeg  # noqa: E402
+from ytmp3.loudness import PCM_OUTPUT_ARGS, Normalizer, measure_pcm  # noqa: E402
+from ytmp3.transcoders import FFmpegTranscoder  # noqa: E402
+
+# Nombre -> (amplitud, segundos de silencio antes, segundos de audio, segundos de silencio después, canales)
+TRACKS = {
+    "muy_bajo": (0.01, 3.0, 20.0, 2.0, 2),
+    "bajo": (0.05, 0.0, 20.0, 5.0, 2),
+    "normal": (0.2, 1.5, 20.0, 0.0, 2),
+    "alto": (0.9, 4.0, 20.0, 4.0, 2),
+    # Una fuente mono no debe quedar 3 dB más baja que las estéreo
+    "mono": (0.2, 1.0, 20.0, 1.0, 1),
+}
+
+
+def ffmpeg(args):
+    process = FFmpegProcess(args)
+    if process.wait() != 0:
+        raise SystemExit(process.error_output)
+
+
+def generate_track(path, amplitude, before, seconds, after, channels):
+    # Tono con algo de modulación en el canal izquierdo y otro tono más agudo en el derecho
+    expression = f"if(between(t,{before},{before + seconds}),{amplitude}*sin(2*PI*440*t)*(0.8+0.2*sin(2*PI*2*t)),0)"
+    if channels == 2:
+        expression += f"|if(between(t,{before},{before + seconds}),{amplitude / 2}*sin(2*PI*2500*t),0)"
+    ffmpeg(["-f", "lavfi", "-i", f"aevalsrc='{expression}':s=44100:d={before + seconds + after}",
+            "-c:a", "aac", "-b:a", "160k", path])
+
+
+def reference_loudness(path):
+    """Sonoridad integrada según el filtro ebur128 de ffmpeg"""
+    result = subprocess.run(
+        [find_ffmpeg(), "-hide_banner", "-nostats", "-i", path, "-af", "ebur128", "-f", "null", "-"],
+        capture_output=True, text=True,
+    )
+    return float(re.findall(r"I:\s+(-?[\d.]+) LUFS", result.stderr)[-1])
+
+
+def media_duration(path):
+    result = subprocess.run([find_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    hours, minutes, seconds = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def check_tracks(directory, target):
+    transcoder = FFmpegTranscoder(normalize=Normalizer(target=target, trim_silence=True))
+    ok = True
+    print(f"{'pista':<10} {'antes':>8} {'después':>8} {'duración':>9} {'esperada':>9} {'tiempo':>7}")
+    for name, (amplitude, before, seconds, after, channels) in TRACKS.items():
+        source = os.path.join(directory, f"{name}.m4a")
+        output = os.path.join(directory, f"{name}.mp3")
+        generate_track(source, amplitude, before, seconds, after, channels)
+        start = time.perf_counter()
+        transcoder.transcode(source, output, "mp4a.40.2", duration=before + seconds + after)
+        elapsed = time.perf_counter() - start
+
+        loudness = reference_loudness(output)
+        duration = media_duration(output)
+        # El MP3 añade unas decenas de ms de relleno del codificador
+        passed = abs(loudness - target) <= 1.0 and abs(duration - seconds) <= 0.15
+        ok = ok and passed
+        print(f"{name:<10} {reference_loudness(source):>8.1f} {loudness:>8.1f} {duration:>8.2f}s "
+              f"{seconds:>8.2f}s {elapsed:>6.2f}s {'OK' if passed else 'FALLO'}")
+    return ok
+
+
+def measure_child(pcm_file):
+    """Se ejecuta en un proceso aparte: mide el PCM e informa de la memoria usada"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    info = measure_pcm(pcm_file)
+    elapsed = time.perf_counter() - start
+    result = {"elapsed": elapsed, "traced_mb": tracemalloc.get_traced_memory()[1] / 1024 / 1024,
+              "loudness": info.loudness}
+    try:
+        import resource
+        # ru_maxrss está en KB en Linux
+        result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        pass
+    print(json.dumps(result))
+
+
+def measure_in_child(pcm_file):
+    output = subprocess.run([sys.executable, __file__, "--child", pcm_file], capture_output=True, text=True)
+    if output.returncode != 0:
+        raise SystemExit(output.stderr)
+    return json.loads(output.stdout)
+
+
+def check_memory(directory, long_minutes):
+    results = {}
+    for minutes in (1, long_minutes):
+        pcm_file = os.path.join(directory, f"{minutes}min.pcm")
+        ffmpeg(["-f", "lavfi", "-i", f"anoisesrc=c=pink:a=0.1:d={minutes * 60}",
+                "-ac", "2"] + PCM_OUTPUT_ARGS + [pcm_file])
+        results[minutes] = measure_in_child(pcm_file)
+        os.remove(pcm_file)
+
+    for minutes, result in results.items():
+        rss = f", RSS máximo {result['max_rss_mb']:.0f} MB" if "max_rss_mb" in result else ""
+        speed = minutes * 60 / result["elapsed"]
+        print(f"{minutes:>4} min: {result['elapsed']:6.2f} s ({speed:.0f}x tiempo real), "
+              f"pico de NumPy {result['traced_mb']:.0f} MB{rss}")
+
+    short, long = results[1], results[long_minutes]
+    # Se permite algo de margen por el tamaño de la lista de subbloques (8 bytes por 100 ms)
+    ok = long["traced_mb"] <= short["traced_mb"] * 1.2 + 5
+    if "max_rss_mb" in long:
+        ok = ok and long["max_rss_mb"] <= short["max_rss_mb"] * 1.2 + 20
+    print(f"{'OK' if ok else 'FALLO'} memoria constante con la duración")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", type=float, default=-14.0, help="sonoridad deseada en LUFS")
+    parser.add_argument("--long-minutes", type=int, default=60, help="duración del PCM largo")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        measure_child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = [check_tracks(directory, args.target), check_memory(directory, args.long_minutes)]
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
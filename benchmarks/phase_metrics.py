@@ -0,0 +1,90 @@
+"""
+Desglose por fases de un lote
+----------------------------------------------------
+Descarga y convierte un lote de videos falsos servidos por el servidor local
+(local_server.py) con las métricas activadas y muestra dónde se va el
+tiempo: cuántas veces se ejecutó cada fase, el total, la media y el p95.
+Los spans se guardan también en JSON por líneas (--json) y al final se lee
+el endpoint de Prometheus para comprobar que responde.
+
+Uso:
+    python benchmarks/phase_metrics.py [--videos 8] [--seconds 20] [--json spans.jsonl]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.metrics import JSONLinesSpanSink, MetricsCollector, MetricsServer  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=8)
+    parser.add_argument("--seconds", type=int, default=20, help="duración de cada audio")
+    parser.add_argument("--workers", type=int, default=4, help="descargas simultáneas")
+    parser.add_argument("--json", help="guardar los spans en este archivo")
+    args = parser.parse_args()
+
+    spans = []
+    collector = MetricsCollector([lambda job, span: spans.append(span)])
+    json_file = open(args.json, "w", encoding="utf-8") if args.json else None
+    if json_file is not None:
+        collector.add_sink(JSONLinesSpanSink(json_file))
+    server = MetricsServer(collector, port=0).start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data = generate_sample(os.path.join(directory, "sample.m4a"), args.seconds)
+        output_dir = os.path.join(directory, "out")
+        os.makedirs(output_dir)
+        with FixtureServer({"sample.m4a": data}) as fixture:
+            engine = Engine(on_event=collector, download_workers=args.workers)
+            start = time.perf_counter()
+            with engine:
+                jobs = []
+                for index in range(args.videos):
+                    stream = StreamInfo(140, "128kbps", "audio/mp4", len(data), url=fixture.url("sample.m4a"),
+                                        codec="mp4a.40.2")
+                    info = VideoInfo(f"video{index:06d}", stream.url, f"Video {index}", [stream],
+                                     duration=args.seconds)
+                    jobs.append(engine.submit(Job(info.url, output_dir, info=info, stream=stream)))
+                engine.wait(jobs)
+            elapsed = time.perf_counter() - start
+
+    with urllib.request.urlopen(f"http://{server.host}:{server.port}/metrics") as response:
+        exposition = response.read().decode("utf-8")
+    server.close()
+    if json_file is not None:
+        json_file.close()
+
+    print(f"{args.videos} videos en {elapsed:.2f} s con {args.workers} descargas simultáneas")
+    print(f"{'fase':<16} {'veces':>6} {'total':>9} {'media':>9} {'p95':>9} {'MB':>8}")
+    phases = {}
+    for span in spans:
+        phases.setdefault(span.phase, []).append(span)
+    for phase, items in sorted(phases.items(), key=lambda item: -sum(span.duration for span in item[1])):
+        durations = sorted(span.duration for span in items)
+        p95 = durations[min(len(durations) - 1, int(len(durations) * 0.95))]
+        size = sum(span.bytes or 0 for span in items) / 1024 / 1024
+        print(f"{phase:<16} {len(items):>6} {sum(durations):>8.3f}s {statistics.mean(durations):>8.3f}s "
+              f"{p95:>8.3f}s {size:>8.1f}")
+
+    samples = [line for line in exposition.splitlines() if line and not line.startswith("#")]
+    print(f"Prometheus: {len(samples)} series en /metrics")
+    assert f'ytmp3_jobs_total{{result="done"}} {args.videos}' in exposition, "faltan trabajos en /metrics"
+
+
+if __name__ == "__main__":
+    main()
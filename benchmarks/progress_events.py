@@ -0,0 +1,150 @@
+"""
+Benchmark del progreso agrupado
+----------------------------------------------------
+Descarga varios archivos del servidor local con el motor, informando del
+progreso por cada bloque de 64 KB como en el modo --stream y en las
+descargas de pytubefix, y cuenta cuántas llamadas llegan al hilo de la
+interfaz y cuánto tiempo ocupan por MB descargado, comparando:
+  - antes: un root.after() por cada evento de progreso, como hacían las
+    interfaces,
+  - después: ProgressAggregator + TkSink.
+
+En lugar de Tk (que necesita pantalla) se usa una raíz falsa con la misma
+semántica de after(): una cola que atiende un único hilo "de interfaz".
+
+Uso:
+    python benchmarks/progress_events.py [--jobs 4] [--size-mb 32]
+"""
+
+import argparse
+import os
+import queue
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import CopyTranscoder  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.downloader import SegmentedDownloader  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.progress import ProgressAggregator, TkSink, format_eta, format_speed  # noqa: E402
+from ytmp3.streaming import CHUNK_SIZE  # noqa: E402
+
+
+class FakeRoot:
+    """Sustituto de tk.Tk: after() encola y un hilo ejecuta las llamadas en orden"""
+
+    def __init__(self):
+        self.calls = 0
+        self.busy = 0.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._mainloop, daemon=True)
+        self._thread.start()
+
+    def after(self, ms, callback, *args):
+        self._queue.put((callback, args))
+
+    def _mainloop(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            callback, args = item
+            start = time.perf_counter()
+            callback(*args)
+            self.busy += time.perf_counter() - start
+            self.calls += 1
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+
+
+class StatusLabel:
+    """Hace el mismo trabajo que las interfaces al actualizar la barra y el texto"""
+
+    def __init__(self):
+        self.progress = 0.0
+        self.text = ""
+
+    def set_event(self, percentage):
+        self.progress = percentage
+        self.text = f"Descargando: {percentage:.1f}%"
+
+    def set_snapshot(self, snapshot):
+        for job in snapshot.jobs:
+            self.progress = job.progress
+            self.text = f"Descargando: {job.progress:.1f}% - {format_speed(job.speed)}, quedan {format_eta(job.eta)}"
+
+
+def run(server, names, directory, on_event):
+    engine = Engine(
+        on_event=on_event,
+        transcoder=CopyTranscoder(),
+        downloader=SegmentedDownloader(connections=4, segment_size=1024 * 1024, save_interval=CHUNK_SIZE),
+    )
+    with engine:
+        jobs = []
+        for index, name in enumerate(names):
+            size = len(server.files[name])
+            stream = StreamInfo(251, "160kbps", "audio/webm", size, url=server.url(name), codec="opus")
+            info = VideoInfo(f"video{index:06d}", server.url(name), f"Video {index}", [stream])
+            jobs.append(engine.submit(Job(info.url, directory, info=info, stream=stream)))
+        engine.wait(jobs)
+    return jobs
+
+
+def measure(label, server, names, total_mb, make_handler):
+    root = FakeRoot()
+    status = StatusLabel()
+    events = [0]
+    handler = make_handler(root, status)
+
+    def on_event(event):
+        events[0] += 1
+        handler(event)
+
+    with tempfile.TemporaryDirectory() as directory:
+        start = time.perf_counter()
+        jobs = run(server, names, directory, on_event)
+        elapsed = time.perf_counter() - start
+    root.close()
+    assert all(job.error is None for job in jobs), [job.error for job in jobs]
+    print(f"{label:<10} {events[0]:>8} {root.calls:>13} {root.calls / total_mb:>10.1f} "
+          f"{root.busy * 1000 / total_mb:>12.3f} {elapsed:>8.2f}")
+
+
+def per_event(root, status):
+    def handler(event):
+        if event.kind == "progress":
+            root.after(0, status.set_event, event.value)
+    return handler
+
+
+def aggregated(root, status):
+    return ProgressAggregator([TkSink(root, status.set_snapshot)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--size-mb", type=int, default=32, help="tamaño de cada archivo")
+    args = parser.parse_args()
+
+    files = {f"track{index}.webm": os.urandom(args.size_mb * 1024 * 1024) for index in range(args.jobs)}
+    total_mb = args.jobs * args.size_mb
+    with FixtureServer(files) as server:
+        print(f"{'variante':<10} {'eventos':>8} {'llamadas UI':>13} {'llam./MB':>10} "
+              f"{'ms UI/MB':>12} {'tiempo':>8}")
+        measure("antes", server, list(files), total_mb, per_event)
+        measure("después", server, list(files), total_mb, aggregated)
+
+
+if __name__ == "__main__":
+    main()
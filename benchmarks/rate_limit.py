@@ -0,0 +1,176 @@
+"""
+Prueba de los límites de ancho de banda y de peticiones
+----------------------------------------------------
+Contra el servidor local (local_server.py), sin límite propio, mide la
+velocidad conseguida frente a la configurada:
+  1. límite global del motor repartido entre varias descargas,
+  2. límite por trabajo con varias descargas a la vez,
+  3. cambio del límite global a mitad de una descarga,
+  4. peticiones por segundo a un mismo host desde varios hilos.
+
+Las velocidades descuentan la ráfaga inicial (un segundo de límite) con la
+que empieza cada cubo.
+
+Uso:
+    python benchmarks/rate_limit.py [--limit-kb 2048] [--jobs 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import CopyTranscoder  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3 import net  # noqa: E402
+from ytmp3.downloader import SegmentedDownloader  # noqa: E402
+from ytmp3.engine import Engine, Job, JobState  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.ratelimit import RateLimiter  # noqa: E402
+
+TOLERANCE = 0.15
+
+
+
+def check(achieved, expected, message):
+    ok = abs(achieved - expected) <= TOLERANCE * expected
+    print(f"{'OK    ' if ok else 'FALLO '}{message}: {achieved / 1024:.0f} KB/s "
+          f"(configurado {expected / 1024:.0f} KB/s)")
+    return ok
+
+
+def make_jobs(server, files, directory):
+    jobs = []
+    for index, (name, data) in enumerate(files.items()):
+        stream = StreamInfo(251, "160kbps", "audio/webm", len(data), url=server.url(name), codec="opus")
+        info = VideoInfo(f"video{index:06d}", server.url(name), f"Video {index}", [stream])
+        jobs.append(Job(info.url, directory, info=info, stream=stream))
+    return jobs
+
+
+def new_engine(**options):
+    return Engine(
+        transcoder=CopyTranscoder(),
+        # Progreso cada 64 KB para poder medir la velocidad a lo largo de la descarga
+        downloader=SegmentedDownloader(connections=2, segment_size=512 * 1024, save_interval=64 * 1024),
+        **options,
+    )
+
+
+def global_limit(server, files, limit):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = new_engine(rate_limit=RateLimiter(bandwidth=limit), download_workers=len(files))
+        start = time.perf_counter()
+        with engine:
+            engine.wait(engine.submit_many(make_jobs(server, files, directory)))
+        elapsed = time.perf_counter() - start
+    total = sum(len(data) for data in files.values())
+    return check((total - limit) / elapsed, limit, f"global, {len(files)} descargas")
+
+
+def job_limit(server, files, limit):
+    started = {}
+    finished = {}
+
+    def on_event(event):
+        if event.kind == "state" and event.value == JobState.DOWNLOADING:
+            started[event.job.id] = time.perf_counter()
+        elif event.kind == "done":
+            finished[event.job.id] = time.perf_counter()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = new_engine(job_bandwidth=limit, download_workers=len(files), on_event=on_event)
+        with engine:
+            jobs = engine.wait(engine.submit_many(make_jobs(server, files, directory)))
+    rates = [(job.total_bytes - limit) / (finished[job.id] - started[job.id]) for job in jobs]
+    return check(sum(rates) / len(rates), limit, f"por trabajo, {len(files)} descargas a la vez (media)")
+
+
+def live_change(server, data, before, after, switch_at):
+    samples = []
+    with tempfile.TemporaryDirectory() as directory:
+        limiter = RateLimiter(bandwidth=before)
+        engine = new_engine(rate_limit=limiter, download_workers=1)
+        start = time.perf_counter()
+        with engine:
+            job = engine.submit(make_jobs(server, {"big.webm": data}, directory)[0])
+            switched = False
+            while not job.wait(0.05):
+                now = time.perf_counter() - start
+                samples.append((now, job.bytes_downloaded))
+                if not switched and now >= switch_at:
+                    limiter.set_bandwidth(after)
+                    switched = True
+
+    def rate_between(begin, end):
+        window = [(t, size) for t, size in samples if begin <= t <= end]
+        return (window[-1][1] - window[0][1]) / (window[-1][0] - window[0][0])
+
+    # Se dejan fuera la ráfaga inicial y medio segundo tras el cambio
+    ok = check(rate_between(1.0, switch_at), before, "antes del cambio")
+    return check(rate_between(switch_at + 0.5, samples[-1][0]), after, "después del cambio") and ok
+
+
+def request_rate(server, rate, requests, threads):
+    net.default_pool.set_request_rate(rate)
+    counter = iter(range(requests))
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            with lock:
+                if next(counter, None) is None:
+                    return
+            with net.urlopen(server.url("small.bin")) as response:
+                response.read()
+
+    try:
+        start = time.perf_counter()
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        net.default_pool.set_request_rate(None)
+    achieved = (requests - 1) / elapsed
+    ok = abs(achieved - rate) <= TOLERANCE * rate
+    print(f"{'OK    ' if ok else 'FALLO '}peticiones a un host desde {threads} hilos: {achieved:.1f}/s "
+          f"(configurado {rate:.0f}/s)")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--limit-kb", type=int, default=2048, help="límite global en KB/s")
+    parser.add_argument("--jobs", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=4, help="duración aproximada de cada prueba")
+    args = parser.parse_args()
+
+    limit = args.limit_kb * 1024
+    per_file = int(limit * (args.seconds + 1) / args.jobs)
+    files = {f"track{index}.webm": os.urandom(per_file) for index in range(args.jobs)}
+    # Medio límite durante 3 s y luego el doble durante unos 3 s más
+    big = os.urandom(int(limit * 8))
+    files["big.webm"] = big
+    files["small.bin"] = b"x" * 1024
+
+    results = []
+    with FixtureServer(files) as server:
+        tracks = {name: data for name, data in files.items() if name.startswith("track")}
+        results.append(global_limit(server, tracks, limit))
+        results.append(job_limit(server, tracks, limit / args.jobs))
+        results.append(live_change(server, big, limit / 2, limit * 2, switch_at=3.0))
+        results.append(request_rate(server, 20, 60, threads=4))
+    if not all(results):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
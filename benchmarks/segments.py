@@ -0,0 +1,131 @@
+"""
+Fragmentos y capítulos
+----------------------------------------------------
+Sirve con local_server.py un audio largo en los contenedores que usa YouTube
+(MP4 fragmentado con sidx y WebM con Cues) y otro sin índice, y para cada uno:
+  1. convierte el audio entero, como referencia;
+  2. convierte un fragmento de --clip-seconds del medio (--clip);
+  3. lo parte en --chapters capítulos (--chapters), en una sola pasada.
+Muestra el tiempo y los bytes servidos, y comprueba que cada archivo dura lo
+que su tramo. Con el índice, el fragmento solo descarga una parte del archivo;
+sin él, se descarga entero y el resultado debe ser el mismo.
+
+Uso:
+    python benchmarks/segments.py [--minutes 20] [--clip-seconds 60] [--chapters 6]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.ffmpeg import find_ffmpeg  # noqa: E402
+from ytmp3.models import Segment, StreamInfo, VideoInfo  # noqa: E402
+
+# Nombre -> (itag, mime_type, códec, opciones de ffmpeg)
+CONTAINERS = {
+    "dash.m4a": (140, "audio/mp4", "mp4a.40.2", [
+        "-c:a", "aac", "-b:a", "128k", "-f", "mp4",
+        "-movflags", "+dash+global_sidx+skip_trailer", "-frag_duration", "10000000",
+    ]),
+    "indexed.webm": (251, "audio/webm", "opus", [
+        "-c:a", "libopus", "-b:a", "128k", "-f", "webm",
+        "-cluster_time_limit", "5000", "-reserve_index_space", "32768",
+    ]),
+    "plain.m4a": (140, "audio/mp4", "mp4a.40.2", ["-c:a", "aac", "-b:a", "128k", "-movflags", "+faststart"]),
+}
+
+# Un tono que cambia de frecuencia cada pocos segundos, para que no sea trivial de comprimir
+TONE = "aevalsrc='0.3*sin(2*PI*(300+100*mod(floor(t/7),8))*t)':s=48000:d={seconds}"
+
+# Margen en segundos: el MP3 añade unas decenas de ms de relleno del codificador
+TOLERANCE = 0.15
+
+
+
+def media_duration(path):
+    result = subprocess.run([find_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    hours, minutes, seconds = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def run_job(server, name, data, info, output_dir, **options):
+    """Convierte el video; devuelve (segundos, bytes servidos, trabajo)"""
+    itag, mime_type, codec, _ = CONTAINERS[name]
+    stream = StreamInfo(itag, "128kbps", mime_type, len(data), url=server.url(name), codec=codec)
+    sent = server.bytes_sent
+    start = time.perf_counter()
+    with Engine() as engine:
+        job = engine.submit(Job(info.url, output_dir, info=info, stream=stream, **options))
+        engine.wait([job])
+    if job.error is not None:
+        raise SystemExit(f"Falló {name}: {job.error}")
+    return time.perf_counter() - start, server.bytes_sent - sent, job
+
+
+def check_durations(job, segments):
+    ok = True
+    for path, segment in zip(job.output_files, segments):
+        duration = media_duration(path)
+        passed = abs(duration - (segment.end - segment.start)) <= TOLERANCE
+        ok = ok and passed
+        if not passed:
+            print(f"    FALLO {os.path.basename(path)}: {duration:.2f} s en lugar de {segment.end - segment.start:.2f} s")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--minutes", type=int, default=20, help="duración del audio")
+    parser.add_argument("--clip-seconds", type=float, default=60.0, help="duración del fragmento")
+    parser.add_argument("--chapters", type=int, default=6, help="capítulos en que se parte el audio")
+    args = parser.parse_args()
+
+    seconds = args.minutes * 60
+    clip_start = seconds / 2
+    clip = Segment(None, clip_start, clip_start + args.clip_seconds)
+    length = seconds / args.chapters
+    chapters = [Segment(f"Parte {index + 1}", index * length, (index + 1) * length) for index in range(args.chapters)]
+
+    ok = True
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = {}
+        for name, (_, _, _, options) in CONTAINERS.items():
+            fixtures[name] = generate_sample(os.path.join(directory, name), seconds, ["-ac", "2"] + options,
+                                             source=TONE.format(seconds=seconds))
+
+        print(f"Audio de {args.minutes} min; fragmento de {args.clip_seconds:g} s; {args.chapters} capítulos")
+        print(f"{'contenedor':<14} {'prueba':<10} {'tiempo':>8} {'MB servidos':>12} {'del total':>10} {'archivos':>9}")
+        with FixtureServer(fixtures) as server:
+            for name, data in fixtures.items():
+                info = VideoInfo(f"{name}-video", f"https://example.com/{name}", "Mezcla", [], duration=seconds,
+                                 chapters=chapters)
+                runs = (
+                    ("entero", {}, [Segment(None, 0.0, seconds)]),
+                    ("fragmento", {"segments": [clip]}, [clip]),
+                    ("capítulos", {"chapters": True}, chapters),
+                )
+                for test, options, segments in runs:
+                    output_dir = os.path.join(directory, f"{name}-{test}")
+                    os.makedirs(output_dir)
+                    elapsed, sent, job = run_job(server, name, data, info, output_dir, **options)
+                    passed = len(job.output_files) == len(segments) and check_durations(job, segments)
+                    ok = ok and passed
+                    print(f"{name:<14} {test:<10} {elapsed:>7.2f}s {sent / 1024 / 1024:>12.2f} "
+                          f"{sent / len(data):>9.0%} {len(job.output_files):>9} {'OK' if passed else 'FALLO'}")
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
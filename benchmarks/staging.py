@@ -0,0 +1,245 @@
+"""
+Publicación atómica y recuperación tras un corte
+----------------------------------------------------
+Convierte videos falsos (servidos por local_server.py) y comprueba que la
+carpeta de destino nunca tiene un archivo a medias:
+  1. muchos trabajos a la vez cuyos títulos dan el mismo nombre de archivo
+     (cada video acaba en su archivo, con la duración de su audio);
+  2. un proceso que se mata durante la conversión: no queda nada en el
+     destino y la siguiente sesión borra los restos;
+  3. un proceso que muere después de publicar el primero de dos formatos: la
+     siguiente sesión publica el segundo;
+  4. un proceso que se mata a mitad de la descarga: la siguiente ejecución la
+     reanuda en lugar de empezar de cero.
+
+Uso:
+    python benchmarks/staging.py [--videos 16] [--seconds 300]
+"""
+
+import argparse
+import json
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from local_server import FixtureServer  # noqa: E402
+from ytmp3 import staging  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.ffmpeg import find_ffmpeg  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.staging import StagingArea  # noqa: E402
+from ytmp3.transcoders import FanOutTranscoder, parse_outputs  # noqa: E402
+
+OUTPUTS = "mp3,opus"
+# Margen en segundos: el MP3 añade unas decenas de ms de relleno del codificador
+TOLERANCE = 0.15
+
+
+
+def media_duration(path):
+    result = subprocess.run([find_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True)
+    hours, minutes, seconds = re.search(r"Duration: (\d+):(\d+):([\d.]+)", result.stderr).groups()
+    return int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+
+
+def video_info(video_id, title, url, size):
+    stream = StreamInfo(140, "160kbps", "audio/mp4", size, url=url, codec="mp4a.40.2")
+    return VideoInfo(video_id, url, title, [stream])
+
+
+def convert(infos, output_dir, staging_dir, outputs=OUTPUTS):
+    with Engine(transcoder=FanOutTranscoder(parse_outputs(outputs)), download_workers=len(infos),
+                staging=StagingArea(staging_dir), tagging=False) as engine:
+        jobs = [engine.submit(Job(info.url, output_dir, info=info, stream=info.streams[0])) for info in infos]
+        engine.wait(jobs)
+    for job in jobs:
+        if job.error is not None:
+            raise SystemExit(f"Falló {job.title}: {job.error}")
+    return jobs
+
+
+def child(args):
+    """Proceso que el benchmark mata: convierte un video y, con --crash-after-first, muere al publicar"""
+    if args.crash_after_first:
+        move_file = staging.move_file
+
+        def move_and_die(staged_file, output_file):
+            move_file(staged_file, output_file)
+            os._exit(9)
+
+        staging.move_file = move_and_die
+    info = video_info("crashvideo1", "Corte", args.url, args.size)
+    convert([info], args.output_dir, args.staging_dir)
+
+
+def start_child(url, size, output_dir, staging_dir, crash_after_first=False):
+    command = [sys.executable, os.path.abspath(__file__), "--child", "--url", url, "--size", str(size),
+               "--output-dir", output_dir, "--staging-dir", staging_dir]
+    if crash_after_first:
+        command.append("--crash-after-first")
+    return subprocess.Popen(command)
+
+
+def wait_for(condition, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        if process.poll() is not None:
+            return False
+        time.sleep(0.05)
+    return False
+
+
+def kill(process):
+    process.send_signal(signal.SIGKILL)
+    process.wait()
+
+
+def session_files(staging_dir):
+    sessions = os.path.join(staging_dir, "work")
+    found = []
+    for root, _, files in os.walk(sessions):
+        found += [os.path.join(root, name) for name in files if name != "lock"]
+    return found
+
+
+def downloaded_fraction(staging_dir):
+    downloads = os.path.join(staging_dir, "downloads")
+    for name in os.listdir(downloads) if os.path.isdir(downloads) else []:
+        if name.endswith(".part.json"):
+            try:
+                with open(os.path.join(downloads, name), encoding="utf-8") as handle:
+                    state = json.load(handle)
+            except (OSError, ValueError):
+                return 0.0
+            return sum(state["done"].values()) / state["size"]
+    return 0.0
+
+
+def check(label, passed, detail):
+    print(f"  {'OK   ' if passed else 'FALLO'} {label:<34} {detail}")
+    return passed
+
+
+def test_collisions(server, sizes, directory, videos):
+    # Pares de títulos que quedan iguales al quitarles ":" y "/"; cada video del par dura distinto
+    infos = []
+    for index in range(videos):
+        name = "short.m4a" if index % 2 == 0 else "medium.m4a"
+        title = f"Canción{':' if index % 2 == 0 else '/'} {index // 2}"
+        infos.append(video_info(f"video{index:06d}", title, server.url(name), sizes[name][0]))
+    output_dir = os.path.join(directory, "collisions")
+    os.makedirs(output_dir)
+    start = time.perf_counter()
+    jobs = convert(infos, output_dir, os.path.join(directory, "staging-collisions"), outputs="mp3")
+    elapsed = time.perf_counter() - start
+
+    files = sorted(os.listdir(output_dir))
+    wrong = 0
+    for job, info in zip(jobs, infos):
+        expected = sizes[info.url.rsplit("/", 1)[1]][1]
+        if abs(media_duration(job.output_file) - expected) > TOLERANCE:
+            wrong += 1
+    ok = check("títulos que coinciden", len(files) == videos and wrong == 0,
+               f"{videos} trabajos en {elapsed:.2f} s, {len(files)} archivos, {wrong} con el audio de otro video")
+    print(f"        p. ej. {files[0]!r} y {files[1]!r}")
+    return ok
+
+
+def test_kill_during_convert(server, size, directory):
+    output_dir = os.path.join(directory, "convert")
+    staging_dir = os.path.join(directory, "staging-convert")
+    os.makedirs(output_dir)
+    process = start_child(server.url("long.m4a"), size, output_dir, staging_dir)
+    # Se mata en cuanto ffmpeg ha escrito algo de las salidas
+    started = wait_for(lambda: any(os.path.getsize(path) > 0 for path in session_files(staging_dir)
+                                   if not path.endswith(".tmp")), process)
+    kill(process)
+    left = os.listdir(output_dir)
+    leftovers = len(session_files(staging_dir))
+    recovery = StagingArea(staging_dir).open()
+    return check("muerto al convertir", started and not left and recovery.removed > 0
+                 and not session_files(staging_dir),
+                 f"destino {left}, {leftovers} restos en staging, recuperación {tuple(recovery)}")
+
+
+def test_kill_during_publish(server, size, duration, directory):
+    output_dir = os.path.join(directory, "publish")
+    staging_dir = os.path.join(directory, "staging-publish")
+    os.makedirs(output_dir)
+    process = start_child(server.url("long.m4a"), size, output_dir, staging_dir, crash_after_first=True)
+    process.wait()
+    before = sorted(os.listdir(output_dir))
+    recovery = StagingArea(staging_dir).open()
+    after = sorted(os.listdir(output_dir))
+    durations_ok = all(abs(media_duration(os.path.join(output_dir, name)) - duration) <= TOLERANCE
+                       for name in after)
+    return check("muerto al publicar", len(before) == 1 and len(after) == 2 and durations_ok
+                 and recovery.published == 1,
+                 f"destino {before} -> {after}, recuperación {tuple(recovery)}")
+
+
+def test_resume_download(server, size, directory):
+    output_dir = os.path.join(directory, "resume")
+    staging_dir = os.path.join(directory, "staging-resume")
+    os.makedirs(output_dir)
+    server.throttle = 256 * 1024
+    try:
+        process = start_child(server.url("long.m4a"), size, output_dir, staging_dir)
+        started = wait_for(lambda: downloaded_fraction(staging_dir) >= 0.3, process)
+        kill(process)
+    finally:
+        server.throttle = None
+    fraction = downloaded_fraction(staging_dir)
+    sent = server.bytes_sent
+    convert([video_info("crashvideo1", "Corte", server.url("long.m4a"), size)], output_dir, staging_dir)
+    resent = server.bytes_sent - sent
+    return check("muerto al descargar", started and resent < size * (1 - fraction) + 2 * 1024 * 1024,
+                 f"{fraction:.0%} descargado antes del corte, {resent / size:.0%} del archivo al reanudar")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=16, help="trabajos con títulos que coinciden")
+    parser.add_argument("--seconds", type=int, default=300, help="duración del audio de las pruebas de corte")
+    # Opciones del proceso hijo
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--crash-after-first", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--output-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--staging-dir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        fixtures = {}
+        sizes = {}
+        for name, seconds in (("short.m4a", 20), ("medium.m4a", 30), ("long.m4a", args.seconds)):
+            fixtures[name] = generate_sample(os.path.join(directory, name), seconds)
+            sizes[name] = (len(fixtures[name]), seconds)
+        long = fixtures["long.m4a"]
+        print(f"{args.videos} trabajos de 20 y 30 s a mp3; cortes con un audio de {args.seconds} s a {OUTPUTS}")
+        with FixtureServer(fixtures) as server:
+            ok = test_collisions(server, sizes, directory, args.videos)
+            ok = test_kill_during_convert(server, len(long), directory) and ok
+            ok = test_kill_during_publish(server, len(long), args.seconds, directory) and ok
+            ok = test_resume_download(server, len(long), directory) and ok
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
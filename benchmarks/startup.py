@@ -0,0 +1,164 @@
+"""
+Tiempo de arranque de las interfaces y la línea de comandos
+----------------------------------------------------
+Para cada punto de entrada lanza varias veces un intérprete nuevo con
+python -X importtime y mide:
+  - el tiempo de importación del módulo (suma de -X importtime),
+  - el tiempo hasta la primera ventana pintada (solo las interfaces y solo
+    si hay pantalla), desde que se lanza el proceso.
+
+Cada ejecución se añade a un historial (una línea JSON con la fecha y el
+commit) y se compara con la anterior, para ver cuándo empeora el arranque.
+Termina con error si algún punto de entrada supera --target-ms.
+
+Uso:
+    python benchmarks/startup.py [--runs 5] [--target-ms 300] [--top 5]
+"""
+
+import argparse
+import datetime
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_HISTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), "startup_history.jsonl")
+
+# Nombre -> (módulo que se importa, clase de la ventana o None)
+ENTRY_POINTS = {
+    "gui": ("youtube_downloader", "YouTubeMP3Downloader"),
+    "gui_v2": ("youtube_downloader_v2", "YouTubeMP3Downloader"),
+    "cli": ("ytmp3.cli", None),
+}
+
+# Se ejecuta en el proceso hijo: pinta la ventana, avisa y termina
+WINDOW_SCRIPT = """
+import sys, tkinter
+try:
+    root = tkinter.Tk()
+except tkinter.TclError:
+    sys.exit(3)
+import {module} as app
+window = app.{window}(root)
+root.update()
+print("ready", flush=True)
+root.destroy()
+"""
+
+
+def import_times(module, top):
+    """Devuelve (ms de importación del módulo, [(ms, módulo)] de los más lentos)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise SystemExit(f"No se pudo importar {module}:\n{result.stderr[-2000:]}")
+
+    total = None
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((int(self_us) / 1000, name.strip()))
+        if name.strip() == module:
+            total = int(cumulative_us) / 1000
+    modules.sort(reverse=True)
+    return total, modules[:top]
+
+
+def time_to_window(module, window):
+    """ms desde que se lanza el proceso hasta que la ventana está pintada (None sin pantalla)"""
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", WINDOW_SCRIPT.format(module=module, window=window)],
+        cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True,
+    )
+    line = process.stdout.readline()
+    elapsed = (time.perf_counter() - start) * 1000
+    process.wait()
+    return elapsed if line.strip() == "ready" else None
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def last_entry(path):
+    try:
+        with open(path, encoding="utf-8") as handle:
+            lines = [line for line in handle if line.strip()]
+    except OSError:
+        return None
+    return json.loads(lines[-1]) if lines else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--target-ms", type=float, default=300, help="máximo hasta la primera ventana")
+    parser.add_argument("--top", type=int, default=5, help="módulos más lentos que se muestran")
+    parser.add_argument("--history", default=DEFAULT_HISTORY, help="archivo del historial")
+    parser.add_argument("--no-history", action="store_true", help="no añadir esta ejecución al historial")
+    args = parser.parse_args()
+
+    previous = last_entry(args.history)
+    results = {}
+    failed = []
+    for name, (module, window) in ENTRY_POINTS.items():
+        imports = []
+        slowest = []
+        for _ in range(args.runs):
+            total, slowest = import_times(module, args.top)
+            imports.append(total)
+        windows = []
+        if window is not None:
+            windows = [time_to_window(module, window) for _ in range(args.runs)]
+            windows = [value for value in windows if value is not None]
+
+        result = {"import_ms": round(statistics.median(imports), 1)}
+        if windows:
+            result["window_ms"] = round(statistics.median(windows), 1)
+        results[name] = result
+
+        line = f"{name:<8} importación {result['import_ms']:7.1f} ms"
+        if "window_ms" in result:
+            line += f"   primera ventana {result['window_ms']:7.1f} ms"
+        elif window is not None:
+            line += "   primera ventana: sin pantalla"
+        if previous and name in previous.get("results", {}):
+            line += f"   (antes {previous['results'][name]['import_ms']:.1f} ms de importación)"
+        print(line)
+        print("         más lentos: " + ", ".join(f"{module_name} {ms:.1f}" for ms, module_name in slowest))
+
+        # Sin pantalla se compara la importación, que es la parte que depende del código
+        measured = result.get("window_ms", result["import_ms"])
+        if measured > args.target_ms:
+            failed.append(name)
+
+    if not args.no_history:
+        entry = {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "results": results,
+        }
+        with open(args.history, "a", encoding="utf-8") as handle:
+            handle.write(json.dumps(entry) + "\n")
+
+    if failed:
+        print(f"Por encima del objetivo de {args.target_ms:.0f} ms: {', '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+"""
+Etiquetas y portada en la misma pasada
+----------------------------------------------------
+Convierte un lote de videos falsos (servidos por local_server.py, con su
+miniatura en otro servidor) a MP3, M4A y Opus de dos maneras:
+  1. sin etiquetas, y luego otro proceso de ffmpeg por archivo que copia el
+     audio añadiendo etiquetas y portada, como hacía el script aparte;
+  2. con el Engine etiquetando al codificar, sin volver a leer los archivos.
+Compara el tiempo y los bytes leídos y escritos de más en el primer caso,
+comprueba con ffmpeg las etiquetas y la portada de cada formato, y que al
+repetir el lote la miniatura de cada video se descarga una sola vez.
+
+Uso:
+    python benchmarks/tagging.py [--videos 4] [--seconds 120]
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from local_server import FixtureServer  # noqa: E402
+from ytmp3.cache import ThumbnailCache  # noqa: E402
+from ytmp3.engine import Engine, Job  # noqa: E402
+from ytmp3.ffmpeg import FFmpegProcess, find_ffmpeg  # noqa: E402
+from ytmp3.models import StreamInfo, VideoInfo  # noqa: E402
+from ytmp3.tagging import embeds_picture, metadata_args, tags_for  # noqa: E402
+from ytmp3.transcoders import FanOutTranscoder, parse_outputs  # noqa: E402
+
+OUTPUTS = "mp3,m4a,opus"
+
+
+def ffmpeg(args):
+    process = FFmpegProcess(args)
+    if process.wait() != 0:
+        raise SystemExit(process.error_output)
+
+
+def generate_fixtures(directory, seconds):
+    audio = os.path.join(directory, "sample.m4a")
+    thumbnail = os.path.join(directory, "maxresdefault.jpg")
+    ffmpeg(["-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}", "-ac", "2",
+            "-c:a", "aac", "-b:a", "160k", audio])
+    ffmpeg(["-f", "lavfi", "-i", "testsrc=size=1280x720:duration=1", "-frames:v", "1", thumbnail])
+    with open(audio, "rb") as handle, open(thumbnail, "rb") as thumbnail_handle:
+        return handle.read(), thumbnail_handle.read()
+
+
+def video_infos(server, thumbnails, data, videos):
+    infos = []
+    for index in range(videos):
+        stream = StreamInfo(140, "160kbps", "audio/mp4", len(data), url=server.url("sample.m4a"), codec="mp4a.40.2")
+        infos.append(VideoInfo(
+            f"video{index:06d}", stream.url, f"Canción {index}", [stream], author="Canal de prueba",
+            publish_date="2024-05-01", thumbnail_url=thumbnails.url("maxresdefault.jpg"),
+        ))
+    return infos
+
+
+def run_batch(infos, output_dir, **options):
+    with Engine(transcoder=FanOutTranscoder(parse_outputs(OUTPUTS)), download_workers=len(infos),
+                **options) as engine:
+        jobs = [engine.submit(Job(info.url, output_dir, info=info, stream=info.streams[0])) for info in infos]
+        engine.wait(jobs)
+    for job in jobs:
+        if job.error is not None:
+            raise SystemExit(f"Falló {job.title}: {job.error}")
+    return jobs
+
+
+def retag(jobs, cache):
+    """El paso aparte: otra pasada de ffmpeg por archivo; devuelve los bytes leídos y escritos"""
+    moved = 0
+    for job in jobs:
+        tags = tags_for(job.info, cache.get(job.info))
+        for path in job.output_files:
+            extension = path.rsplit(".", 1)[1]
+            tagged = f"{path}.tagged.{extension}"
+            args = ["-i", path]
+            if embeds_picture(extension):
+                args += ["-i", tags.cover, "-map", "0:a", "-map", "1:v", "-c:v", "copy",
+                         "-disposition:v", "attached_pic"]
+            else:
+                args += ["-map", "0:a"]
+            ffmpeg(args + ["-c:a", "copy"] + metadata_args(tags, extension) + [tagged])
+            moved += os.path.getsize(path) + os.path.getsize(tagged)
+            os.replace(tagged, path)
+    return moved
+
+
+def probe_tags(path):
+    """Etiquetas del archivo y si tiene portada, según ffmpeg (en Ogg van en el stream de audio)"""
+    stderr = subprocess.run([find_ffmpeg(), "-hide_banner", "-i", path], capture_output=True, text=True).stderr
+    tags = {}
+    for key, value in re.findall(r"^\s+(\w+)\s*: (.*)$", stderr, re.MULTILINE):
+        tags.setdefault(key.lower(), value)
+    return tags, "(attached pic)" in stderr
+
+
+def check_tags(job):
+    ok = True
+    for path in job.output_files:
+        tags, cover = probe_tags(path)
+        passed = (tags.get("title") == job.info.title and tags.get("artist") == job.info.author
+                  and tags.get("date") == job.info.publish_date and job.info.video_id in tags.get("comment", "")
+                  and cover)
+        ok = ok and passed
+        print(f"  {'OK   ' if passed else 'FALLO'} {os.path.basename(path):<18} título={tags.get('title')!r} "
+              f"artista={tags.get('artist')!r} fecha={tags.get('date')!r} portada={'sí' if cover else 'no'}")
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", type=int, default=4)
+    parser.add_argument("--seconds", type=int, default=120, help="duración de cada audio")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        data, thumbnail = generate_fixtures(directory, args.seconds)
+        with FixtureServer({"sample.m4a": data}) as server, \
+                FixtureServer({"maxresdefault.jpg": thumbnail}) as thumbnails:
+            infos = video_infos(server, thumbnails, data, args.videos)
+            cache = ThumbnailCache(os.path.join(directory, "thumbnails"))
+
+            output_dir = os.path.join(directory, "separate")
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            jobs = run_batch(infos, output_dir, tagging=False)
+            retag_start = time.perf_counter()
+            moved = retag(jobs, cache)
+            separate = (time.perf_counter() - start, time.perf_counter() - retag_start)
+
+            output_dir = os.path.join(directory, "inline")
+            os.makedirs(output_dir)
+            start = time.perf_counter()
+            jobs = run_batch(infos, output_dir, thumbnail_cache=cache)
+            inline = time.perf_counter() - start
+
+            # Otra vez, con la caché ya llena: ninguna miniatura se vuelve a pedir
+            requests = thumbnails.requests
+            output_dir = os.path.join(directory, "again")
+            os.makedirs(output_dir)
+            run_batch(infos, output_dir, thumbnail_cache=cache)
+            repeated = thumbnails.requests - requests
+
+        print(f"{args.videos} videos de {args.seconds} s a {OUTPUTS}")
+        print(f"{'etiquetar aparte:':<24}{separate[0]:6.2f} s (la pasada extra {separate[1]:.2f} s, "
+              f"{moved / 1024 / 1024:.1f} MB leídos y escritos de más)")
+        print(f"{'etiquetar al convertir:':<24}{inline:6.2f} s")
+        print(f"{'miniaturas descargadas:':<24}{thumbnails.requests} para {args.videos} videos "
+              f"en 3 lotes ({repeated} en el último); caché {cache.stats()}")
+        print("Etiquetas del primer video:")
+        ok = check_tags(jobs[0])
+        ok = ok and thumbnails.requests == args.videos and repeated == 0
+
+    if not ok:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""
+Benchmark de la granja de conversión
+----------------------------------------------------
+Convierte a MP3 un corpus local de archivos de audio de distinta duración y
+compara el tiempo total del lote:
+  - hilos: el transcodificador en el propio proceso, como antes,
+  - granja con 1, 2, 4... procesos (hasta los núcleos disponibles),
+    atendiendo los archivos en el orden de llegada o de más largo a más corto.
+
+Para cada ejecución de la granja muestra también el uso de cada proceso.
+Con --backend moviepy se ve el efecto del GIL en la variante de hilos.
+
+Uso:
+    python benchmarks/transcode_farm.py [--files 12] [--backend ffmpeg]
+"""
+
+import argparse
+import os
+import queue
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ytmp3.engine import LongestFirstQueue  # noqa: E402
+from ytmp3.farm import TranscodeFarm, available_cpus  # noqa: E402
+from ytmp3.ffmpeg import FFmpegProcess  # noqa: E402
+from ytmp3.transcoders import get_transcoder  # noqa: E402
+
+# Duraciones del corpus en segundos: pocas largas y muchas cortas, como una lista real
+DURATIONS = (600, 60, 45, 300, 30, 90, 40, 180, 35, 120, 50, 240)
+
+
+def generate_corpus(directory, count):
+    corpus = []
+    for index in range(count):
+        duration = DURATIONS[index % len(DURATIONS)]
+        path = os.path.join(directory, f"track{index:02d}.m4a")
+        process = FFmpegProcess([
+            "-f", "lavfi", "-i", f"sine=frequency={220 + index * 20}:duration={duration}",
+            "-ac", "2", "-c:a", "aac", "-b:a", "128k", path,
+        ])
+        if process.wait() != 0:
+            raise SystemExit(process.error_output)
+        corpus.append((path, duration))
+    return corpus
+
+
+def run_batch(transcoder, corpus, workers, longest_first, directory):
+    """Convierte el corpus con workers hilos que toman archivos de la cola; devuelve los segundos"""
+    if longest_first:
+        pending = LongestFirstQueue(lambda item: item[1])
+    else:
+        pending = queue.Queue()
+    for item in corpus:
+        pending.put(item)
+    for _ in range(workers):
+        pending.put(None)
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            path, duration = item
+            output = os.path.join(directory, os.path.basename(path) + ".mp3")
+            transcoder.transcode(path, output, "mp4a", duration=duration)
+            os.remove(output)
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def worker_counts(cpus):
+    counts = [1]
+    while counts[-1] * 2 <= cpus:
+        counts.append(counts[-1] * 2)
+    if counts[-1] != cpus:
+        counts.append(cpus)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=12, help="archivos del corpus")
+    parser.add_argument("--backend", default="ffmpeg", choices=["ffmpeg", "moviepy"])
+    parser.add_argument("--seed", type=int, default=1, help="semilla del orden de llegada")
+    args = parser.parse_args()
+
+    cpus = len(available_cpus())
+    with tempfile.TemporaryDirectory() as directory:
+        print(f"Generando {args.files} archivos...", file=sys.stderr)
+        corpus = generate_corpus(directory, args.files)
+        # Orden de llegada: el de las descargas, que no tiene que ver con la duración
+        random.Random(args.seed).shuffle(corpus)
+        total_audio = sum(duration for _, duration in corpus)
+        print(f"{len(corpus)} archivos, {total_audio / 60:.0f} min de audio, {cpus} núcleos\n")
+
+        print(f"{'variante':<34} {'tiempo':>8} {'aceleración':>12}")
+        transcoder = get_transcoder(args.backend)
+        baseline = run_batch(transcoder, corpus, cpus, False, directory)
+        print(f"{f'hilos x{cpus}, orden de llegada':<34} {baseline:>7.2f}s {1.0:>11.2f}x")
+
+        stats = []
+        for workers in worker_counts(cpus):
+            for longest_first in (False, True):
+                farm = TranscodeFarm(get_transcoder(args.backend), workers=workers).start()
+                try:
+                    elapsed = run_batch(farm, corpus, workers, longest_first, directory)
+                finally:
+                    farm.close()
+                order = "más largo primero" if longest_first else "orden de llegada"
+                label = f"granja x{workers}, {order}"
+                print(f"{label:<34} {elapsed:>7.2f}s {baseline / elapsed:>11.2f}x")
+                stats.append((label, farm.stats()))
+
+        print("\nUso por proceso:")
+        for label, workers in stats:
+            print(f"  {label}")
+            for worker in workers:
+                print(f"    proceso {worker.index} (núcleo {worker.cpu}): {worker.tasks:>3} archivos, "
+                      f"{worker.busy:>6.2f} s ocupado ({worker.utilization:>4.0%}), "
+                      f"{worker.cpu_time:>6.2f} s de CPU")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Comparativa de transcodificadores
+----------------------------------------------------
+Mide el tiempo total y la memoria máxima (RSS, incluido el proceso de
+ffmpeg) de cada backend al convertir archivos de audio locales. Cada
+conversión se ejecuta en un proceso nuevo para que las medidas no se
+contaminen entre sí.
+
+Uso:
+    python benchmarks/transcoders.py muestra1.webm muestra2.m4a
+    python benchmarks/transcoders.py --generate 180   # crea muestras de 3 minutos
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from common import generate_sample  # noqa: E402
+from ytmp3.transcoders import TRANSCODERS  # noqa: E402
+
+CHILD_CODE = """
+import sys
+sys.path.insert(0, {root!r})
+from ytmp3.transcoders import get_transcoder
+get_transcoder({backend!r}, output_format={output_format!r}).transcode({source!r}, {output!r}, {codec!r})
+"""
+
+
+def generate_samples(directory, seconds):
+    """Genera muestras sintéticas en los formatos que sirve YouTube (opus/webm y aac/m4a)"""
+    samples = []
+    for name, encoder in (("sample.webm", "libopus"), ("sample.m4a", "aac")):
+        path = os.path.join(directory, name)
+        # El tono de 440 Hz con ruido de fondo, para que no sea trivial de comprimir
+        generate_sample(path, seconds, [
+            "-f", "lavfi", "-i", f"anoisesrc=duration={seconds}:amplitude=0.1",
+            "-filter_complex", "amix=inputs=2", "-ac", "2",
+            "-c:a", encoder, "-b:a", "128k",
+        ])
+        samples.append(path)
+    return samples
+
+
+def source_codec(path):
+    return "opus" if path.endswith(".webm") else "mp4a" if path.endswith(".m4a") else None
+
+
+def measure(backend, source, output_format, directory):
+    """Devuelve (segundos, RSS máximo en MB) de una conversión en un proceso aparte"""
+    output = os.path.join(directory, f"out-{backend}.{output_format}")
+    code = CHILD_CODE.format(
+        root=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        backend=backend,
+        output_format=output_format,
+        source=source,
+        output=output,
+        codec=source_codec(source),
+    )
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, "-c", code])
+    # wait4 devuelve el uso de recursos del hijo y de sus descendientes (ffmpeg)
+    _, status, usage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - start
+    if status != 0:
+        raise SystemExit(f"{backend} falló con {source}")
+    os.remove(output)
+    # En Linux ru_maxrss está en KB
+    return elapsed, usage.ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("samples", nargs="*", help="archivos de audio a convertir")
+    parser.add_argument("--generate", type=int, metavar="SEGUNDOS", help="generar muestras sintéticas")
+    parser.add_argument("--format", default="mp3", help="formato de salida (por defecto mp3)")
+    parser.add_argument("--repeat", type=int, default=3, help="repeticiones por medida (se toma la mejor)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        samples = list(args.samples)
+        if args.generate:
+            samples += generate_samples(directory, args.generate)
+        if not samples:
+            parser.error("indica muestras o usa --generate")
+
+        print(f"{'muestra':<20} {'backend':<8} {'tiempo (s)':>10} {'RSS máx (MB)':>13}")
+        for source in samples:
+            for backend in sorted(TRANSCODERS):
+                results = [measure(backend, source, args.format, directory) for _ in range(args.repeat)]
+                elapsed = min(result[0] for result in results)
+                peak_rss = max(result[1] for result in results)
+                print(f"{os.path.basename(source):<20} {backend:<8} {elapsed:>10.2f} {peak_rss:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
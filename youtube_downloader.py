@@ -6,21 +6,19 @@ Incluye un menú desplegable para seleccionar la calidad de audio.
 """
 
 import os
+import threading
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
-import re
-import urllib.request
-import urllib.error
-from pytubefix import YouTube
-from moviepy import AudioFileClip
+# El motor, pytubefix y sus dependencias se importan después de mostrar la
+# ventana (ver load_services y ytmp3/startup.py)
+from ytmp3.startup import prewarm
 
 class YouTubeMP3Downloader:
     def __init__(self, root):
         self.root = root
         self.root.title("YouTube MP3 Downloader")
         # Ventana más alta para acomodar todos los widgets
-        self.root.geometry("500x400")
+        self.root.geometry("500x440")
         self.root.resizable(False, False)
         
         # Variables
@@ -32,13 +30,79 @@ class YouTubeMP3Downloader:
         self.progress_var = tk.DoubleVar()
         self.quality_var = tk.StringVar()
         
-        # YouTube object y streams
-        self.yt = None
+        # Motor de descarga, metadatos del video y streams; se crean con load_services
+        self.engine = None
+        self._services_lock = threading.Lock()
+        self.video_info = None
+        # Trabajo en curso, para poder cancelarlo
+        self.current_job = None
         self.audio_streams = []
         self.selected_stream = None
         
         # Crear widgets
         self.create_widgets()
+        
+        # Cuando la ventana ya está pintada, cargar el motor en segundo plano
+        self.root.after_idle(self.start_services)
+    
+    def load_services(self):
+        """
+        Crea el motor y sus servicios. Lo hace el hilo de precarga en cuanto
+        aparece la ventana (ver start_services), nunca el hilo de Tk.
+        """
+        with self._services_lock:
+            if self.engine is not None:
+                return
+            from ytmp3 import net
+            from ytmp3.aio import AsyncEngine, LoopThread
+            from ytmp3.cache import MetadataCache, OutputCache, ThumbnailCache
+            from ytmp3.engine import Engine
+            from ytmp3.farm import TranscodeFarm
+            from ytmp3.health import HealthMonitor
+            from ytmp3.progress import ProgressAggregator, TkSink
+            
+            # Todas las peticiones HTTP (incluidas las de pytubefix) comparten conexiones
+            net.install()
+            # El progreso se agrupa para no inundar la cola de eventos de Tk
+            self.progress = ProgressAggregator([TkSink(self.root, self.show_progress)])
+            # La conversión se hace en un proceso aparte para no frenar la interfaz
+            engine = Engine(
+                on_event=self.progress,
+                transcoder=TranscodeFarm(workers=1),
+                metadata_cache=MetadataCache(),
+                output_cache=OutputCache(),
+                thumbnail_cache=ThumbnailCache(),
+            )
+            # Las búsquedas y descargas se programan en un bucle asyncio en segundo plano
+            self.aio = AsyncEngine(engine)
+            self.loop = LoopThread().start()
+            # Estado de la conexión en segundo plano: buscar no espera a la red
+            self.health = HealthMonitor().start()
+            net.default_pool.health = self.health
+            self.engine = engine
+    
+    def start_services(self):
+        """Carga el motor en segundo plano; Buscar se habilita cuando está listo"""
+        def load():
+            try:
+                self.load_services()
+            except Exception as e:
+                error = e
+                self.root.after(0, lambda: self.on_services_failed(error))
+                return
+            self.root.after(0, self.on_services_ready)
+        
+        self.search_button.config(state=tk.DISABLED)
+        prewarm(load)
+    
+    def on_services_ready(self):
+        self.status_var.set("Ingresa una URL de YouTube y haz clic en Buscar")
+        self.search_button.config(state=tk.NORMAL)
+    
+    def on_services_failed(self, error):
+        # Buscar vuelve a intentar la carga, también en segundo plano
+        self.status_var.set(f"No se pudo iniciar el motor: {error}")
+        self.search_button.config(state=tk.NORMAL)
     
     def create_widgets(self):
         """Crea todos los widgets de la interfaz de usuario."""
@@ -75,7 +139,7 @@ class YouTubeMP3Downloader:
         url_entry.pack(side=tk.LEFT, fill=tk.X, expand=True)
         
         # Botón de búsqueda
-        search_button = tk.Button(
+        self.search_button = tk.Button(
             url_entry_frame, 
             text="Buscar", 
             font=("Arial", 10),
@@ -85,9 +149,11 @@ class YouTubeMP3Downloader:
             width=10,
             relief=tk.RAISED,
             bd=2,
-            command=self.search_video
+            command=self.search_video,
+            # Hasta que el motor termine de cargarse (ver start_services)
+            state=tk.DISABLED
         )
-        search_button.pack(side=tk.RIGHT, padx=(5, 0))
+        self.search_button.pack(side=tk.RIGHT, padx=(5, 0))
         
         # Frame para la selección de calidad (inicialmente oculto)
         self.quality_frame = ttk.Frame(self.main_frame)
@@ -159,6 +225,17 @@ class YouTubeMP3Downloader:
         )
         self.download_button.pack(pady=5)
         
+        # Botón para cancelar la descarga o conversión en curso
+        self.cancel_button = tk.Button(
+            button_center_frame,
+            text="CANCELAR",
+            font=("Arial", 9),
+            width=15,
+            command=self.cancel_download,
+            state=tk.DISABLED
+        )
+        self.cancel_button.pack(pady=(0, 5))
+        
         # Configurar evento para cuando se selecciona una calidad en el dropdown
         self.quality_dropdown.bind('<<ComboboxSelected>>', self.on_quality_selected)
     
@@ -167,23 +244,6 @@ class YouTubeMP3Downloader:
         if download_dir:
             self.download_path_var.set(download_dir)
     
-    def is_valid_youtube_url(self, url):
-        # Patrón para URLs de YouTube
-        youtube_regex = r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
-        
-        youtube_regex_match = re.match(youtube_regex, url)
-        if youtube_regex_match:
-            return True
-        return False
-    
-    def check_internet_connection(self):
-        try:
-            # Intenta conectar a Google
-            urllib.request.urlopen('http://www.google.com', timeout=3)
-            return True
-        except:
-            return False
-    
     def on_quality_selected(self, event):
         """Maneja el evento de selección de una calidad en el dropdown"""
         selected_index = self.quality_dropdown.current()
@@ -195,26 +255,32 @@ class YouTubeMP3Downloader:
     def search_video(self):
         """Busca el video y muestra las opciones de calidad disponibles"""
         url = self.url_var.get().strip()
+        if self.engine is None:
+            # Falló la carga del motor: se reintenta sin bloquear la ventana
+            self.status_var.set("Cargando...")
+            self.start_services()
+            return
+        from ytmp3.engine import is_valid_youtube_url
         
         # Validar URL
         if not url:
             messagebox.showerror("Error", "Por favor, ingresa una URL de YouTube válida")
             return
         
-        if not self.is_valid_youtube_url(url):
+        if not is_valid_youtube_url(url):
             messagebox.showerror("Error", "La URL no parece ser una URL válida de YouTube.\nEjemplo: https://www.youtube.com/watch?v=dQw4w9WgXcQ")
             return
         
         # Verificar conexión a internet
-        if not self.check_internet_connection():
+        if not self.health.is_online():
             messagebox.showerror("Error", "No se detecta conexión a Internet. Por favor, verifica tu conexión.")
             return
         
-        # Iniciar búsqueda en un hilo separado
-        threading.Thread(target=self.fetch_video_info, args=(url,), daemon=True).start()
+        # Iniciar búsqueda sin bloquear la interfaz
+        self.loop.submit(self.fetch_video_info(url))
     
-    def fetch_video_info(self, url):
-        """Obtiene información del video en un hilo separado"""
+    async def fetch_video_info(self, url):
+        """Obtiene información del video en el bucle de asyncio"""
         try:
             # Actualizar estado
             def update_status_searching():
@@ -224,36 +290,13 @@ class YouTubeMP3Downloader:
             
             self.root.after(0, update_status_searching)
             
-            # Crear objeto YouTube con pytubefix
-            try:
-                self.yt = YouTube(url)
-            except Exception as e:
-                error_msg = str(e)
-                if "403" in error_msg:
-                    raise Exception("Acceso prohibido (Error 403). Este video puede tener restricciones.")
-                elif "404" in error_msg:
-                    raise Exception("Video no encontrado (Error 404). La URL podría ser incorrecta.")
-                elif "400" in error_msg:
-                    raise Exception("Solicitud incorrecta (Error 400). Intenta usando otra URL.")
-                else:
-                    raise Exception(f"Error al conectar con YouTube: {error_msg}")
-            
-            # Obtener título del video
-            video_title = self.yt.title
-            
-            # Obtener streams de audio disponibles
-            self.audio_streams = self.yt.streams.filter(only_audio=True).order_by('abr').desc()
-            
-            if not self.audio_streams:
-                raise Exception("No se encontraron streams de audio para este video. Podría estar protegido.")
+            # Obtener metadatos y streams de audio disponibles
+            self.video_info = await self.aio.resolve(url)
+            self.audio_streams = self.video_info.streams
+            video_title = self.video_info.title
             
             # Preparar datos para el dropdown menu
-            quality_options = []
-            for i, stream in enumerate(self.audio_streams):
-                abr = stream.abr if stream.abr else "Unknown"
-                mime_type = stream.mime_type.split('/')[1] if stream.mime_type else "Unknown"
-                text = f"Calidad: {abr}, Formato: {mime_type}, Tamaño: {self.get_size_text(stream.filesize)}"
-                quality_options.append(text)
+            quality_options = [stream.label() for stream in self.audio_streams]
             
             # Actualizar UI desde el hilo principal
             def update_ui():
@@ -263,10 +306,10 @@ class YouTubeMP3Downloader:
                 # Actualizar dropdown con las opciones
                 self.quality_dropdown['values'] = quality_options
                 
-                # Seleccionar la primera opción por defecto
+                # Preseleccionar el stream que elegiría el motor
                 if len(quality_options) > 0:
-                    self.quality_dropdown.current(0)
-                    self.selected_stream = self.audio_streams[0]
+                    self.selected_stream = self.engine.select_stream(self.video_info)
+                    self.quality_dropdown.current(self.audio_streams.index(self.selected_stream))
                 
                 # Mostrar el frame de calidad si no está visible
                 self.quality_frame.pack(fill=tk.X, pady=10, after=self.url_frame)
@@ -285,34 +328,6 @@ class YouTubeMP3Downloader:
             
             self.root.after(0, update_error)
     
-    def get_size_text(self, bytes_size):
-        """Convierte bytes a texto legible (KB, MB)"""
-        if bytes_size is None:
-            return "Desconocido"
-        
-        kb_size = bytes_size / 1024
-        if kb_size < 1024:
-            return f"{kb_size:.1f} KB"
-        else:
-            mb_size = kb_size / 1024
-            return f"{mb_size:.1f} MB"
-    
-    def progress_callback(self, stream, chunk, bytes_remaining):
-        """Función de callback para actualizar el progreso de descarga"""
-        total_size = stream.filesize
-        bytes_downloaded = total_size - bytes_remaining
-        percentage = (bytes_downloaded / total_size) * 100
-        
-        # Limitar a 0-100
-        percentage = max(0, min(percentage, 100))
-        
-        # Usar after para actualizar UI con seguridad
-        def update_progress():
-            self.progress_var.set(percentage)
-            self.status_var.set(f"Descargando: {percentage:.1f}%")
-        
-        self.root.after(0, update_progress)
-            
     def start_download(self):
         """Inicia la descarga con la calidad seleccionada"""
         download_path = self.download_path_var.get()
@@ -327,77 +342,105 @@ class YouTubeMP3Downloader:
             messagebox.showerror("Error", "Por favor, selecciona una calidad de audio")
             return
         
-        # Iniciar descarga en un hilo separado
-        threading.Thread(target=self.download_audio, args=(download_path,), daemon=True).start()
+        self.progress_var.set(0)
+        self.status_var.set("Preparando la descarga...")
+        self.download_button.config(state=tk.DISABLED)
+        
+        # El motor ejecuta la descarga en segundo plano
+        from ytmp3.engine import Job
+        job = Job(
+            self.video_info.url,
+            download_path,
+            info=self.video_info,
+            stream=self.selected_stream,
+            on_event=self.on_job_event,
+        )
+        self.current_job = job
+        self.cancel_button.config(state=tk.NORMAL)
+        self.loop.submit(self.aio.run_job(job))
     
-    def download_audio(self, download_path):
-        try:
-            # Actualizar estado
-            def update_start():
-                self.progress_var.set(0)
-                self.status_var.set("Preparando la descarga...")
-                self.download_button.config(state=tk.DISABLED)
-            
-            self.root.after(0, update_start)
-            
-            # Obtener título del video
-            video_title = self.yt.title
-            safe_title = "".join([c for c in video_title if c.isalpha() or c.isdigit() or c in " ._-"]).rstrip()
-            
-            # Configurar callback de progreso
-            self.yt.register_on_progress_callback(self.progress_callback)
+    def cancel_download(self):
+        """Cancela la descarga o conversión en curso"""
+        if self.current_job is not None:
+            self.current_job.cancel()
+            self.status_var.set("Cancelando...")
+            self.cancel_button.config(state=tk.DISABLED)
+    
+    def show_progress(self, snapshot):
+        """Muestra el progreso del trabajo en curso (unas pocas veces por segundo)"""
+        from ytmp3.engine import JobState
+        from ytmp3.progress import format_eta, format_speed
+        for job in snapshot.jobs:
+            if job.state == JobState.DOWNLOADING:
+                self.progress_var.set(job.progress)
+                self.status_var.set(
+                    f"Descargando: {job.progress:.1f}% - {format_speed(job.speed)}, quedan {format_eta(job.eta)}"
+                )
+                return
+            if job.state == JobState.CONVERTING:
+                self.progress_var.set(job.convert_progress)
+                self.status_var.set(f"Convirtiendo a MP3: {job.convert_progress:.0f}%")
+                return
+    
+    def on_job_event(self, event):
+        """Traslada los eventos del motor (hilo de descarga) al hilo de la interfaz"""
+        from ytmp3.engine import JobState, safe_filename
+        job = event.job
+        
+        # El progreso llega agrupado a show_progress
+        if event.kind == "state" and event.value == JobState.DOWNLOADING:
+            safe_title = safe_filename(job.title)
             
-            # Actualizar estado
             def update_status():
                 self.status_var.set(f"Descargando: {safe_title}")
             
             self.root.after(0, update_status)
-            
-            # Descargar el audio
-            try:
-                temp_file = self.selected_stream.download(output_path=download_path, filename=f"{safe_title}.tmp")
-            except Exception as e:
-                if "404" in str(e) or "403" in str(e):
-                    raise Exception("Error al descargar: El video podría tener restricciones regionales o de edad.")
-                else:
-                    raise Exception(f"Error al descargar el audio: {str(e)}")
-            
-            # Convertir a MP3
+        
+        elif event.kind == "state" and event.value == JobState.CONVERTING:
             def update_converting():
                 self.status_var.set("Convirtiendo a MP3...")
             
             self.root.after(0, update_converting)
+        
+        elif event.kind == "retry":
+            retry_message = f"Reintentando en {job.retry_delay:.0f} s: {event.value}"
             
-            mp3_file = os.path.join(download_path, f"{safe_title}.mp3")
-            try:
-                audio_clip = AudioFileClip(temp_file)
-                audio_clip.write_audiofile(mp3_file, logger=None)
-                audio_clip.close()
-                
-                # Limpiar el archivo temporal
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            except Exception as e:
-                raise Exception(f"Error al convertir a MP3: {str(e)}")
+            def update_retry():
+                self.status_var.set(retry_message)
+            
+            self.root.after(0, update_retry)
+        
+        elif event.kind == "done":
+            file_name = os.path.basename(event.value)
             
-            # Completado
             def update_complete():
                 self.progress_var.set(100)
-                self.status_var.set(f"Descarga completada: {safe_title}.mp3")
+                self.status_var.set(f"Descarga completada: {file_name}")
                 self.download_button.config(state=tk.NORMAL)
-                messagebox.showinfo("Completado", f"La descarga se ha completado con éxito\n{safe_title}.mp3")
+                self.cancel_button.config(state=tk.DISABLED)
+                messagebox.showinfo("Completado", f"La descarga se ha completado con éxito\n{file_name}")
             
             self.root.after(0, update_complete)
-            
-        except Exception as e:
-            error_message = str(e)
+        
+        elif event.kind == "error":
+            error_message = str(event.value)
             
             def update_error():
                 self.status_var.set(f"Error: {error_message}")
                 self.download_button.config(state=tk.NORMAL)
+                self.cancel_button.config(state=tk.DISABLED)
                 messagebox.showerror("Error", f"Se produjo un error durante la descarga:\n{error_message}")
             
             self.root.after(0, update_error)
+        
+        elif event.kind == "cancelled":
+            def update_cancelled():
+                self.progress_var.set(0)
+                self.status_var.set("Descarga cancelada")
+                self.download_button.config(state=tk.NORMAL)
+                self.cancel_button.config(state=tk.DISABLED)
+            
+            self.root.after(0, update_cancelled)
 
 def main():
     # Crear la ventana principal
@@ -405,7 +448,7 @@ def main():
     
     # Centrar la ventana en la pantalla
     window_width = 500
-    window_height = 400
+    window_height = 440
     screen_width = root.winfo_screenwidth()
     screen_height = root.winfo_screenheight()
     x_position = (screen_width - window_width) // 2
@@ -0,0 +1,46 @@
+"""
+Motor sin interfaz gráfica para descargar audio de YouTube y convertirlo a MP3.
+Las aplicaciones Tkinter y la línea de comandos son frontends sobre este paquete.
+
+Los nombres exportados se importan la primera vez que se usan, para que
+"from ytmp3 import net" no cargue asyncio, sqlite3 o multiprocessing.
+"""
+
+import importlib
+
+# Nombre exportado -> módulo que lo define
+_EXPORTS = {
+    "BatchProgress": ".engine",
+    "Engine": ".engine",
+    "AsyncEngine": ".aio",
+    "Job": ".engine",
+    "JobEvent": ".engine",
+    "JobState": ".engine",
+    "VideoInfo": ".models",
+    "StreamInfo": ".models",
+    "Segment": ".models",
+    "SelectionPolicy": ".selection",
+    "RateLimiter": ".ratelimit",
+    "MetricsCollector": ".metrics",
+    "TranscodeFarm": ".farm",
+    "FanOutTranscoder": ".transcoders",
+    "EngineError": ".errors",
+    "MetadataCache": ".cache",
+    "OutputCache": ".cache",
+    "ThumbnailCache": ".cache",
+    "StagingArea": ".staging",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -0,0 +1,8 @@
+import sys
+
+from .cli import main
+
+# La granja de conversión arranca sus procesos con spawn, que vuelve a
+# importar este módulo en cada uno
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,142 @@
+"""
+Motor asíncrono
+----------------------------------------------------
+Interfaz asyncio sobre Engine para resolver los metadatos de muchos videos a
+la vez. En lugar de un hilo por consulta, un semáforo limita las consultas
+en curso y las que esperan no ocupan ningún hilo; pytubefix es síncrono, así
+que cada consulta en curso se ejecuta en un pool de tantos hilos como el
+límite. Las descargas y conversiones siguen en los hilos del Engine y aquí
+solo se esperan.
+
+Sin interfaz gráfica:
+    jobs = AsyncEngine(max_in_flight=32).run(urls, "descargas")
+
+Con Tk, el bucle corre en su propio hilo (LoopThread) y las corrutinas se
+envían desde los callbacks de la interfaz.
+"""
+
+import asyncio
+import concurrent.futures
+import threading
+
+from .engine import Engine, Job
+from .errors import EngineError
+
+
+class AsyncEngine:
+    """
+    Envuelve un Engine (o crea uno con engine_options) para usarlo con asyncio.
+
+    max_in_flight: consultas de metadatos simultáneas como máximo
+    """
+
+    def __init__(self, engine=None, max_in_flight=16, **engine_options):
+        self.engine = engine or Engine(**engine_options)
+        self.max_in_flight = max(1, max_in_flight)
+        self._loop = None
+        self._semaphore = None
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            self.max_in_flight, thread_name_prefix="ytmp3-resolve"
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+
+    async def resolve(self, url):
+        """Como Engine.resolve, sin bloquear el bucle"""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Cada run() crea un bucle nuevo y el semáforo pertenece a uno solo
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            return await loop.run_in_executor(self._executor, self.engine.resolve, url)
+
+    async def run_job(self, job):
+        """Envía el trabajo al Engine y espera a que termine; devuelve el trabajo"""
+        loop = asyncio.get_running_loop()
+        finished = loop.create_future()
+        on_event = job.on_event
+
+        def forward(event):
+            if on_event is not None:
+                on_event(event)
+            if event.kind in ("done", "error", "cancelled"):
+                try:
+                    loop.call_soon_threadsafe(_set_result, finished, job)
+                except RuntimeError:
+                    # El bucle ya se cerró (Ctrl+C en run()): nadie espera este resultado
+                    pass
+
+        job.on_event = forward
+        self.engine.submit(job)
+        return await finished
+
+    async def process(self, url, output_dir, **job_options):
+        """Resuelve la URL y, si hay metadatos, la descarga y convierte"""
+        job = Job(url, output_dir, **job_options)
+        try:
+            with self.engine._span(job, "resolve"):
+                job.info = await self.resolve(url)
+        except EngineError as e:
+            self.engine._fail(job, e)
+            return job
+        return await self.run_job(job)
+
+    async def process_many(self, urls, output_dir, **job_options):
+        """
+        Procesa todas las URLs; las resoluciones se solapan con las descargas.
+        urls puede ser un generador perezoso (p. ej. playlists.expand_urls):
+        cada URL empieza a procesarse en cuanto se obtiene.
+        """
+        loop = asyncio.get_running_loop()
+        urls = iter(urls)
+        tasks = []
+        while True:
+            # Obtener la siguiente URL puede requerir pedir otra página de la lista
+            url = await loop.run_in_executor(self._executor, next, urls, None)
+            if url is None:
+                break
+            tasks.append(loop.create_task(self.process(url, output_dir, **job_options)))
+        return await asyncio.gather(*tasks)
+
+    def run(self, urls, output_dir, **job_options):
+        """Versión síncrona de process_many para uso sin interfaz"""
+        return asyncio.run(self.process_many(urls, output_dir, **job_options))
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+        self.engine.shutdown(wait=wait)
+
+
+def _set_result(future, value):
+    if not future.done():
+        future.set_result(value)
+
+
+class LoopThread:
+    """Bucle de asyncio en un hilo propio, para enviarle corrutinas desde Tk"""
+
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name="ytmp3-asyncio", daemon=True)
+
+    def start(self):
+        if not self._thread.is_alive():
+            self._thread.start()
+        return self
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coroutine):
+        """Programa la corrutina en el bucle; devuelve un concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop)
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,233 @@
+"""
+Cola de trabajos compartida
+----------------------------------------------------
+Broker guarda en SQLite una cola de URLs que varios procesos trabajadores
+(ver worker.py), en una o varias máquinas con la base de datos compartida,
+van tomando y procesando.
+
+Cada trabajador toma una tarea con un arrendamiento (lease) que renueva
+mientras la procesa. Si el trabajador muere y el arrendamiento vence, otro
+trabajador vuelve a tomar la tarea. Las tareas que fallan se reintentan con
+una espera creciente hasta max_attempts veces; después quedan como fallidas
+con su último error.
+"""
+
+import os
+import time
+from collections import namedtuple
+
+from .cache import SQLiteStore, default_cache_dir
+
+
+class TaskState:
+    QUEUED = "queued"
+    LEASED = "leased"
+    DONE = "done"
+    FAILED = "failed"
+
+
+# Tarea de la cola. output_file es la ruta del resultado si terminó bien y
+# error el último error si falló algún intento
+Task = namedtuple(
+    "Task",
+    ["id", "url", "output_dir", "itag", "state", "attempts", "max_attempts", "worker", "output_file", "error"],
+)
+
+TASK_COLUMNS = ", ".join(Task._fields)
+
+# Segundos que dura un arrendamiento si el trabajador no lo renueva
+LEASE_TIME = 60
+# Espera antes del primer reintento; se duplica en cada uno
+RETRY_DELAY = 30
+
+
+def default_broker_path():
+    return os.path.join(default_cache_dir(), "queue.sqlite3")
+
+
+class Broker(SQLiteStore):
+    """
+    Cola de tareas en SQLite con arrendamientos, reintentos y resultados.
+
+    Varios procesos pueden abrir el mismo archivo: tomar una tarea se hace
+    en una transacción BEGIN IMMEDIATE, de modo que nunca la toman dos.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            url TEXT NOT NULL,
+            output_dir TEXT NOT NULL,
+            itag INTEGER,
+            state TEXT NOT NULL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            max_attempts INTEGER NOT NULL,
+            worker TEXT,
+            lease_expires REAL,
+            available_at REAL NOT NULL,
+            output_file TEXT,
+            error TEXT,
+            submitted_at REAL NOT NULL,
+            finished_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, available_at);
+    """
+
+    def __init__(self, path=None, retry_delay=RETRY_DELAY):
+        super().__init__(path or default_broker_path())
+        self.retry_delay = retry_delay
+        with self._lock:
+            # WAL permite leer mientras otro proceso escribe; el timeout espera
+            # a que otro proceso suelte el bloqueo en lugar de fallar
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute("PRAGMA busy_timeout=30000")
+
+    def submit(self, urls, output_dir, itag=None, max_attempts=3):
+        """Encola una tarea por URL y devuelve sus IDs"""
+        now = time.time()
+        ids = []
+        with self._lock, self._connection:
+            for url in urls:
+                cursor = self._connection.execute(
+                    "INSERT INTO tasks (url, output_dir, itag, state, max_attempts, available_at, submitted_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (url, os.path.abspath(output_dir), itag, TaskState.QUEUED, max(1, max_attempts), now, now),
+                )
+                ids.append(cursor.lastrowid)
+        return ids
+
+    def lease(self, worker, lease_time=LEASE_TIME):
+        """
+        Toma la siguiente tarea disponible para worker y devuelve su Task, o
+        None si no hay ninguna. Las tareas con el arrendamiento vencido
+        vuelven a estar disponibles; si ya agotaron sus intentos, fallan.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute("BEGIN IMMEDIATE")
+            self._connection.execute(
+                "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, finished_at = ?, "
+                "error = COALESCE(error, 'El trabajador dejó de responder') "
+                "WHERE state = ? AND lease_expires <= ? AND attempts >= max_attempts",
+                (TaskState.FAILED, now, TaskState.LEASED, now),
+            )
+            row = self._connection.execute(
+                "SELECT id FROM tasks "
+                "WHERE (state = ? AND available_at <= ?) OR (state = ? AND lease_expires <= ?) "
+                "ORDER BY id LIMIT 1",
+                (TaskState.QUEUED, now, TaskState.LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE tasks SET state = ?, worker = ?, lease_expires = ?, attempts = attempts + 1 "
+                "WHERE id = ?",
+                (TaskState.LEASED, worker, now + lease_time, row[0]),
+            )
+            return self._get(row[0])
+
+    def renew(self, task_id, worker, lease_time=LEASE_TIME):
+        """Alarga el arrendamiento; devuelve False si worker ya no tiene la tarea"""
+        return self._update_leased(
+            task_id, worker, "lease_expires = ?", (time.time() + lease_time,)
+        )
+
+    def complete(self, task_id, worker, output_file):
+        return self._update_leased(
+            task_id, worker,
+            "state = ?, output_file = ?, error = NULL, lease_expires = NULL, finished_at = ?",
+            (TaskState.DONE, output_file, time.time()),
+        )
+
+    def fail(self, task_id, worker, error, retry=True):
+        """
+        Registra un intento fallido. Si quedan intentos (y retry es True) la
+        tarea vuelve a la cola tras una espera que se duplica en cada intento.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT attempts, max_attempts FROM tasks WHERE id = ? AND state = ? AND worker = ?",
+                (task_id, TaskState.LEASED, worker),
+            ).fetchone()
+            if row is None:
+                return False
+            attempts, max_attempts = row
+            if retry and attempts < max_attempts:
+                delay = self.retry_delay * 2 ** (attempts - 1)
+                self._connection.execute(
+                    "UPDATE tasks SET state = ?, worker = NULL, lease_expires = NULL, available_at = ?, "
+                    "error = ? WHERE id = ?",
+                    (TaskState.QUEUED, now + delay, str(error), task_id),
+                )
+            else:
+                self._connection.execute(
+                    "UPDATE tasks SET state = ?, lease_expires = NULL, error = ?, finished_at = ? WHERE id = ?",
+                    (TaskState.FAILED, str(error), now, task_id),
+                )
+            return True
+
+    def release(self, task_id, worker):
+        """Devuelve la tarea a la cola sin gastar el intento (p. ej. al detener el trabajador)"""
+        return self._update_leased(
+            task_id, worker,
+            "state = ?, worker = NULL, lease_expires = NULL, attempts = MAX(attempts - 1, 0)",
+            (TaskState.QUEUED,),
+        )
+
+    def _update_leased(self, task_id, worker, assignments, values):
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                f"UPDATE tasks SET {assignments} WHERE id = ? AND state = ? AND worker = ?",
+                values + (task_id, TaskState.LEASED, worker),
+            )
+            return cursor.rowcount == 1
+
+    def get(self, task_id):
+        with self._lock:
+            return self._get(task_id)
+
+    def _get(self, task_id):
+        row = self._connection.execute(f"SELECT {TASK_COLUMNS} FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return Task(*row) if row else None
+
+    def tasks(self, ids=None, state=None):
+        """Tareas (todas, las de ids o las que están en state), por orden de envío"""
+        query = f"SELECT {TASK_COLUMNS} FROM tasks"
+        conditions, values = [], []
+        if ids is not None:
+            ids = list(ids)
+            conditions.append(f"id IN ({', '.join('?' * len(ids))})" if ids else "0")
+            values += ids
+        if state is not None:
+            conditions.append("state = ?")
+            values.append(state)
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        with self._lock:
+            return [Task(*row) for row in self._connection.execute(query + " ORDER BY id", values)]
+
+    def counts(self):
+        """Número de tareas en cada estado"""
+        counts = {state: 0 for state in (TaskState.QUEUED, TaskState.LEASED, TaskState.DONE, TaskState.FAILED)}
+        with self._lock:
+            for state, count in self._connection.execute("SELECT state, COUNT(*) FROM tasks GROUP BY state"):
+                counts[state] = count
+        return counts
+
+    def pending(self):
+        """Tareas sin terminar (en cola o en proceso)"""
+        counts = self.counts()
+        return counts[TaskState.QUEUED] + counts[TaskState.LEASED]
+
+    def wait(self, ids=None, timeout=None, poll_interval=1.0):
+        """Espera a que terminen las tareas indicadas (por defecto, todas); devuelve sus Task"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            tasks = self.tasks(ids)
+            if all(task.state in (TaskState.DONE, TaskState.FAILED) for task in tasks):
+                return tasks
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("Las tareas no terminaron a tiempo")
+            time.sleep(poll_interval)
+
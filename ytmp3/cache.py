@@ -0,0 +1,347 @@
+"""
+Cachés persistentes
+----------------------------------------------------
+MetadataCache guarda en SQLite los metadatos de cada video (título y streams
+de audio) indexados por su ID de 11 caracteres, para que las búsquedas
+repetidas y las relanzadas de una lista no vuelvan a consultar YouTube.
+
+OutputCache recuerda qué archivo se generó para cada combinación de video,
+stream y formato de salida, para no volver a descargar ni convertir.
+
+ThumbnailCache guarda la portada de cada video ya reducida, para que las
+etiquetas de cada conversión no vuelvan a descargarla.
+"""
+
+import hashlib
+import http.client
+import json
+import shutil
+import os
+import sqlite3
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+from . import net
+from .errors import EngineError
+from .ffmpeg import FFmpegProcess
+from .models import VideoInfo
+from .staging import fsync_file
+
+# Margen para no usar URLs firmadas que están a punto de caducar
+URL_EXPIRY_MARGIN = 300
+
+
+def default_cache_dir():
+    """Carpeta de caché del usuario (respeta XDG_CACHE_HOME)"""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "ytmp3")
+
+
+def url_expiration(url):
+    """Momento (epoch) en que caduca una URL firmada de YouTube, o None"""
+    if not url:
+        return None
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    try:
+        return int(query["expire"][0])
+    except (KeyError, IndexError, ValueError):
+        return None
+
+
+def needs_source(info):
+    """
+    Indica si algún stream del VideoInfo solo se descarga con el objeto de
+    pytubefix (streams SABR, sin URL), que no se puede guardar en la caché.
+    """
+    return any(stream.url is None for stream in info.streams)
+
+
+class SQLiteStore:
+    """Conexión SQLite compartida entre hilos y protegida por un lock"""
+
+    SCHEMA = ""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._connection:
+            self._connection.executescript(self.SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class MetadataCache(SQLiteStore):
+    """
+    Caché de VideoInfo con caducidad y expulsión LRU.
+
+    Cada entrada caduca a los ttl segundos o cuando caduca la URL firmada de
+    alguno de sus streams, lo que ocurra antes. Al superar max_entries se
+    eliminan las entradas usadas hace más tiempo. Los videos con streams SABR
+    no se guardan (ver needs_source).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS videos (
+            video_id TEXT PRIMARY KEY,
+            data TEXT NOT NULL,
+            expires_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS videos_last_access ON videos (last_access);
+    """
+
+    def __init__(self, path=None, ttl=6 * 3600, max_entries=5000):
+        super().__init__(path or os.path.join(default_cache_dir(), "metadata.sqlite3"))
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, video_id):
+        """Devuelve el VideoInfo guardado o None si no existe o ha caducado"""
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT data, expires_at FROM videos WHERE video_id = ?", (video_id,)
+            ).fetchone()
+            info = VideoInfo.from_dict(json.loads(row[0])) if row is not None else None
+            # Las entradas con streams SABR que guardaron versiones anteriores no sirven
+            if info is None or row[1] <= now or needs_source(info):
+                if info is not None:
+                    self._connection.execute("DELETE FROM videos WHERE video_id = ?", (video_id,))
+                self.misses += 1
+                return None
+            self._connection.execute(
+                "UPDATE videos SET last_access = ? WHERE video_id = ?", (now, video_id)
+            )
+            self.hits += 1
+        return info
+
+    def put(self, info):
+        if needs_source(info):
+            return
+        now = time.time()
+        expires_at = now + self.ttl
+        for stream in info.streams:
+            expiration = url_expiration(stream.url)
+            if expiration is not None:
+                expires_at = min(expires_at, expiration - URL_EXPIRY_MARGIN)
+        if expires_at <= now:
+            return
+
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO videos (video_id, data, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (info.video_id, json.dumps(info.to_dict()), expires_at, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        count = self._connection.execute("SELECT COUNT(*) FROM videos").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM videos WHERE video_id IN "
+                "(SELECT video_id FROM videos ORDER BY last_access LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM videos")
+
+    def stats(self):
+        """Contadores de aciertos, fallos y expulsiones desde que se abrió la caché"""
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+def file_checksum(path, block_size=1024 * 1024):
+    """SHA-256 del contenido de un archivo"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class OutputCache(SQLiteStore):
+    """
+    Índice de archivos ya convertidos.
+
+    La clave es (video_id, itag, formato, bitrate). Un archivo solo se
+    considera válido si sigue existiendo con el mismo tamaño y fecha de
+    modificación que cuando se registró; el checksum permite detectar y
+    reutilizar el mismo contenido aunque el título (y el nombre) cambie.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS outputs (
+            video_id TEXT NOT NULL,
+            itag INTEGER NOT NULL,
+            format TEXT NOT NULL,
+            bitrate TEXT NOT NULL,
+            path TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            mtime REAL NOT NULL,
+            PRIMARY KEY (video_id, itag, format, bitrate)
+        );
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path or os.path.join(default_cache_dir(), "outputs.sqlite3"))
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, video_id, itag, output_format, bitrate=None):
+        """Devuelve la ruta de un archivo válido ya convertido o None"""
+        key = (video_id, itag, output_format, bitrate or "")
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT path, size, mtime FROM outputs "
+                "WHERE video_id = ? AND itag = ? AND format = ? AND bitrate = ?",
+                key,
+            ).fetchone()
+            if row is not None and not self._is_intact(*row):
+                self._connection.execute(
+                    "DELETE FROM outputs WHERE video_id = ? AND itag = ? AND format = ? AND bitrate = ?",
+                    key,
+                )
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def record(self, video_id, itag, output_format, bitrate, path):
+        stat = os.stat(path)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO outputs "
+                "(video_id, itag, format, bitrate, path, sha256, size, mtime) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_id, itag, output_format, bitrate or "", os.path.abspath(path),
+                 file_checksum(path), stat.st_size, stat.st_mtime),
+            )
+
+    def owner(self, path):
+        """ID del video que se convirtió a path, o None si no está registrado"""
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT video_id FROM outputs WHERE path = ?", (os.path.abspath(path),)
+            ).fetchone()
+        return row[0] if row is not None else None
+
+    def materialize(self, cached_path, output_file):
+        """
+        Hace que output_file tenga el contenido de cached_path: no hace nada si
+        ya es el mismo archivo, o crea un enlace duro (o una copia si el enlace
+        no es posible) cuando cambia el título o la carpeta de destino. El
+        archivo nuevo sustituye al anterior de una vez, con un cambio de nombre.
+        """
+        if os.path.exists(output_file):
+            if os.path.samefile(cached_path, output_file):
+                return output_file
+            if file_checksum(output_file) == file_checksum(cached_path):
+                return output_file
+        directory, name = os.path.split(os.path.abspath(output_file))
+        temp_file = os.path.join(directory, f".{name}.{os.getpid()}.{threading.get_ident()}.part")
+        try:
+            try:
+                os.link(cached_path, temp_file)
+            except OSError:
+                shutil.copy2(cached_path, temp_file)
+                fsync_file(temp_file)
+            os.replace(temp_file, output_file)
+        finally:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        return output_file
+
+    def _is_intact(self, path, size, mtime):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == size and stat.st_mtime == mtime
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+class ThumbnailCache:
+    """
+    Portadas de los videos en <directory>/<video_id>.jpg, descargadas y
+    reducidas (a size píxeles de lado como máximo) una sola vez por video.
+    Las portadas son opcionales: si no se pueden obtener, get() devuelve None.
+    """
+
+    def __init__(self, directory=None, size=500, timeout=30):
+        self.directory = directory or os.path.join(default_cache_dir(), "thumbnails")
+        self.size = size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+        self._video_locks = {}
+
+    def path(self, video_id):
+        return os.path.join(self.directory, f"{video_id}.jpg")
+
+    def get(self, info, cancel=None):
+        """Ruta de la portada de un VideoInfo, descargándola si hace falta, o None"""
+        if not info.thumbnail_url or not info.video_id:
+            return None
+        path = self.path(info.video_id)
+        # Dos trabajos del mismo video esperan a una sola descarga
+        with self._lock:
+            video_lock = self._video_locks.setdefault(info.video_id, threading.Lock())
+        with video_lock:
+            if os.path.exists(path):
+                self.hits += 1
+                return path
+            self.misses += 1
+            if cancel is not None:
+                cancel.check()
+            try:
+                self._fetch(info.thumbnail_url, path)
+            except (OSError, http.client.HTTPException, EngineError):
+                self.errors += 1
+                return None
+        return path
+
+    def _fetch(self, url, path):
+        os.makedirs(self.directory, exist_ok=True)
+        source_file = f"{path}.source"
+        resized_file = f"{path}.part.jpg"
+        request = urllib.request.Request(url, headers={"User-Agent": "Mozilla/5.0"})
+        try:
+            with net.urlopen(request, timeout=self.timeout) as response:
+                data = response.read()
+            with open(source_file, "wb") as handle:
+                handle.write(data)
+            scale = f"scale={self.size}:{self.size}:force_original_aspect_ratio=decrease"
+            process = FFmpegProcess(["-i", source_file, "-vf", scale, "-frames:v", "1", "-q:v", "3", resized_file])
+            if process.wait() != 0:
+                raise EngineError(f"No se pudo reducir la portada: {process.error_output or 'ffmpeg falló'}")
+            os.replace(resized_file, path)
+        finally:
+            for temp_file in (source_file, resized_file):
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors}
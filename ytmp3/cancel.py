@@ -0,0 +1,59 @@
+"""
+Cancelación cooperativa
+----------------------------------------------------
+Cada trabajo tiene un CancelToken. Los bucles de descarga lo comprueban en
+cada bloque con check(), y lo que no se puede interrumpir así (un proceso
+de ffmpeg) se registra con on_cancel() para detenerlo en el momento.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from .errors import JobCancelled
+
+
+class CancelToken:
+    """Señal de cancelación que se comparte entre las fases de un trabajo"""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def check(self):
+        """Lanza JobCancelled si se ha pedido cancelar"""
+        if self._event.is_set():
+            raise JobCancelled()
+
+    def wait(self, timeout):
+        """Como time.sleep, pero termina antes si se cancela; devuelve True si se canceló"""
+        return self._event.wait(timeout)
+
+    @contextmanager
+    def on_cancel(self, callback):
+        """Mientras dure el bloque, cancelar llama a callback (enseguida si ya se canceló)"""
+        with self._lock:
+            registered = not self._event.is_set()
+            if registered:
+                self._callbacks.append(callback)
+        if not registered:
+            callback()
+        try:
+            yield
+        finally:
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
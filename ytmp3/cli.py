@@ -0,0 +1,458 @@
+"""
+Línea de comandos
+----------------------------------------------------
+Procesa un archivo con URLs de YouTube (una por línea) sin necesidad de
+pantalla. Las líneas vacías y las que empiezan por '#' se ignoran. Las URLs
+de listas de reproducción y canales se expanden en sus videos.
+
+Ejemplo:
+    python -m ytmp3 urls.txt -o ~/Music
+"""
+
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+from . import net
+from .cache import MetadataCache, OutputCache, ThumbnailCache
+from .downloader import SegmentedDownloader
+from .engine import Engine, Job, JobState, is_valid_youtube_url
+from .errors import EngineError
+from .loudness import Normalizer
+from .metrics import JSONLinesSpanSink, MetricsCollector, MetricsServer
+from .progress import ConsoleSink, JSONLinesSink, ProgressAggregator
+from .playlists import expand_urls, is_collection_url
+from .ratelimit import RateLimiter, parse_rate
+from .retry import RetryPolicy
+from .segments import parse_segment
+from .selection import SelectionPolicy
+from .staging import StagingArea
+from .transcoders import OUTPUT_FORMATS, TRANSCODERS, FanOutTranscoder, get_transcoder, parse_outputs
+
+
+def read_urls(path):
+    """Lee las URLs de un archivo ('-' para la entrada estándar)"""
+    handle = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        urls = []
+        for line in handle:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                urls.append(line)
+        return urls
+    finally:
+        if handle is not sys.stdin:
+            handle.close()
+
+
+def selection_policy(text):
+    try:
+        return SelectionPolicy.parse(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def output_list(text):
+    try:
+        return parse_outputs(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def segment(text):
+    try:
+        return parse_segment(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def chapter_list(text):
+    try:
+        numbers = [int(part) for part in text.split(",")]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Capítulos no válidos: '{text}' (use números separados por comas)")
+    if any(number < 1 for number in numbers):
+        raise argparse.ArgumentTypeError("Los capítulos se numeran desde 1")
+    return numbers
+
+
+def rate(text):
+    try:
+        return parse_rate(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def add_engine_arguments(parser):
+    """Opciones del motor, comunes a la línea de comandos y a los trabajadores de la cola"""
+    parser.add_argument(
+        "-j", "--workers", type=int, default=4,
+        help="descargas simultáneas (por defecto 4)",
+    )
+    parser.add_argument(
+        "--convert-workers", type=int, default=None,
+        help="conversiones simultáneas (por defecto, una por núcleo)",
+    )
+    parser.add_argument(
+        "--processes", action="store_true",
+        help="convertir en procesos aparte, cada uno fijado a un núcleo "
+             "(tantos como --convert-workers)",
+    )
+    parser.add_argument(
+        "--connections", type=int, default=4,
+        help="conexiones simultáneas por descarga (por defecto 4)",
+    )
+    parser.add_argument(
+        "--pool-size", type=int, default=8,
+        help="conexiones HTTP keep-alive como máximo por host (por defecto 8)",
+    )
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="convertir mientras se descarga, sin archivo temporal",
+    )
+    parser.add_argument(
+        "-f", "--format", choices=sorted(OUTPUT_FORMATS), default="mp3",
+        help="formato de salida (por defecto mp3); m4a y opus copian el audio sin recodificar si el códec coincide",
+    )
+    parser.add_argument("-b", "--bitrate", help="bitrate de salida, p. ej. 192k")
+    parser.add_argument(
+        "--outputs", type=output_list, metavar="SALIDAS",
+        help="varios archivos de una sola descarga, p. ej. 'mp3:320k,mp3:128k,opus' "
+             "(formato[:bitrate[:frecuencia]]); se decodifica una vez con ffmpeg, aunque se pida "
+             "--transcoder, y sustituye a --format y --bitrate",
+    )
+    parser.add_argument(
+        "--normalize", type=float, nargs="?", const=-14.0, metavar="LUFS",
+        help="ajustar el volumen a una sonoridad EBU R128 (por defecto -14 LUFS), sin pasar de -1 dBFS de pico",
+    )
+    parser.add_argument(
+        "--trim-silence", action="store_true",
+        help="quitar el silencio del principio y del final",
+    )
+    parser.add_argument(
+        "--transcoder", choices=["auto"] + sorted(TRANSCODERS), default="auto",
+        help="backend de conversión (por defecto ffmpeg si está disponible)",
+    )
+    parser.add_argument(
+        "--select", type=selection_policy, default=None, metavar="POLÍTICA",
+        help="cómo elegir el stream, p. ej. 'best,codec=opus', 'smallest,min-abr=128' o "
+             "'cheapest,min-abr=128' (por defecto 'best', el de mayor bitrate)",
+    )
+    parser.add_argument(
+        "--retries", type=int, default=3,
+        help="reintentos tras un error pasajero (red, 5xx, 429), con espera exponencial (por defecto 3)",
+    )
+    parser.add_argument(
+        "--limit-rate", type=rate, metavar="VELOCIDAD",
+        help="ancho de banda máximo de todas las descargas juntas, p. ej. 500K o 2M (bytes por segundo)",
+    )
+    parser.add_argument(
+        "--job-limit-rate", type=rate, metavar="VELOCIDAD",
+        help="ancho de banda máximo de cada descarga",
+    )
+    parser.add_argument(
+        "--request-rate", type=float, metavar="N",
+        help="peticiones HTTP por segundo como máximo a cada host",
+    )
+    parser.add_argument(
+        "--metrics-json", metavar="ARCHIVO",
+        help="escribir la duración de cada fase de cada trabajo como JSON, una por línea ('-' para stdout)",
+    )
+    parser.add_argument(
+        "--metrics-port", type=int, metavar="PUERTO",
+        help="servir las métricas en formato Prometheus en http://127.0.0.1:PUERTO/metrics",
+    )
+    parser.add_argument(
+        "--no-tags", action="store_true",
+        help="no escribir etiquetas (título, canal, fecha, ID del video) ni portada",
+    )
+    parser.add_argument(
+        "--no-cover", action="store_true",
+        help="no incrustar la miniatura del video como portada",
+    )
+    parser.add_argument(
+        "--staging-dir", metavar="CARPETA",
+        help="carpeta de las descargas y conversiones en curso (por defecto ~/.cache/ytmp3/staging); "
+             "mejor en un disco local rápido o en tmpfs, p. ej. /dev/shm/ytmp3",
+    )
+    parser.add_argument(
+        "--no-cache", action="store_true",
+        help="no usar las cachés de metadatos, de archivos convertidos ni de portadas (~/.cache/ytmp3)",
+    )
+
+
+def check_engine_arguments(parser, args):
+    """Rechaza con parser.error las combinaciones de add_engine_arguments que no se pueden cumplir"""
+    if (args.normalize is not None or args.trim_silence) and args.transcoder == "moviepy":
+        parser.error("--normalize y --trim-silence solo están disponibles con ffmpeg, no con --transcoder moviepy")
+    if args.outputs and args.transcoder == "moviepy":
+        parser.error("--outputs convierte siempre con ffmpeg: no se puede combinar con --transcoder moviepy")
+
+
+def build_engine(args):
+    """Configura la red y crea el Engine con las opciones de add_engine_arguments"""
+    # Todas las peticiones (incluidas las de pytubefix) comparten conexiones
+    net.configure(max_per_host=args.pool_size, request_rate=args.request_rate)
+    net.install()
+
+    normalize = None
+    if args.normalize is not None or args.trim_silence:
+        normalize = Normalizer(target=args.normalize, trim_silence=args.trim_silence)
+    if args.outputs:
+        transcoder = FanOutTranscoder(args.outputs, normalize=normalize)
+    else:
+        transcoder = get_transcoder(args.transcoder, output_format=args.format, bitrate=args.bitrate,
+                                    normalize=normalize)
+    if args.processes:
+        # multiprocessing y asyncio solo se importan si se usan las opciones que los necesitan
+        from .farm import TranscodeFarm
+        transcoder = TranscodeFarm(transcoder, workers=args.convert_workers)
+    thumbnail_cache = None
+    if not args.no_cover and not args.no_tags:
+        directory = None
+        if args.no_cache:
+            # Sin caché, las portadas solo se guardan mientras dura la ejecución
+            directory = tempfile.mkdtemp(prefix="ytmp3-thumbnails-")
+            atexit.register(shutil.rmtree, directory, True)
+        thumbnail_cache = ThumbnailCache(directory)
+    retry = RetryPolicy(max_attempts=args.retries + 1)
+    engine = Engine(
+        download_workers=args.workers,
+        convert_workers=args.convert_workers,
+        streaming=args.stream,
+        transcoder=transcoder,
+        metadata_cache=None if args.no_cache else MetadataCache(),
+        output_cache=None if args.no_cache else OutputCache(),
+        # Una sola política: los reintentos de la descarga no se suman a los del motor
+        downloader=SegmentedDownloader(connections=args.connections, retry=retry),
+        selection=args.select,
+        retry=retry,
+        rate_limit=RateLimiter(bandwidth=args.limit_rate),
+        job_bandwidth=args.job_limit_rate,
+        tagging=not args.no_tags,
+        thumbnail_cache=thumbnail_cache,
+        staging=StagingArea(args.staging_dir),
+    )
+    # Lo que dejó a medias una ejecución anterior se termina o se borra antes de empezar
+    recovery = engine.staging.open()
+    if recovery.published or recovery.removed:
+        print(f"Recuperación de {engine.staging.directory}: {recovery.published} archivos terminados de "
+              f"publicar, {recovery.removed} restos borrados", file=sys.stderr)
+    return engine
+
+
+def start_metrics(args):
+    """
+    Crea el colector de --metrics-json y --metrics-port. Devuelve
+    (colector, recursos que hay que cerrar al terminar), o (None, []).
+    """
+    if not args.metrics_json and args.metrics_port is None:
+        return None, []
+    collector = MetricsCollector()
+    resources = []
+    if args.metrics_json == "-":
+        collector.add_sink(JSONLinesSpanSink(sys.stdout))
+    elif args.metrics_json:
+        metrics_file = open(args.metrics_json, "a", encoding="utf-8")
+        resources.append(metrics_file)
+        collector.add_sink(JSONLinesSpanSink(metrics_file))
+    if args.metrics_port is not None:
+        server = MetricsServer(collector, args.metrics_port).start()
+        resources.append(server)
+        print(f"Métricas en http://{server.host}:{server.port}/metrics", file=sys.stderr)
+    return collector, resources
+
+
+def print_phase_summary(collector):
+    """Muestra cuánto tiempo se fue en cada fase, sumando todos los trabajos"""
+    phases = sorted(collector.summary().items(), key=lambda item: item[1][1], reverse=True)
+    if phases:
+        print(
+            "Tiempo por fase: " + ", ".join(f"{phase} {total:.1f} s ({count})" for phase, (count, total) in phases),
+            file=sys.stderr,
+        )
+
+
+def print_farm_stats(farm):
+    """Muestra cuánto ha trabajado cada proceso de conversión"""
+    for worker in farm.stats():
+        cpu = "-" if worker.cpu is None else worker.cpu
+        print(
+            f"Proceso de conversión {worker.index} (núcleo {cpu}): {worker.tasks} conversiones, "
+            f"{worker.busy:.1f} s ocupado ({worker.utilization:.0%}), {worker.cpu_time:.1f} s de CPU",
+            file=sys.stderr,
+        )
+
+
+def print_engine_stats(engine):
+    """Muestra el uso de las cachés y de los procesos de conversión"""
+    if engine.metadata_cache is not None:
+        stats = engine.metadata_cache.stats()
+        print(f"Caché de metadatos: {stats['hits']} aciertos, {stats['misses']} fallos", file=sys.stderr)
+    if engine.output_cache is not None:
+        stats = engine.output_cache.stats()
+        print(f"Archivos reutilizados: {stats['hits']}", file=sys.stderr)
+    if engine.transcoder.name == "farm":
+        print_farm_stats(engine.transcoder)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ytmp3",
+        description="Descarga audio de YouTube y lo convierte a MP3 sin interfaz gráfica.",
+    )
+    parser.add_argument("urls_file", help="archivo con una URL por línea ('-' para stdin)")
+    parser.add_argument(
+        "-o", "--output-dir",
+        default=os.path.join(os.path.expanduser("~"), "Downloads"),
+        help="carpeta de destino (por defecto ~/Downloads)",
+    )
+    add_engine_arguments(parser)
+    parser.add_argument(
+        "--resolve-workers", type=int, default=0,
+        help="resolver por adelantado los metadatos con hasta N consultas simultáneas "
+             "(por defecto se resuelven en cada descarga)",
+    )
+    parser.add_argument("--itag", type=int, help="itag del stream de audio (por defecto lo elige --select)")
+    parser.add_argument(
+        "--clip", type=segment, action="append", metavar="INICIO-FIN",
+        help="convertir solo ese fragmento, p. ej. 1:30-2:45 (se puede repetir); "
+             "se descargan solo los bytes necesarios si el stream tiene índice",
+    )
+    parser.add_argument(
+        "--chapters", type=chapter_list, nargs="?", const=True, metavar="N,...",
+        help="un archivo por capítulo del video (todos o los indicados, p. ej. 1,3), en una sola pasada",
+    )
+    parser.add_argument(
+        "--progress-interval", type=float, default=1.0,
+        help="segundos entre dos líneas de progreso total (por defecto 1)",
+    )
+    parser.add_argument(
+        "--progress-json", metavar="ARCHIVO",
+        help="escribir el progreso como JSON, una instantánea por línea ('-' para stdout)",
+    )
+    parser.add_argument("-q", "--quiet", action="store_true", help="no mostrar el progreso")
+    return parser
+
+
+def make_printer():
+    """Crea un callback que muestra los cambios de estado de cada trabajo en stderr"""
+    def print_event(event):
+        job = event.job
+        if event.kind == "state":
+            print(f"[{job.id}] {event.value}: {job.title or job.url}", file=sys.stderr)
+        elif event.kind == "done":
+            print(f"[{job.id}] Descarga completada: {event.value}", file=sys.stderr)
+        elif event.kind == "retry":
+            print(f"[{job.id}] Reintento {job.retries} en {job.retry_delay:.1f} s: {event.value}", file=sys.stderr)
+        elif event.kind == "error":
+            print(f"[{job.id}] Error: {event.value}", file=sys.stderr)
+        elif event.kind == "cancelled":
+            print(f"[{job.id}] Cancelado", file=sys.stderr)
+
+    return print_event
+
+
+def cancel_all(engine):
+    """
+    Ctrl+C: se detienen descargas y conversiones; las descargas a medias se
+    conservan para reanudarlas en la siguiente ejecución. Hay que hacerlo
+    antes de salir del with, que si no espera a todos los trabajos.
+    """
+    print("Cancelando...", file=sys.stderr)
+    engine.cancel(keep_download=True)
+    return engine.wait()
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    check_engine_arguments(parser, args)
+    if (args.clip or args.chapters) and (args.normalize is not None or args.trim_silence):
+        parser.error("--normalize y --trim-silence no se pueden combinar con --clip ni --chapters")
+
+    if not os.path.isdir(args.output_dir):
+        print(f"La carpeta de destino no existe: {args.output_dir}", file=sys.stderr)
+        return 2
+
+    urls = read_urls(args.urls_file)
+    invalid = [url for url in urls if not (is_collection_url(url) or is_valid_youtube_url(url))]
+    for url in invalid:
+        print(f"URL no válida, se omite: {url}", file=sys.stderr)
+
+    try:
+        engine = build_engine(args)
+    except EngineError as e:
+        # P. ej. --normalize con --transcoder auto cuando no hay ffmpeg y se usaría moviepy
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    # El progreso de cada bloque se agrupa antes de llegar a la consola o al JSON
+    aggregator = ProgressAggregator(interval=args.progress_interval)
+    if not args.quiet:
+        aggregator.add_sink(ConsoleSink())
+    progress_file = None
+    if args.progress_json == "-":
+        aggregator.add_sink(JSONLinesSink(sys.stdout))
+    elif args.progress_json:
+        progress_file = open(args.progress_json, "a", encoding="utf-8")
+        aggregator.add_sink(JSONLinesSink(progress_file))
+    printer = None if args.quiet else make_printer()
+    metrics, metrics_resources = start_metrics(args)
+
+    def on_event(event):
+        if printer is not None:
+            printer(event)
+        aggregator.handle(event)
+        if metrics is not None:
+            metrics.handle(event)
+
+    engine.on_event = on_event
+
+    failed_lists = []
+
+    def on_list_error(url, error):
+        failed_lists.append(url)
+        print(f"No se pudo leer la lista {url}: {error}", file=sys.stderr)
+
+    # Las listas se leen página a página mientras avanzan las descargas
+    valid = expand_urls((url for url in urls if url not in invalid), on_error=on_list_error)
+    if args.resolve_workers > 0:
+        from .aio import AsyncEngine
+        with AsyncEngine(engine, max_in_flight=args.resolve_workers) as aio:
+            try:
+                jobs = aio.run(valid, args.output_dir, itag=args.itag, segments=args.clip, chapters=args.chapters)
+            except KeyboardInterrupt:
+                jobs = cancel_all(engine)
+    else:
+        with engine:
+            try:
+                jobs = engine.submit_many(
+                    Job(url, args.output_dir, itag=args.itag, segments=args.clip, chapters=args.chapters)
+                    for url in valid
+                )
+                engine.wait(jobs)
+            except KeyboardInterrupt:
+                jobs = cancel_all(engine)
+
+    if progress_file is not None:
+        progress_file.close()
+    for resource in metrics_resources:
+        resource.close()
+
+    failed = [job for job in jobs if job.state == JobState.FAILED]
+    cancelled = [job for job in jobs if job.state == JobState.CANCELLED]
+    completed = len(jobs) - len(failed) - len(cancelled)
+    summary = f"{completed} completados, {len(failed)} con errores"
+    if cancelled:
+        summary += f", {len(cancelled)} cancelados"
+    print(summary, file=sys.stderr)
+    if not args.quiet:
+        print_engine_stats(engine)
+        if metrics is not None:
+            print_phase_summary(metrics)
+    if cancelled:
+        return 130
+    return 1 if failed or invalid or failed_lists else 0
@@ -0,0 +1,195 @@
+"""
+Modo distribuido
+----------------------------------------------------
+Órdenes para repartir una lista larga entre varios trabajadores que comparten
+una cola (ver broker.py y worker.py):
+
+    python -m ytmp3.distributed submit urls.txt -o /srv/music --broker /srv/queue.sqlite3
+    python -m ytmp3.distributed worker --broker /srv/queue.sqlite3
+    python -m ytmp3.distributed status --broker /srv/queue.sqlite3
+
+Se pueden lanzar tantos trabajadores como se quiera, en esta máquina o en
+otras que vean el mismo archivo de la cola y la misma carpeta de destino.
+"""
+
+import argparse
+import itertools
+import os
+import signal
+import sys
+
+from .broker import LEASE_TIME, Broker, TaskState, default_broker_path
+from .cli import (
+    add_engine_arguments,
+    check_engine_arguments,
+    build_engine,
+    make_printer,
+    print_engine_stats,
+    print_phase_summary,
+    read_urls,
+    start_metrics,
+)
+from .engine import is_valid_youtube_url
+from .errors import EngineError
+from .playlists import expand_urls, is_collection_url
+from .worker import Worker
+
+SUBMIT_BATCH = 100
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="ytmp3.distributed",
+        description="Reparte descargas entre varios trabajadores con una cola compartida.",
+    )
+    parser.add_argument(
+        "--broker", default=default_broker_path(),
+        help=f"archivo SQLite de la cola (por defecto {default_broker_path()})",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    submit = commands.add_parser("submit", help="encolar las URLs de un archivo")
+    submit.add_argument("urls_file", help="archivo con una URL por línea ('-' para stdin)")
+    submit.add_argument(
+        "-o", "--output-dir",
+        default=os.path.join(os.path.expanduser("~"), "Downloads"),
+        help="carpeta de destino (por defecto ~/Downloads)",
+    )
+    submit.add_argument("--itag", type=int, help="itag del stream de audio (por defecto lo elige --select)")
+    submit.add_argument("--max-attempts", type=int, default=3, help="intentos por video (por defecto 3)")
+    submit.add_argument("--wait", action="store_true", help="esperar a que terminen y mostrar el resultado")
+
+    worker = commands.add_parser("worker", help="procesar tareas de la cola")
+    add_engine_arguments(worker)
+    worker.add_argument("-o", "--output-dir", help="carpeta de destino en lugar de la de cada tarea")
+    worker.add_argument(
+        "--capacity", type=int, default=None,
+        help="tareas en proceso a la vez (por defecto, las descargas simultáneas)",
+    )
+    worker.add_argument(
+        "--lease-time", type=float, default=LEASE_TIME,
+        help=f"segundos sin noticias tras los que otro trabajador retoma la tarea (por defecto {LEASE_TIME})",
+    )
+    worker.add_argument("--exit-when-idle", action="store_true", help="terminar cuando la cola se vacíe")
+    worker.add_argument("--name", help="nombre del trabajador (por defecto máquina:pid)")
+    worker.add_argument("-q", "--quiet", action="store_true", help="no mostrar el progreso")
+
+    status = commands.add_parser("status", help="mostrar el estado de la cola")
+    status.add_argument("--failed", action="store_true", help="listar las tareas fallidas con su error")
+    return parser
+
+
+def print_summary(tasks):
+    done = sum(1 for task in tasks if task.state == TaskState.DONE)
+    failed = [task for task in tasks if task.state == TaskState.FAILED]
+    for task in failed:
+        print(f"[{task.id}] {task.url}: {task.error}", file=sys.stderr)
+    print(f"{done} completados, {len(failed)} con errores", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def submit(args, broker):
+    if not os.path.isdir(args.output_dir):
+        print(f"La carpeta de destino no existe: {args.output_dir}", file=sys.stderr)
+        return 2
+
+    urls = read_urls(args.urls_file)
+    invalid = [url for url in urls if not (is_collection_url(url) or is_valid_youtube_url(url))]
+    for url in invalid:
+        print(f"URL no válida, se omite: {url}", file=sys.stderr)
+
+    def on_list_error(url, error):
+        print(f"No se pudo leer la lista {url}: {error}", file=sys.stderr)
+
+    # Se encola por tandas para que los trabajadores empiecen mientras se leen las listas
+    valid = expand_urls((url for url in urls if url not in invalid), on_error=on_list_error)
+    ids = []
+    while True:
+        batch = list(itertools.islice(valid, SUBMIT_BATCH))
+        if not batch:
+            break
+        ids += broker.submit(batch, args.output_dir, itag=args.itag, max_attempts=args.max_attempts)
+    print(f"{len(ids)} tareas encoladas en {broker.path}", file=sys.stderr)
+    if not args.wait:
+        return 0
+    return print_summary(broker.wait(ids))
+
+
+def work(args, broker):
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        print(f"La carpeta de destino no existe: {args.output_dir}", file=sys.stderr)
+        return 2
+
+    engine = build_engine(args)
+    printer = None if args.quiet else make_printer()
+    # Un trabajador de larga duración se vigila mejor con --metrics-port
+    metrics, metrics_resources = start_metrics(args)
+
+    def on_event(event):
+        if printer is not None:
+            printer(event)
+        if metrics is not None:
+            metrics.handle(event)
+
+    engine.on_event = on_event
+    worker = Worker(
+        broker, engine, name=args.name, capacity=args.capacity, lease_time=args.lease_time,
+        output_dir=args.output_dir,
+    )
+
+    # SIGTERM (p. ej. al parar el servicio) deja de tomar tareas y termina las que tiene
+    signal.signal(signal.SIGTERM, lambda signum, frame: worker.stop())
+    print(f"Trabajador {worker.name} esperando tareas de {broker.path}", file=sys.stderr)
+    with engine:
+        try:
+            worker.run(exit_when_idle=args.exit_when_idle)
+        except KeyboardInterrupt:
+            # Ctrl+C: las tareas en curso se cancelan y vuelven a la cola
+            print("Deteniendo...", file=sys.stderr)
+            worker.stop(cancel=True)
+            engine.wait()
+
+    for resource in metrics_resources:
+        resource.close()
+    print(f"{worker.completed} completados, {worker.failed} intentos fallidos", file=sys.stderr)
+    if not args.quiet:
+        print_engine_stats(engine)
+        if metrics is not None:
+            print_phase_summary(metrics)
+    return 0
+
+
+def status(args, broker):
+    counts = broker.counts()
+    print(
+        f"En cola: {counts[TaskState.QUEUED]}, en proceso: {counts[TaskState.LEASED]}, "
+        f"completadas: {counts[TaskState.DONE]}, fallidas: {counts[TaskState.FAILED]}"
+    )
+    for task in broker.tasks(state=TaskState.LEASED):
+        print(f"[{task.id}] {task.worker} (intento {task.attempts}/{task.max_attempts}): {task.url}")
+    if args.failed:
+        for task in broker.tasks(state=TaskState.FAILED):
+            print(f"[{task.id}] {task.url}: {task.error}")
+    return 0
+
+
+COMMANDS = {"submit": submit, "worker": work, "status": status}
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "worker":
+        check_engine_arguments(parser, args)
+    broker = Broker(args.broker)
+    try:
+        return COMMANDS[args.command](args, broker)
+    except EngineError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        broker.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
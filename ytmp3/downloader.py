@@ -0,0 +1,325 @@
+"""
+Descargas por segmentos reanudables
+----------------------------------------------------
+Descarga una URL en segmentos HTTP Range repartidos entre varias conexiones.
+El progreso se guarda junto al archivo de destino (<destino>.part y
+<destino>.part.json), de modo que una descarga interrumpida por un corte
+de red, un cierre del programa o un reinicio continúa donde se quedó.
+Con ranges solo se descargan esos rangos de bytes (ver segments.py).
+"""
+
+import http.client
+import json
+import os
+import queue
+import re
+import threading
+import time
+import urllib.request
+
+from . import net
+from .errors import EngineError, JobCancelled, TransientError, download_error
+from .retry import RetryPolicy, spends_attempt
+from .streaming import CHUNK_SIZE, RANGE_SIZE, iter_stream_chunks
+
+DEFAULT_HEADERS = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+
+
+def probe_size(url, timeout=30):
+    """
+    Devuelve (tamaño, admite_rangos) pidiendo solo el primer byte.
+    El tamaño es None si el servidor no lo indica.
+    """
+    headers = dict(DEFAULT_HEADERS, Range="bytes=0-0")
+    request = urllib.request.Request(url, headers=headers)
+    with net.urlopen(request, timeout=timeout) as response:
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes \d+-\d+/(\d+)", content_range)
+            if match:
+                return int(match.group(1)), True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length else None), False
+
+
+class DownloadState:
+    """Bytes ya escritos en disco de cada segmento, guardados en un archivo JSON"""
+
+    def __init__(self, path, size, segment_size, ranges=None):
+        self.path = path
+        self.size = size
+        self.segment_size = segment_size
+        self.ranges = ranges
+        self.done = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path, size, segment_size, ranges=None):
+        """Carga el estado previo si corresponde a la misma descarga; si no, uno vacío"""
+        state = cls(path, size, segment_size, ranges)
+        try:
+            with open(path, encoding="utf-8") as handle:
+                data = json.load(handle)
+        except (OSError, ValueError):
+            return state
+        saved_ranges = data.get("ranges")
+        if saved_ranges is not None:
+            saved_ranges = [tuple(item) for item in saved_ranges]
+        if data.get("size") == size and data.get("segment_size") == segment_size and saved_ranges == ranges:
+            state.done = {int(index): done for index, done in data.get("done", {}).items()}
+        return state
+
+    @property
+    def downloaded(self):
+        with self._lock:
+            return sum(self.done.values())
+
+    def get(self, index):
+        with self._lock:
+            return self.done.get(index, 0)
+
+    def advance(self, index, size):
+        with self._lock:
+            self.done[index] = self.done.get(index, 0) + size
+
+    def save(self):
+        with self._lock:
+            data = {"size": self.size, "segment_size": self.segment_size, "done": self.done}
+            if self.ranges is not None:
+                data["ranges"] = self.ranges
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as handle:
+                json.dump(data, handle)
+            os.replace(temp_path, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class SegmentedDownloader:
+    """
+    Descargador por rangos con varias conexiones en paralelo.
+
+    Cada segmento se reintenta desde el último byte recibido si la conexión
+    se corta o el servidor devuelve un error pasajero (hasta max_retries
+    veces seguidas sin avanzar), con las esperas de retry (un RetryPolicy).
+    Con retry, su max_attempts sustituye a max_retries. Las descargas sin
+    rangos se reintentan desde el principio con la misma política.
+    """
+
+    def __init__(self, connections=4, segment_size=RANGE_SIZE, chunk_size=CHUNK_SIZE, timeout=30,
+                 max_retries=5, save_interval=1024 * 1024, retry=None):
+        self.connections = max(1, connections)
+        self.segment_size = segment_size
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.retry = retry or RetryPolicy(max_attempts=max_retries + 1, base_delay=0.4, max_delay=5)
+        # Cada cuántos bytes de un segmento se vuelca el estado a disco
+        self.save_interval = save_interval
+
+    def download(self, url, output_file, filesize=None, on_progress=None, cancel=None, limit=None, ranges=None,
+                 on_retry=None):
+        """
+        Descarga url en output_file y devuelve su ruta.
+        on_progress(descargados, total) se llama con los bytes acumulados.
+        cancel (un CancelToken) se comprueba en cada bloque; al cancelar, lo
+        descargado se conserva para reanudarlo (discard() lo borra).
+        limit (un ratelimit.RateLimiter o LimitChain) frena las peticiones y
+        los bloques recibidos, sumando todas las conexiones.
+        ranges es una lista de rangos (inicio, fin incluidos): si se indica,
+        output_file tiene el tamaño completo pero solo esos bytes, y el total
+        de on_progress es lo que suman los rangos.
+        on_retry(intento, espera, error) se llama antes de cada reintento,
+        como en RetryPolicy.call (desde el hilo de cada conexión).
+        """
+        part_file = output_file + ".part"
+        size, supports_ranges = self.retry.call(lambda: self._probe(url, cancel, limit), cancel=cancel,
+                                                on_retry=on_retry)
+        if filesize is not None and size is not None and size != filesize:
+            raise EngineError(f"El tamaño del stream no coincide ({size} bytes en lugar de {filesize})")
+
+        if ranges is None and size and os.path.isfile(output_file) and os.path.getsize(output_file) == size:
+            # Ya terminada por una ejecución que murió antes de convertirla
+            return output_file
+
+        if not supports_ranges or not size:
+            self.retry.call(lambda: self._download_whole(url, part_file, size, on_progress, cancel, limit),
+                            cancel=cancel, on_retry=on_retry)
+        else:
+            self._download_segments(url, part_file, size, on_progress, cancel, limit, ranges, on_retry)
+
+        os.replace(part_file, output_file)
+        return output_file
+
+    def _probe(self, url, cancel, limit):
+        if limit is not None:
+            limit.request(cancel)
+        try:
+            return probe_size(url, self.timeout)
+        except (OSError, http.client.HTTPException) as e:
+            raise download_error(e)
+
+    def fetch_range(self, url, start, length, cancel=None, limit=None):
+        """
+        Devuelve length bytes de url desde start (menos si el archivo acaba
+        antes), o None si el servidor no admite rangos.
+        """
+        def fetch():
+            if limit is not None:
+                limit.request(cancel)
+            headers = dict(DEFAULT_HEADERS, Range=f"bytes={start}-{start + length - 1}")
+            try:
+                with net.urlopen(urllib.request.Request(url, headers=headers), timeout=self.timeout) as response:
+                    if response.status != 206:
+                        return None
+                    data = response.read()
+            except (OSError, http.client.HTTPException) as e:
+                raise download_error(e)
+            if limit is not None:
+                limit.consume(len(data), cancel)
+            return data
+
+        return self.retry.call(fetch, cancel=cancel)
+
+    def discard(self, output_file):
+        """Borra el archivo parcial y el estado de una descarga"""
+        for path in (output_file + ".part", output_file + ".part.json"):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _download_whole(self, url, part_file, size, on_progress, cancel, limit):
+        """El servidor no admite rangos: descarga sin posibilidad de reanudar"""
+        downloaded = 0
+        chunks = iter_stream_chunks(url, chunk_size=self.chunk_size, timeout=self.timeout, limit=limit,
+                                    cancel=cancel)
+        try:
+            with open(part_file, "wb") as handle:
+                for chunk in chunks:
+                    if cancel is not None:
+                        cancel.check()
+                    handle.write(chunk)
+                    downloaded += len(chunk)
+                    if on_progress is not None:
+                        on_progress(downloaded, size)
+        except (OSError, http.client.HTTPException) as e:
+            raise download_error(e)
+
+    def _download_segments(self, url, part_file, size, on_progress, cancel, limit, ranges=None, on_retry=None):
+        if ranges is not None:
+            ranges = [tuple(item) for item in ranges]
+        state = DownloadState.load(part_file + ".json", size, self.segment_size, ranges)
+        if not os.path.exists(part_file):
+            state.done = {}
+            # Archivo disperso del tamaño final: cada segmento escribe en su posición
+            with open(part_file, "wb") as handle:
+                handle.truncate(size)
+
+        total = size if ranges is None else sum(end - start + 1 for start, end in ranges)
+        pending = queue.Queue()
+        for index, (start, end) in enumerate(self._segments(size, ranges)):
+            if state.get(index) < end - start + 1:
+                pending.put((index, start, end))
+
+        progress_lock = threading.Lock()
+
+        def report():
+            if on_progress is not None:
+                with progress_lock:
+                    on_progress(state.downloaded, total)
+
+        report()
+        errors = []
+        workers = [
+            threading.Thread(
+                target=self._worker,
+                args=(url, part_file, state, pending, report, errors, cancel, limit, on_retry),
+                daemon=True,
+            )
+            for _ in range(min(self.connections, pending.qsize()))
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        state.save()
+
+        if errors:
+            # Si se canceló, los demás errores son consecuencia de ello
+            cancelled = [error for error in errors if isinstance(error, JobCancelled)]
+            raise (cancelled or errors)[0]
+        state.remove()
+
+    def _segments(self, size, ranges):
+        """(inicio, fin) de cada segmento: todo el archivo o solo los rangos pedidos"""
+        for start, end in ranges or [(0, size - 1)]:
+            for offset in range(start, end + 1, self.segment_size):
+                yield offset, min(offset + self.segment_size - 1, end)
+
+    def _worker(self, url, part_file, state, pending, report, errors, cancel, limit, on_retry):
+        with open(part_file, "r+b") as handle:
+            while not errors:
+                try:
+                    index, start, end = pending.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    self._fetch_segment(url, handle, state, index, start, end, report, cancel, limit, on_retry)
+                except Exception as e:
+                    errors.append(e)
+
+    def _fetch_segment(self, url, handle, state, index, start, end, report, cancel, limit, on_retry):
+        offset = start + state.get(index)
+        failures = 0
+        while offset <= end:
+            unsaved = 0
+            try:
+                headers = dict(DEFAULT_HEADERS, Range=f"bytes={offset}-{end}")
+                request = urllib.request.Request(url, headers=headers)
+                if limit is not None:
+                    limit.request(cancel)
+                with net.urlopen(request, timeout=self.timeout) as response:
+                    if response.status != 206:
+                        raise EngineError("El servidor dejó de aceptar descargas por rangos")
+                    handle.seek(offset)
+                    while offset <= end:
+                        if cancel is not None:
+                            cancel.check()
+                        chunk = response.read(min(self.chunk_size, end - offset + 1))
+                        if not chunk:
+                            raise ConnectionError("La conexión se cerró antes de terminar el segmento")
+                        handle.write(chunk)
+                        offset += len(chunk)
+                        unsaved += len(chunk)
+                        failures = 0
+                        if limit is not None:
+                            limit.consume(len(chunk), cancel)
+                        if unsaved >= self.save_interval:
+                            self._checkpoint(handle, state, index, unsaved)
+                            report()
+                            unsaved = 0
+            except (OSError, http.client.HTTPException, TransientError) as e:
+                # Solo se reintentan los errores pasajeros (red, 5xx, 429)
+                error = download_error(e)
+                if spends_attempt(error):
+                    failures += 1
+                if not self.retry.should_retry(failures, error):
+                    raise error
+                delay = self.retry.delay(failures, error)
+                if on_retry is not None:
+                    on_retry(failures, delay, error)
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise JobCancelled()
+            finally:
+                if unsaved:
+                    self._checkpoint(handle, state, index, unsaved)
+                    report()
+
+    def _checkpoint(self, handle, state, index, size):
+        # Solo se anotan como hechos los bytes que ya están en el sistema operativo
+        handle.flush()
+        state.advance(index, size)
+        state.save()
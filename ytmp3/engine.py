@@ -0,0 +1,850 @@
+"""
+Motor de descarga y conversión
+----------------------------------------------------
+Contiene toda la lógica de búsqueda, descarga y conversión a MP3 sin depender
+de Tkinter. Los frontends crean objetos Job, los envían al Engine y reciben
+eventos de progreso a través de callbacks.
+"""
+
+import hashlib
+import itertools
+import os
+import queue
+import re
+import threading
+import time
+from collections import namedtuple
+
+from .cancel import CancelToken
+from .downloader import SegmentedDownloader
+from .errors import EngineError, JobCancelled, connection_error, download_error
+from .metrics import measure, queue_span
+from .models import Segment, StreamInfo, VideoInfo
+from .ratelimit import LimitChain, RateLimiter
+from .retry import RetryPolicy
+from .segments import plan_ranges, segment_label
+from .selection import DEFAULT_POLICY, abr_kbps
+from .staging import LOCK_POLL_INTERVAL, DownloadLock, StagingArea
+from .streaming import encode_stream, iter_stream_chunks
+from .tagging import read_video_id, tags_for
+from .transcoders import FFmpegTranscoder, get_transcoder
+
+# Patrón para URLs de YouTube; el último grupo es el ID de 11 caracteres
+YOUTUBE_REGEX = r'(https?://)?(www\.)?(youtube|youtu|youtube-nocookie)\.(com|be)/(watch\?v=|embed/|v/|.+\?v=)?([^&=%\?]{11})'
+
+
+def is_valid_youtube_url(url):
+    """Indica si la URL parece ser de un video de YouTube"""
+    return re.match(YOUTUBE_REGEX, url) is not None
+
+
+def extract_video_id(url):
+    """Devuelve el ID de 11 caracteres del video o None si la URL no es válida"""
+    youtube_regex_match = re.match(YOUTUBE_REGEX, url)
+    if youtube_regex_match:
+        return youtube_regex_match.group(6)
+    return None
+
+
+def safe_filename(title):
+    """Elimina del título los caracteres no válidos para un nombre de archivo"""
+    return "".join([c for c in title if c.isalpha() or c.isdigit() or c in " ._-"]).rstrip()
+
+
+class JobState:
+    PENDING = "pending"
+    RESOLVING = "resolving"
+    DOWNLOADING = "downloading"
+    CONVERTING = "converting"
+    DONE = "done"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+    FINISHED = (DONE, FAILED, CANCELLED)
+
+
+# Evento emitido por el motor. kind es "state", "progress" (descarga),
+# "convert_progress", "retry", "span", "done", "error" o "cancelled"; value es
+# el nuevo estado, el porcentaje, un metrics.Span con la duración de una fase,
+# la ruta del MP3 o el EngineError (el que provocó el reintento en "retry").
+JobEvent = namedtuple("JobEvent", ["job", "kind", "value"])
+
+# Resumen del progreso de todos los trabajos enviados a un Engine
+BatchProgress = namedtuple(
+    "BatchProgress",
+    ["total", "done", "failed", "active", "bytes_downloaded", "total_bytes", "percentage", "cancelled"],
+)
+
+
+class LongestFirstQueue:
+    """
+    Cola de conversión que entrega primero los trabajos más largos. Cuando
+    hay más conversiones pendientes que núcleos, empezar por las largas y
+    dejar que las cortas rellenen los huecos del final reduce el tiempo total
+    del lote. None (la señal de parada) va siempre detrás de los trabajos.
+    """
+
+    def __init__(self, duration):
+        self._duration = duration
+        self._queue = queue.PriorityQueue()
+        self._order = itertools.count()
+
+    def put(self, job):
+        priority = float("inf") if job is None else -(self._duration(job) or 0)
+        self._queue.put((priority, next(self._order), job))
+
+    def get(self):
+        return self._queue.get()[2]
+
+
+class Job:
+    """Trabajo de descarga y conversión de un único video"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, url, output_dir, itag=None, info=None, stream=None, on_event=None, rate_limit=None,
+                 segments=None, chapters=None):
+        self.id = next(Job._ids)
+        self.url = url
+        self.output_dir = output_dir
+        self.itag = itag
+        # Metadatos ya resueltos (p. ej. por una búsqueda previa en la interfaz)
+        self.info = info
+        self.stream = stream
+        self.on_event = on_event
+        # Límites propios del trabajo, además de los del motor; se pueden cambiar en marcha
+        self.rate_limit = rate_limit or RateLimiter()
+        # Tramos a convertir (models.Segment), cada uno a sus archivos; con
+        # chapters se toman de los capítulos del video: True para todos o una
+        # lista de números (desde 1)
+        self.segments = segments
+        self.chapters = chapters
+
+        self.state = JobState.PENDING
+        self.progress = 0.0
+        self.convert_progress = 0.0
+        # Reintentos hechos tras errores pasajeros y espera del último
+        self.retries = 0
+        self.retry_delay = None
+        self.bytes_downloaded = 0
+        self.total_bytes = None
+        self.temp_file = None
+        # staging.DownloadLock de temp_file si está en downloads/
+        self._temp_lock = None
+        # Con varias salidas (transcoders.FanOutTranscoder) output_file es la primera
+        self.output_file = None
+        self.output_files = []
+        # Etiquetas y portada que se escriben al convertir (tagging.Tags)
+        self.tags = None
+        # True si el resultado se reutilizó de la caché de salidas
+        self.cached = False
+        self.error = None
+        # Segundos de cada fase (ver metrics.py) y momento en que entró en la última cola
+        self.timings = {}
+        self.enqueued_at = None
+        self.cancel_token = CancelToken()
+        # Si al cancelar se conserva la descarga a medias (ver cancel)
+        self.keep_download = False
+        self._finished = threading.Event()
+
+    @property
+    def title(self):
+        return self.info.title if self.info else None
+
+    @property
+    def cancelled(self):
+        return self.cancel_token.cancelled
+
+    def cancel(self, keep_download=False):
+        """
+        Pide cancelar el trabajo. Las descargas se detienen en el siguiente
+        bloque, ffmpeg se termina enseguida y se borran los archivos parciales.
+        Con keep_download (al cerrar el programa o detener un trabajador) la
+        descarga a medias se conserva para que otra ejecución la reanude.
+        """
+        self.keep_download = keep_download
+        self.cancel_token.cancel()
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Espera a que el trabajo termine; devuelve False si vence el timeout"""
+        return self._finished.wait(timeout)
+
+    def result(self, timeout=None):
+        """Espera al trabajo y devuelve la ruta del MP3 o lanza su error"""
+        if not self.wait(timeout):
+            raise TimeoutError(f"El trabajo {self.id} no terminó a tiempo")
+        if self.error is not None:
+            raise self.error
+        return self.output_file
+
+    def __repr__(self):
+        return f"Job(id={self.id}, url={self.url!r}, state={self.state!r})"
+
+
+class Engine:
+    """
+    Ejecuta trabajos de descarga y conversión sin interfaz gráfica.
+
+    Los trabajos enviados con submit() pasan por dos colas: un grupo de hilos
+    de descarga (limitado por la red) y otro de conversión (limitado por la
+    CPU), de modo que mientras un trabajo se convierte otros siguen bajando.
+    Las conversiones pendientes se atienden de la más larga a la más corta.
+
+    Con streaming=True la descarga se envía directamente a ffmpeg y la
+    conversión ocurre durante la transferencia, sin archivo temporal. No se
+    aplica si el transcoder normaliza el volumen, que necesita el audio entero,
+    ni con varias salidas.
+
+    transcoder decide cómo se convierte el audio (ver transcoders.py); por
+    defecto se usa ffmpeg directamente y moviepy solo si ffmpeg no existe.
+    Con un farm.TranscodeFarm las conversiones se hacen en procesos aparte.
+
+    Si se indica metadata_cache (ver cache.py), resolve() consulta primero
+    la caché y solo llama a YouTube en caso de fallo. Con output_cache, los
+    trabajos cuyo resultado ya existe terminan sin descargar nada.
+
+    downloader descarga los streams a un archivo temporal; por defecto un
+    SegmentedDownloader, que usa varias conexiones y reanuda descargas.
+
+    retry (un retry.RetryPolicy) decide cuántas veces y con qué esperas se
+    repiten la resolución y la descarga si fallan con un error pasajero. Las
+    descargas por URL solo las reintenta downloader, con su propia política
+    (la de retry en el descargador por defecto), para que los reintentos de
+    uno no se multipliquen por los del otro.
+
+    rate_limit (un ratelimit.RateLimiter) limita el ancho de banda y las
+    peticiones de todas las descargas juntas; cada Job tiene además el suyo,
+    que empieza con job_bandwidth bytes por segundo si el trabajo no fija
+    otro límite. Ambos se pueden ajustar mientras las descargas avanzan.
+
+    Con tagging, cada archivo lleva el título, el canal, la fecha y el ID del
+    video, escritos por ffmpeg al codificar; con thumbnail_cache (un
+    cache.ThumbnailCache) también la miniatura como portada. Solo se aplica a
+    los transcoders que declaran writes_tags.
+
+    Las descargas y las conversiones se hacen en staging (un
+    staging.StagingArea) y cada salida se publica en su carpeta de destino
+    con un cambio de nombre atómico, así que nunca queda un archivo a medias.
+    Los trabajos de un mismo stream comparten su descarga, también con otros
+    procesos que usen la misma carpeta de staging (ver staging.DownloadLock).
+    Si dos videos dan el mismo nombre de archivo, en la misma ejecución o
+    porque el destino ya tiene el de otro video, el del segundo lleva además
+    su ID.
+    """
+
+    def __init__(self, on_event=None, download_workers=4, convert_workers=None, streaming=False,
+                 transcoder=None, metadata_cache=None, output_cache=None, downloader=None,
+                 selection=None, retry=None, rate_limit=None, job_bandwidth=None, tagging=True,
+                 thumbnail_cache=None, staging=None):
+        # Callback global para todos los eventos de todos los trabajos
+        self.on_event = on_event
+        self.streaming = streaming
+        self.transcoder = transcoder or get_transcoder()
+        self.metadata_cache = metadata_cache
+        self.output_cache = output_cache
+        self.retry = retry or RetryPolicy()
+        self.downloader = downloader or SegmentedDownloader(retry=self.retry)
+        # Política para elegir el stream de los trabajos sin itag (selection.SelectionPolicy)
+        self.selection = selection or DEFAULT_POLICY
+        self.rate_limit = rate_limit or RateLimiter()
+        self.job_bandwidth = job_bandwidth
+        self.tagging = tagging
+        self.thumbnail_cache = thumbnail_cache
+        self.staging = staging or StagingArea()
+        self.download_workers = max(1, download_workers)
+        self.convert_workers = max(1, convert_workers or os.cpu_count() or 1)
+
+        self._download_queue = queue.Queue()
+        self._convert_queue = LongestFirstQueue(self._duration)
+        self._download_threads = []
+        self._convert_threads = []
+        self._jobs = []
+        # Ruta de salida sin extensión -> ID del video que la usa en esta ejecución
+        self._claimed_paths = {}
+        self._lock = threading.Lock()
+        self._shutdown = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown(wait=True)
+
+    def resolve(self, url, cancel=None, on_retry=None):
+        """
+        Obtiene los metadatos del video y sus streams de audio. Los errores
+        pasajeros se reintentan según self.retry (ver RetryPolicy.call).
+        """
+        video_id = extract_video_id(url)
+        if self.metadata_cache is not None and video_id:
+            info = self.metadata_cache.get(video_id)
+            if info is not None:
+                info.url = url
+                return info
+
+        info = self.retry.call(lambda: self._fetch_info(url, video_id), cancel=cancel, on_retry=on_retry)
+        if self.metadata_cache is not None:
+            self.metadata_cache.put(info)
+        return info
+
+    def _fetch_info(self, url, video_id):
+        """Consulta a YouTube los metadatos del video (sin caché)"""
+        # pytubefix tarda en importarse: se carga con la primera consulta (o con prewarm)
+        from pytubefix import YouTube
+
+        try:
+            yt = YouTube(url)
+        except Exception as e:
+            raise connection_error(e)
+
+        try:
+            title = yt.title
+            duration = yt.length
+            streams = yt.streams.filter(only_audio=True).order_by('abr').desc()
+        except Exception as e:
+            raise connection_error(e)
+
+        try:
+            # Solo para las etiquetas: si faltan, los archivos salen sin ellas
+            author = yt.author
+            publish_date = yt.publish_date.strftime("%Y-%m-%d") if yt.publish_date else None
+            thumbnail_url = yt.thumbnail_url
+        except Exception:
+            author = publish_date = thumbnail_url = None
+
+        try:
+            chapters = [Segment(chapter.title, chapter.start_seconds, chapter.start_seconds + chapter.duration)
+                        for chapter in yt.chapters]
+        except Exception:
+            # Los capítulos salen de la descripción y no todos los videos los tienen
+            chapters = []
+
+        if not streams:
+            raise EngineError("No se encontraron streams de audio para este video. Podría estar protegido.")
+
+        return VideoInfo(
+            video_id or yt.video_id,
+            url,
+            title,
+            [StreamInfo.from_pytubefix(stream) for stream in streams],
+            source=yt,
+            duration=duration,
+            chapters=chapters,
+            author=author,
+            publish_date=publish_date,
+            thumbnail_url=thumbnail_url,
+        )
+
+    def submit(self, job):
+        """Encola el trabajo y lo devuelve inmediatamente"""
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("El motor ya se ha detenido")
+            self._start_workers()
+            self._jobs.append(job)
+            job.enqueued_at = time.perf_counter()
+        if self.job_bandwidth and job.rate_limit.bandwidth is None:
+            job.rate_limit.set_bandwidth(self.job_bandwidth)
+        self._download_queue.put(job)
+        return job
+
+    def submit_many(self, jobs):
+        return [self.submit(job) for job in jobs]
+
+    def wait(self, jobs=None, timeout=None):
+        """Espera a que terminen los trabajos indicados (por defecto, todos)"""
+        if jobs is None:
+            with self._lock:
+                jobs = list(self._jobs)
+        for job in jobs:
+            job.wait(timeout)
+        return jobs
+
+    def progress(self):
+        """Devuelve el progreso agregado de todos los trabajos enviados"""
+        with self._lock:
+            jobs = list(self._jobs)
+
+        done = sum(1 for job in jobs if job.state == JobState.DONE)
+        failed = sum(1 for job in jobs if job.state == JobState.FAILED)
+        cancelled = sum(1 for job in jobs if job.state == JobState.CANCELLED)
+        bytes_downloaded = sum(job.bytes_downloaded for job in jobs)
+        total_bytes = sum(job.total_bytes or 0 for job in jobs)
+        percentage = sum(job.progress for job in jobs) / len(jobs) if jobs else 0.0
+        return BatchProgress(
+            len(jobs), done, failed, len(jobs) - done - failed - cancelled,
+            bytes_downloaded, total_bytes, percentage, cancelled,
+        )
+
+    def cancel(self, jobs=None, keep_download=False):
+        """Cancela los trabajos indicados (por defecto, todos los enviados); ver Job.cancel"""
+        if jobs is None:
+            with self._lock:
+                jobs = list(self._jobs)
+        for job in jobs:
+            job.cancel(keep_download)
+
+    def shutdown(self, wait=True):
+        """Deja de aceptar trabajos y detiene los hilos cuando vacían las colas"""
+        with self._lock:
+            if self._shutdown:
+                return
+            self._shutdown = True
+
+        # Las descargas deben terminar antes de cerrar la cola de conversión
+        def stop_workers():
+            for _ in self._download_threads:
+                self._download_queue.put(None)
+            for thread in self._download_threads:
+                thread.join()
+            for _ in self._convert_threads:
+                self._convert_queue.put(None)
+            for thread in self._convert_threads:
+                thread.join()
+            self.transcoder.close()
+            self.staging.close()
+
+        if wait:
+            stop_workers()
+        else:
+            threading.Thread(target=stop_workers, daemon=True).start()
+
+    def run(self, job):
+        """Ejecuta el trabajo completo en el hilo actual; los errores quedan en job.error"""
+        if self._download_phase(job):
+            self._convert_phase(job)
+        return job
+
+    def _start_workers(self):
+        if self._download_threads:
+            return
+        for i in range(self.download_workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(self._download_queue, self._download_and_enqueue),
+                name=f"ytmp3-download-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self._download_threads.append(thread)
+        for i in range(self.convert_workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                args=(self._convert_queue, self._convert_phase),
+                name=f"ytmp3-convert-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self._convert_threads.append(thread)
+
+    def _worker_loop(self, jobs, handler):
+        while True:
+            job = jobs.get()
+            if job is None:
+                break
+            handler(job)
+
+    def _download_and_enqueue(self, job):
+        if self._download_phase(job):
+            job.enqueued_at = time.perf_counter()
+            self._convert_queue.put(job)
+
+    def _download_phase(self, job):
+        """Resuelve los metadatos y descarga el stream; devuelve True si queda convertirlo"""
+        self._queue_span(job, "download_queue")
+        try:
+            job.cancel_token.check()
+            if job.info is None:
+                self._set_state(job, JobState.RESOLVING)
+                with self._span(job, "resolve"):
+                    job.info = self.resolve(job.url, cancel=job.cancel_token, on_retry=self._retry_callback(job))
+                job.cancel_token.check()
+
+            if job.stream is None:
+                job.stream = self._select_stream(job)
+            if job.chapters is not None:
+                job.segments = self._chapter_segments(job)
+            if job.segments:
+                job.segments = self._resolve_segments(job)
+
+            if self._reuse_output(job):
+                job.cached = True
+            elif self.streaming and job.stream.url and not job.segments and self._can_stream():
+                job.tags = self._tags(job)
+                job.output_files = [self._with_retry(job, self._stream)]
+            else:
+                if job.stream.url:
+                    # El descargador reintenta cada segmento desde el último byte recibido
+                    self._download(job)
+                else:
+                    self._with_retry(job, self._download)
+                job.tags = self._tags(job)
+                return True
+        except Exception as e:
+            self._fail(job, e)
+            return False
+        self._complete(job)
+        return False
+
+    def _convert_phase(self, job):
+        self._queue_span(job, "convert_queue")
+        try:
+            job.cancel_token.check()
+            job.output_files = self._convert(job)
+        except Exception as e:
+            self._fail(job, e)
+            return
+        self._complete(job)
+
+    def _complete(self, job):
+        job.output_file = job.output_files[0]
+        if self.output_cache is not None and not job.cached and not job.segments:
+            for key, output_file in zip(self._output_keys(job), job.output_files):
+                self.output_cache.record(*key, output_file)
+        job.progress = 100.0
+        self._set_state(job, JobState.DONE)
+        self._emit(job, "done", job.output_file)
+        job._finished.set()
+
+    def _fail(self, job, exc):
+        if job.cancelled:
+            # Al cancelar, los errores de las fases interrumpidas no interesan
+            job.error = exc if isinstance(exc, JobCancelled) else JobCancelled()
+            self._release_temp(job, remove=not job.keep_download)
+            self._set_state(job, JobState.CANCELLED)
+            self._emit(job, "cancelled", job.error)
+        else:
+            job.error = exc if isinstance(exc, EngineError) else EngineError(str(exc))
+            # La descarga se conserva para que otra ejecución la reanude
+            self._release_temp(job, remove=False)
+            self._set_state(job, JobState.FAILED)
+            self._emit(job, "error", job.error)
+        job._finished.set()
+
+    def _use_temp(self, job, temp_file, shared=False):
+        """
+        Fija el archivo temporal del trabajo (el mismo aunque se reintente).
+        Con shared está en downloads/ y pueden usarlo otros trabajos y otros
+        procesos; devuelve su DownloadLock.
+        """
+        if job.temp_file != temp_file:
+            self._release_temp(job, remove=False)
+            job.temp_file = temp_file
+            job._temp_lock = DownloadLock(temp_file) if shared else None
+        return job._temp_lock
+
+    def _release_temp(self, job, remove=True):
+        """Suelta el archivo temporal del trabajo; con remove lo borra el último que lo usa"""
+        temp_file, lock = job.temp_file, job._temp_lock
+        job.temp_file = job._temp_lock = None
+        if lock is not None:
+            lock.release(remove)
+        elif remove and temp_file is not None and os.path.exists(temp_file):
+            os.remove(temp_file)
+
+    def _output_keys(self, job):
+        return [(job.info.video_id, job.stream.itag, output.extension, self._output_profile(output))
+                for output in self.transcoder.outputs]
+
+    def _output_profile(self, output):
+        # Un archivo con etiquetas no sustituye a uno sin ellas, ni al revés
+        if not self._writes_tags():
+            return output.profile
+        return "+".join(part for part in (output.profile, "tags") if part)
+
+    def _tags(self, job):
+        """Etiquetas del trabajo, con la portada si hay caché de miniaturas"""
+        if not self._writes_tags():
+            return None
+        cover = None
+        if self.thumbnail_cache is not None and job.info.thumbnail_url:
+            with self._span(job, "cover"):
+                cover = self.thumbnail_cache.get(job.info, cancel=job.cancel_token)
+        return tags_for(job.info, cover)
+
+    def _writes_tags(self):
+        return self.tagging and self.transcoder.backend.writes_tags
+
+    def _output_paths(self, job):
+        """Archivos de salida; con segments, los de cada tramo uno tras otro"""
+        names = [job.info.title]
+        if job.segments:
+            names = [f"{job.info.title} - {segment_label(segment)}" for segment in job.segments]
+        suffixes = self.transcoder.output_suffixes()
+        bases = [self._claim_path(job, os.path.join(job.output_dir, safe_filename(name))) for name in names]
+        return [f"{base}{suffix}" for base in bases for suffix in suffixes]
+
+    def _claim_path(self, job, base):
+        """
+        Reserva la ruta (sin extensión) para el video del trabajo. Si otro video
+        ya la usa (títulos que coinciden al quitarles los caracteres no válidos),
+        en esta ejecución o en una anterior, se añade el ID para que uno no
+        sobrescriba al otro.
+        """
+        video_id = job.info.video_id
+        with self._lock:
+            owner = self._claimed_paths.get(base)
+        if owner is None:
+            owner = self._existing_owner(base)
+        with self._lock:
+            if self._claimed_paths.setdefault(base, owner or video_id) == video_id:
+                return base
+            base = f"{base} [{video_id}]"
+            self._claimed_paths.setdefault(base, video_id)
+            return base
+
+    def _existing_owner(self, base):
+        """
+        ID del video de los archivos que ya hay en base, según la caché de
+        salidas o sus etiquetas; None si no hay ninguno o no se sabe de quién es.
+        """
+        for suffix in self.transcoder.output_suffixes():
+            path = f"{base}{suffix}"
+            if not os.path.exists(path):
+                continue
+            owner = self.output_cache.owner(path) if self.output_cache is not None else None
+            owner = owner or read_video_id(path)
+            if owner is not None:
+                return owner
+        return None
+
+    def _staged_paths(self, job, output_files):
+        """Dónde se escriben las salidas antes de publicarlas, sin choques entre trabajos"""
+        return [self.staging.work_path(f"{job.info.video_id}.{job.id}.{index}{os.path.splitext(path)[1]}")
+                for index, path in enumerate(output_files)]
+
+    def _chapter_segments(self, job):
+        """Tramos de los capítulos pedidos, numerados como en el video"""
+        chapters = job.info.chapters
+        if not chapters:
+            raise EngineError("El video no tiene capítulos")
+        numbers = range(1, len(chapters) + 1) if job.chapters is True else job.chapters
+        segments = []
+        for number in numbers:
+            if not 1 <= number <= len(chapters):
+                raise EngineError(f"El video no tiene el capítulo {number} (tiene {len(chapters)})")
+            chapter = chapters[number - 1]
+            segments.append(Segment(f"{number:02d} {chapter.title}", chapter.start, chapter.end))
+        return segments
+
+    def _resolve_segments(self, job):
+        """Comprueba los tramos contra la duración del video y fija el fin de los que llegan al final"""
+        duration = job.info.duration
+        segments = []
+        for segment in job.segments:
+            if duration and segment.start >= duration:
+                raise EngineError(f"El fragmento {segment_label(segment)} empieza después del final del video")
+            end = segment.end
+            if duration and (end is None or end > duration):
+                end = duration
+            segments.append(segment._replace(end=end))
+        return segments
+
+    def _reuse_output(self, job):
+        """Si ya se convirtió este stream con la misma configuración, reutiliza los archivos"""
+        if self.output_cache is None or job.segments:
+            return False
+        cached_paths = [self.output_cache.lookup(*key) for key in self._output_keys(job)]
+        if None in cached_paths:
+            return False
+        job.output_files = [self.output_cache.materialize(cached_path, output_file)
+                            for cached_path, output_file in zip(cached_paths, self._output_paths(job))]
+        return True
+
+    def _select_stream(self, job):
+        if job.itag is not None:
+            stream = job.info.stream_by_itag(job.itag)
+            if stream is None:
+                raise EngineError(f"El video no tiene un stream de audio con itag {job.itag}")
+            return stream
+        return self.select_stream(job.info)
+
+    def select_stream(self, info):
+        """Stream que la política de selección elige para el video"""
+        return self.selection.select(info.streams, self.transcoder)
+
+    def _download(self, job):
+        job.total_bytes = job.stream.filesize
+
+        limit = self._limit(job)
+        ranges = None
+        if job.segments and job.stream.url:
+            # Solo los bytes que cubren los tramos, si el índice del contenedor lo permite
+            ranges = plan_ranges(
+                lambda start, length: self.downloader.fetch_range(job.stream.url, start, length,
+                                                                  cancel=job.cancel_token, limit=limit),
+                job.stream.filesize,
+                job.segments,
+            )
+
+        def on_progress(stream, chunk, bytes_remaining):
+            # Lanzar la excepción desde el callback interrumpe la descarga de pytubefix
+            job.cancel_token.check()
+            limit.consume(len(chunk), job.cancel_token)
+            self._set_bytes(job, stream.filesize - bytes_remaining)
+
+        self._set_state(job, JobState.DOWNLOADING)
+        try:
+            with self._span(job, "download", bytes_counter=lambda: job.bytes_downloaded):
+                if job.stream.url:
+                    # Nombre estable por video, stream y rangos: si se interrumpe,
+                    # la siguiente ejecución reanuda el mismo archivo parcial
+                    partial = ""
+                    if ranges is not None:
+                        partial = f".clip-{hashlib.sha1(repr(ranges).encode()).hexdigest()[:10]}"
+                    temp_file = self.staging.download_path(f"{job.info.video_id}.{job.stream.itag}{partial}.tmp")
+                    lock = self._use_temp(job, temp_file, shared=True)
+                    # Otro trabajo, de este proceso o de otro, puede estar descargándolo:
+                    # se descarga en exclusiva y se usa con el lock compartido, que
+                    # impide que nadie lo borre hasta que se suelte
+                    while True:
+                        if lock.try_acquire(shared=True) and os.path.exists(temp_file):
+                            self._set_bytes(job, job.total_bytes or 0)
+                            return temp_file
+                        if not lock.try_acquire(shared=False):
+                            job.cancel_token.wait(LOCK_POLL_INTERVAL)
+                            job.cancel_token.check()
+                        elif not os.path.exists(temp_file):
+                            self.downloader.download(
+                                job.stream.url,
+                                temp_file,
+                                filesize=job.total_bytes,
+                                on_progress=lambda downloaded, total: self._set_bytes(job, downloaded, total),
+                                cancel=job.cancel_token,
+                                limit=limit,
+                                ranges=ranges,
+                                on_retry=self._retry_callback(job),
+                            )
+
+                # Streams SABR: solo pytubefix sabe descargarlos
+                job.info.source.register_on_progress_callback(on_progress)
+                self._use_temp(job, self.staging.work_path(f"{job.info.video_id}.{job.id}.tmp"))
+                return job.stream.source.download(
+                    output_path=self.staging.work_dir, filename=os.path.basename(job.temp_file)
+                )
+        except EngineError:
+            raise
+        except Exception as e:
+            raise download_error(e)
+
+    def _stream(self, job):
+        """Descarga y codifica a la vez, sin pasar por un archivo temporal"""
+        job.total_bytes = job.stream.filesize
+        output_file = self._output_paths(job)[0]
+        staged_file = self._staged_paths(job, [output_file])[0]
+
+        self._set_state(job, JobState.DOWNLOADING)
+        # Cada intento vuelve a empezar el stream desde el primer byte
+        self._set_bytes(job, 0)
+        chunks = iter_stream_chunks(job.stream.url, job.total_bytes, limit=self._limit(job), cancel=job.cancel_token)
+        try:
+            with self._span(job, "stream", bytes_counter=lambda: job.bytes_downloaded):
+                encode_stream(
+                    chunks,
+                    staged_file,
+                    encoder_args=self.transcoder.backend.stream_args(job.stream.codec, job.tags),
+                    on_chunk=lambda size: self._set_bytes(job, job.bytes_downloaded + size),
+                    cancel=job.cancel_token,
+                )
+        except EngineError:
+            raise
+        except Exception as e:
+            raise download_error(e)
+        with self._span(job, "publish"):
+            self.staging.publish([(staged_file, output_file)])
+        return output_file
+
+    def _can_stream(self):
+        # Normalizar necesita el audio completo antes de codificar, y las
+        # varias salidas se convierten desde el archivo temporal
+        backend = self.transcoder.backend
+        return isinstance(backend, FFmpegTranscoder) and backend.normalize is None and len(backend.outputs) == 1
+
+    def _limit(self, job):
+        return LimitChain(self.rate_limit, job.rate_limit)
+
+    def _with_retry(self, job, phase):
+        return self.retry.call(lambda: phase(job), cancel=job.cancel_token, on_retry=self._retry_callback(job))
+
+    def _retry_callback(self, job):
+        def on_retry(attempt, delay, error):
+            job.retries += 1
+            job.retry_delay = delay
+            self._emit(job, "retry", error)
+        return on_retry
+
+    def _set_bytes(self, job, bytes_downloaded, total_bytes=None):
+        job.bytes_downloaded = bytes_downloaded
+        if total_bytes:
+            job.total_bytes = total_bytes
+        if job.total_bytes:
+            percentage = (bytes_downloaded / job.total_bytes) * 100
+            job.progress = max(0, min(percentage, 100))
+            self._emit(job, "progress", job.progress)
+
+    def _set_convert_progress(self, job, fraction):
+        job.convert_progress = max(0.0, min(fraction * 100, 100.0))
+        self._emit(job, "convert_progress", job.convert_progress)
+
+    def _duration(self, job):
+        """Duración del audio en segundos, o una estimación a partir del tamaño y el bitrate"""
+        if job.segments and all(segment.end is not None for segment in job.segments):
+            return sum(segment.end - segment.start for segment in job.segments)
+        if job.info.duration:
+            return job.info.duration
+        abr = abr_kbps(job.stream)
+        if abr and job.stream.filesize:
+            return job.stream.filesize * 8 / (abr * 1000)
+        return None
+
+    def _convert(self, job):
+        self._set_state(job, JobState.CONVERTING)
+        output_files = self._output_paths(job)
+        staged_files = self._staged_paths(job, output_files)
+        # Los tramos y las etiquetas solo se pasan si los hay
+        options = {key: value for key, value in (("segments", job.segments), ("tags", job.tags)) if value}
+        with self._span(job, "convert"):
+            self.transcoder.transcode(
+                job.temp_file,
+                staged_files if len(staged_files) > 1 else staged_files[0],
+                job.stream.codec,
+                duration=self._duration(job),
+                on_progress=lambda fraction: self._set_convert_progress(job, fraction),
+                cancel=job.cancel_token,
+                **options,
+            )
+
+        with self._span(job, "publish"):
+            self.staging.publish(list(zip(staged_files, output_files)))
+
+        # Limpiar el archivo temporal, si ningún otro trabajo lo usa
+        with self._span(job, "cleanup"):
+            self._release_temp(job)
+        return output_files
+
+    def _span(self, job, phase, bytes_counter=None):
+        """Mide un bloque como una fase del trabajo y emite su span"""
+        return measure(lambda span: self._record_span(job, span), phase, bytes_counter)
+
+    def _queue_span(self, job, phase):
+        if job.enqueued_at is not None:
+            self._record_span(job, queue_span(phase, job.enqueued_at))
+            job.enqueued_at = None
+
+    def _record_span(self, job, span):
+        job.timings[span.phase] = job.timings.get(span.phase, 0.0) + span.duration
+        self._emit(job, "span", span)
+
+    def _set_state(self, job, state):
+        job.state = state
+        self._emit(job, "state", state)
+
+    def _emit(self, job, kind, value):
+        event = JobEvent(job, kind, value)
+        for callback in (job.on_event, self.on_event):
+            if callback is not None:
+                callback(event)
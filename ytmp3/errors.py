@@ -0,0 +1,120 @@
+"""
+Errores del motor de descarga.
+Los mensajes están pensados para mostrarse directamente al usuario.
+
+Cada error indica si vale la pena reintentar (retryable): los fallos de red,
+los errores 5xx y los límites de peticiones (429) son pasajeros; un video
+inexistente o restringido no se arregla reintentando.
+"""
+
+import http.client
+import re
+import urllib.error
+
+
+class EngineError(Exception):
+    """Error del motor con un mensaje legible para el usuario"""
+
+    retryable = False
+    # Segundos que el servidor pidió esperar (cabecera Retry-After), si los indicó
+    retry_after = None
+
+
+class JobCancelled(EngineError):
+    """El trabajo se canceló antes de terminar"""
+
+    def __init__(self, message="Cancelado por el usuario"):
+        super().__init__(message)
+
+
+class AccessDenied(EngineError):
+    """Error 403: el video tiene restricciones"""
+
+
+class NotFound(EngineError):
+    """Error 404: el video o el stream no existen"""
+
+
+class InvalidRequest(EngineError):
+    """Error 400 u otro error 4xx que no se arregla reintentando"""
+
+
+class TransientError(EngineError):
+    """Fallo pasajero (red, 5xx): reintentar más tarde puede funcionar"""
+
+    retryable = True
+
+    def __init__(self, message, retry_after=None, rejected=False):
+        super().__init__(message)
+        self.retry_after = retry_after
+        # True si la petición la frenó retry.HostGuard sin que llegara a la red
+        self.rejected = rejected
+
+
+class RateLimited(TransientError):
+    """El servidor pidió bajar el ritmo (429, o 503 con Retry-After)"""
+
+
+class HostUnavailable(TransientError):
+    """El circuito del host está abierto tras muchos fallos seguidos; no se le envían peticiones"""
+
+
+def parse_retry_after(value):
+    """Segundos de una cabecera Retry-After (solo la forma numérica) o None"""
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def http_status(exc):
+    """Código HTTP asociado a la excepción, o None si no es un error HTTP"""
+    if isinstance(exc, urllib.error.HTTPError):
+        return exc.code
+    # pytubefix y otras capas a veces solo conservan el código en el mensaje
+    match = re.search(r"\b(4\d\d|5\d\d)\b", str(exc))
+    return int(match.group(1)) if match else None
+
+
+def is_network_error(exc):
+    return isinstance(exc, (OSError, http.client.HTTPException)) and not isinstance(exc, urllib.error.HTTPError)
+
+
+def classify(exc, messages, generic):
+    """
+    Traduce una excepción al EngineError de su categoría. messages da el
+    mensaje para 403, 404 y 400; generic es el prefijo del resto.
+    """
+    if isinstance(exc, EngineError):
+        return exc
+    error_msg = str(exc)
+    status = http_status(exc)
+    retry_after = None
+    if isinstance(exc, urllib.error.HTTPError) and exc.headers is not None:
+        retry_after = parse_retry_after(exc.headers.get("Retry-After"))
+
+    if status == 429 or (status == 503 and retry_after is not None):
+        return RateLimited(f"Demasiadas peticiones (Error {status}). Se reintentará más tarde.", retry_after)
+    if status in messages:
+        error_class = {403: AccessDenied, 404: NotFound, 400: InvalidRequest}[status]
+        return error_class(messages[status])
+    if status is not None and status >= 500 or is_network_error(exc):
+        return TransientError(f"{generic}: {error_msg}")
+    if status is not None:
+        return InvalidRequest(f"{generic}: {error_msg}")
+    return EngineError(f"{generic}: {error_msg}")
+
+
+def connection_error(exc):
+    """Traduce un error al crear el objeto YouTube a un EngineError"""
+    return classify(exc, {
+        403: "Acceso prohibido (Error 403). Este video puede tener restricciones.",
+        404: "Video no encontrado (Error 404). La URL podría ser incorrecta.",
+        400: "Solicitud incorrecta (Error 400). Intenta usando otra URL.",
+    }, "Error al conectar con YouTube")
+
+
+def download_error(exc):
+    """Traduce un error durante la descarga del stream a un EngineError"""
+    restricted = "Error al descargar: El video podría tener restricciones regionales o de edad."
+    return classify(exc, {403: restricted, 404: restricted}, "Error al descargar el audio")
@@ -0,0 +1,281 @@
+"""
+Granja de conversión
+----------------------------------------------------
+Ejecuta las conversiones en procesos aparte, uno por núcleo por defecto, y
+fija cada proceso a su propio núcleo en los sistemas que lo permiten
+(os.sched_setaffinity). Así una conversión con moviepy, que decodifica en
+Python, no compite por el GIL con la interfaz ni con las descargas, y los
+procesos de ffmpeg no saltan de un núcleo a otro.
+
+TranscodeFarm se usa como cualquier otro Transcoder: el Engine lo llama
+desde sus hilos de conversión, que ya toman primero los trabajos más largos.
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+
+from .cancel import CancelToken
+from .errors import EngineError, JobCancelled
+from .transcoders import Transcoder, get_transcoder
+
+# Uso de un proceso de la granja. busy son los segundos con una conversión en
+# curso, cpu_time los de CPU del proceso y de sus hijos (ffmpeg), y
+# utilization la fracción de tiempo ocupado desde que arrancó la granja
+WorkerStats = namedtuple("WorkerStats", ["index", "pid", "cpu", "tasks", "busy", "cpu_time", "utilization"])
+
+
+def available_cpus():
+    """Núcleos en los que puede ejecutarse este proceso"""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+def _worker_main(connection, transcoder, cpu):
+    """Bucle de un proceso de la granja: convierte lo que le llega por la tubería"""
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+
+    tasks = queue.Queue()
+    current = [None]
+    send_lock = threading.Lock()
+
+    def send(*message):
+        with send_lock:
+            connection.send(message)
+
+    # Un hilo lee la tubería para poder recibir la cancelación durante la conversión
+    def read_messages():
+        while True:
+            try:
+                message = connection.recv()
+            except EOFError:
+                message = None
+            if message is None:
+                tasks.put(None)
+                return
+            if message[0] == "cancel":
+                if current[0] is not None:
+                    current[0].cancel()
+            else:
+                current[0] = CancelToken()
+                tasks.put((message, current[0]))
+
+    threading.Thread(target=read_messages, daemon=True).start()
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        (_, args, options, report), token = task
+        on_progress = (lambda fraction: send("progress", fraction)) if report else None
+        started = _cpu_seconds()
+        try:
+            transcoder.transcode(*args, on_progress=on_progress, cancel=token, **options)
+            result = ("done", None)
+        except JobCancelled:
+            result = ("cancelled", None)
+        except EngineError as e:
+            result = ("error", str(e))
+        except Exception as e:
+            result = ("error", f"{transcoder.error_prefix}: {str(e)}")
+        send(*result, _cpu_seconds() - started)
+
+
+class FarmWorker:
+    """Un proceso de la granja visto desde el proceso principal"""
+
+    def __init__(self, index, cpu, transcoder, context):
+        self.index = index
+        self.cpu = cpu
+        self.tasks = 0
+        self.busy = 0.0
+        self.cpu_time = 0.0
+        self.connection, child_connection = context.Pipe()
+        self.process = context.Process(
+            target=_worker_main,
+            args=(child_connection, transcoder, cpu),
+            name=f"ytmp3-transcode-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        child_connection.close()
+
+    def cancel(self):
+        try:
+            self.connection.send(("cancel",))
+        except OSError:
+            pass
+
+    def stop(self):
+        try:
+            self.connection.send(None)
+        except OSError:
+            pass
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.connection.close()
+
+
+class TranscodeFarm(Transcoder):
+    """
+    Transcoder que reparte las conversiones entre varios procesos.
+
+    transcoder: backend que usan los procesos (por defecto get_transcoder())
+    workers: número de procesos (por defecto, uno por núcleo disponible)
+    affinity: fijar cada proceso a un núcleo distinto
+    """
+
+    name = "farm"
+
+    def __init__(self, transcoder=None, workers=None, affinity=True):
+        self.transcoder = transcoder or get_transcoder()
+        self.workers = max(1, workers or len(available_cpus()))
+        self.affinity = affinity
+
+        self._workers = []
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._started = None
+        self._stopped = None
+        # spawn también en Linux: hacer fork de un proceso con hilos no es seguro
+        self._context = multiprocessing.get_context("spawn")
+
+    # La configuración de salida es la del backend
+    @property
+    def output_format(self):
+        return self.transcoder.output_format
+
+    @property
+    def sample_rate(self):
+        return self.transcoder.sample_rate
+
+    @property
+    def bitrate(self):
+        return self.transcoder.bitrate
+
+    @property
+    def normalize(self):
+        return self.transcoder.normalize
+
+    @property
+    def outputs(self):
+        return self.transcoder.outputs
+
+    @property
+    def error_prefix(self):
+        return self.transcoder.error_prefix
+
+    @property
+    def backend(self):
+        return self.transcoder.backend
+
+    def will_copy(self, source_codec):
+        return self.transcoder.will_copy(source_codec)
+
+    def start(self):
+        """Arranca los procesos; se hace solo en la primera conversión"""
+        with self._lock:
+            if self._started is None or self._stopped is not None:
+                self._workers = []
+                self._idle = queue.Queue()
+                self._stopped = None
+                cpus = available_cpus() if self.affinity else None
+                for index in range(self.workers):
+                    self._add_worker(index, cpus[index % len(cpus)] if cpus else None)
+                self._started = time.monotonic()
+        return self
+
+    def _add_worker(self, index, cpu):
+        worker = FarmWorker(index, cpu, self.transcoder, self._context)
+        if index < len(self._workers):
+            self._workers[index] = worker
+        else:
+            self._workers.append(worker)
+        self._idle.put(worker)
+
+    def close(self):
+        """Detiene los procesos; stats() sigue disponible hasta volver a arrancar"""
+        with self._lock:
+            if self._started is None or self._stopped is not None:
+                return
+            self._stopped = time.monotonic()
+            workers = list(self._workers)
+        for worker in workers:
+            worker.stop()
+
+    def transcode(self, source_file, output_file, source_codec=None, duration=None, on_progress=None,
+                  cancel=None, segments=None, tags=None):
+        self.start()
+        worker = self._acquire(cancel)
+        started = time.monotonic()
+        try:
+            options = {key: value for key, value in (("segments", segments), ("tags", tags)) if value}
+            task = ("transcode", (source_file, output_file, source_codec, duration), options, on_progress is not None)
+            worker.connection.send(task)
+            with cancel.on_cancel(worker.cancel) if cancel is not None else nullcontext():
+                while True:
+                    kind, value, *rest = worker.connection.recv()
+                    if kind != "progress":
+                        break
+                    on_progress(value)
+        except (EOFError, OSError):
+            # El proceso murió (p. ej. sin memoria): se sustituye por otro
+            worker.busy += time.monotonic() - started
+            self._replace(worker)
+            raise EngineError(f"{self.error_prefix}: el proceso de conversión terminó inesperadamente")
+
+        worker.tasks += 1
+        worker.busy += time.monotonic() - started
+        worker.cpu_time += rest[0]
+        self._idle.put(worker)
+
+        if kind == "cancelled":
+            raise JobCancelled()
+        if kind == "error":
+            raise EngineError(value)
+        return output_file
+
+    def _acquire(self, cancel):
+        """Espera a un proceso libre; si se cancela mientras tanto, se deja de esperar"""
+        while True:
+            if cancel is not None:
+                cancel.check()
+            try:
+                return self._idle.get(timeout=0.2)
+            except queue.Empty:
+                pass
+
+    def _replace(self, worker):
+        worker.process.join(1)
+        worker.connection.close()
+        with self._lock:
+            if self._started is not None and self._stopped is None:
+                self._add_worker(worker.index, worker.cpu)
+
+    def stats(self):
+        """Uso de cada proceso desde que arrancó la granja"""
+        with self._lock:
+            workers = list(self._workers)
+            elapsed = 0.0
+            if self._started is not None:
+                elapsed = (self._stopped or time.monotonic()) - self._started
+        return [
+            WorkerStats(
+                worker.index, worker.process.pid, worker.cpu, worker.tasks, worker.busy, worker.cpu_time,
+                worker.busy / elapsed if elapsed else 0.0,
+            )
+            for worker in workers
+        ]
@@ -0,0 +1,106 @@
+"""
+Localización y ejecución del binario de ffmpeg.
+"""
+
+import os
+import shutil
+import subprocess
+import threading
+
+from .errors import EngineError
+
+
+def find_ffmpeg():
+    """
+    Devuelve la ruta de ffmpeg. Se busca, en este orden, en la variable de
+    entorno FFMPEG_BINARY, el binario incluido con imageio-ffmpeg (dependencia
+    de moviepy) y el PATH del sistema.
+    """
+    binary = os.environ.get("FFMPEG_BINARY")
+    if binary and binary != "auto-detect":
+        return binary
+
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        pass
+
+    binary = shutil.which("ffmpeg")
+    if binary:
+        return binary
+    raise EngineError("No se encontró ffmpeg. Instala moviepy o añade ffmpeg al PATH.")
+
+
+class FFmpegProcess:
+    """
+    Proceso de ffmpeg cuya salida de errores se recoge en segundo plano.
+
+    Con on_progress, ffmpeg informa de su avance por la salida estándar
+    (-progress pipe:1) y se llama a on_progress(segundos) con la posición
+    de la salida ya codificada.
+    """
+
+    def __init__(self, args, stdin=None, stdout=None, on_progress=None):
+        self.args = [find_ffmpeg(), "-hide_banner", "-loglevel", "error", "-y"]
+        if stdin is None:
+            self.args.append("-nostdin")
+        if on_progress is not None:
+            self.args += ["-progress", "pipe:1", "-nostats"]
+            stdout = subprocess.PIPE
+        self.args += args
+        self.process = subprocess.Popen(
+            self.args,
+            stdin=stdin if stdin is not None else subprocess.DEVNULL,
+            stdout=stdout if stdout is not None else subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        # Leer stderr en un hilo evita que ffmpeg se bloquee si llena la tubería
+        self._stderr = []
+        self._stderr_thread = threading.Thread(target=self._read_stderr, daemon=True)
+        self._stderr_thread.start()
+        self._progress_thread = None
+        if on_progress is not None:
+            self._progress_thread = threading.Thread(target=self._read_progress, args=(on_progress,), daemon=True)
+            self._progress_thread.start()
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            self._stderr.append(line.decode("utf-8", "replace"))
+            # Solo interesan las últimas líneas para el mensaje de error
+            del self._stderr[:-20]
+
+    def _read_progress(self, on_progress):
+        for line in self.process.stdout:
+            key, _, value = line.decode("ascii", "replace").strip().partition("=")
+            # out_time_ms también está en microsegundos, por compatibilidad
+            if key in ("out_time_us", "out_time_ms") and value.isdigit():
+                on_progress(int(value) / 1_000_000)
+
+    @property
+    def stdin(self):
+        return self.process.stdin
+
+    @property
+    def stdout(self):
+        return self.process.stdout
+
+    @property
+    def error_output(self):
+        return "".join(self._stderr).strip()
+
+    def wait(self):
+        returncode = self.process.wait()
+        self._stderr_thread.join()
+        if self._progress_thread is not None:
+            self._progress_thread.join()
+        return returncode
+
+    def kill(self):
+        self.abort()
+        self.wait()
+
+    def abort(self):
+        """Mata el proceso sin esperar; se puede llamar desde otro hilo"""
+        if self.process.poll() is None:
+            self.process.kill()
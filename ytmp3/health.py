@@ -0,0 +1,106 @@
+"""
+Monitor de conectividad
+----------------------------------------------------
+Sustituye la comprobación síncrona de conexión antes de cada búsqueda por un
+estado en caché. Un hilo en segundo plano sondea periódicamente y las
+peticiones reales (a través de net.ConnectionPool) actualizan el estado con
+su éxito o fracaso, de modo que consultar is_online() nunca espera a la red.
+"""
+
+import threading
+import time
+
+from . import net
+
+PROBE_URL = "http://www.google.com/generate_204"
+# Segundos mínimos entre dos sondeos consecutivos
+MIN_PROBE_GAP = 2
+
+
+def probe(url=PROBE_URL, timeout=3):
+    """Comprobación síncrona: True si se puede completar una petición a url"""
+    try:
+        with net.urlopen(url, timeout=timeout) as response:
+            response.read()
+        return True
+    except Exception:
+        return False
+
+
+class HealthMonitor:
+    """
+    Estado de la conexión con caducidad.
+
+    El resultado de un sondeo o de una petición real vale durante ttl
+    segundos; pasado ese tiempo el estado vuelve a ser desconocido y se
+    adelanta el siguiente sondeo. Un fallo real también lo adelanta.
+    """
+
+    UNKNOWN = "unknown"
+    ONLINE = "online"
+    OFFLINE = "offline"
+
+    def __init__(self, probe_url=PROBE_URL, interval=30, ttl=60, timeout=3):
+        self.probe_url = probe_url
+        self.interval = interval
+        self.ttl = ttl
+        self.timeout = timeout
+
+        self._online = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Inicia el sondeo en segundo plano (el primero es inmediato)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="ytmp3-health", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    @property
+    def status(self):
+        with self._lock:
+            if self._online is None or time.monotonic() - self._checked_at > self.ttl:
+                return self.UNKNOWN
+            return self.ONLINE if self._online else self.OFFLINE
+
+    def is_online(self):
+        """
+        Devuelve el último estado conocido sin bloquear. Si es desconocido se
+        asume que hay conexión (la petición real lo confirmará o no) y se
+        pide un sondeo.
+        """
+        status = self.status
+        if status == self.UNKNOWN:
+            self._wake.set()
+        return status != self.OFFLINE
+
+    def record_success(self):
+        self._record(True)
+
+    def record_failure(self, exc=None):
+        self._record(False)
+        # Un fallo puede ser puntual: se confirma con un sondeo cuanto antes
+        self._wake.set()
+
+    def _record(self, online):
+        with self._lock:
+            self._online = online
+            self._checked_at = time.monotonic()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._record(probe(self.probe_url, self.timeout))
+            # Los avisos recibidos durante el sondeo ya están respondidos, y se
+            # deja un mínimo entre sondeos para no insistir si no hay red
+            self._wake.clear()
+            if self._stop.wait(MIN_PROBE_GAP):
+                return
+            self._wake.wait(max(0, self.interval - MIN_PROBE_GAP))
@@ -0,0 +1,308 @@
+"""
+Normalización de volumen y recorte de silencios
+----------------------------------------------------
+Etapa opcional de la conversión con ffmpeg (ver FFmpegTranscoder):
+  1. ffmpeg decodifica el audio descargado a PCM (WAV float32 de 48 kHz,
+     mono o estéreo como el original) en un archivo junto al temporal;
+  2. el PCM se recorre mapeado en memoria, en bloques de tamaño fijo, y
+     NumPy calcula la sonoridad integrada EBU R128 (ITU-R BS.1770, con
+     puertas absoluta y relativa), el pico de muestra y dónde empieza y
+     termina el audio que no es silencio;
+  3. la codificación lee ese mismo PCM, empezando y terminando en esos
+     límites, y aplica la ganancia con el filtro volume, todo en una pasada.
+
+La memoria no depende de la duración: cada bloque dura unos 5 s y las
+páginas ya leídas del mapeo se liberan. En disco, el PCM ocupa unos
+1,4 GB por hora de audio mientras dura la conversión.
+
+El filtro de ponderación K (dos biquads) no se puede vectorizar sin SciPy;
+su respuesta al impulso cae por debajo de 1e-9 en 4096 muestras, así que se
+aplica como un FIR con esa respuesta, convolucionando por FFT (overlap-save).
+"""
+
+import mmap
+import os
+import struct
+from collections import namedtuple
+from contextlib import nullcontext
+
+from .errors import EngineError
+from .ffmpeg import FFmpegProcess
+
+SAMPLE_RATE = 48000
+# Opciones de salida del PCM. Se mantiene el canal único de una fuente mono:
+# subirla a estéreo la mediría 3 LU más alta (BS.1770 suma los canales), y
+# solo lo que tiene más de dos canales se mezcla a estéreo
+PCM_OUTPUT_ARGS = [
+    "-af", "aformat=channel_layouts=mono|stereo", "-ar", str(SAMPLE_RATE), "-c:a", "pcm_f32le",
+    "-rf64", "auto", "-map_metadata", "-1", "-fflags", "+bitexact", "-f", "wav",
+]
+# Subbloques de 100 ms para la sonoridad y tramas de 10 ms para el silencio
+SUBBLOCK = SAMPLE_RATE // 10
+FRAME = SAMPLE_RATE // 100
+# Longitud de la respuesta al impulso de la ponderación K y tamaño de la FFT
+K_TAPS = 4096
+FFT_SIZE = 1 << 18
+# Muestras por bloque: lo que cabe en la FFT, en subbloques enteros
+BLOCK = (FFT_SIZE - K_TAPS + 1) // SUBBLOCK * SUBBLOCK
+
+ABSOLUTE_GATE = -70.0
+RELATIVE_GATE = -10.0
+
+# Coeficientes de BS.1770 a 48 kHz: (b, a) del filtro previo y del paso alto RLB
+K_WEIGHTING = (
+    ((1.53512485958697, -2.69169618940638, 1.19839281085285), (1.0, -1.69065929318241, 0.73248077421585)),
+    ((1.0, -2.0, 1.0), (1.0, -1.99004745483398, 0.99007225036621)),
+)
+
+# loudness: sonoridad integrada en LUFS (None si todo está por debajo de la
+# puerta absoluta); peak: pico de muestra en dBFS; start y end: segundos del
+# primer y último audio que no es silencio; duration: duración total en segundos
+LoudnessInfo = namedtuple("LoudnessInfo", ["loudness", "peak", "start", "end", "duration"])
+
+_k_response = None
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise EngineError("La normalización de volumen necesita NumPy (pip install numpy)")
+    return numpy
+
+
+def k_weighting_response():
+    """Respuesta al impulso (K_TAPS muestras) de los dos biquads de la ponderación K"""
+    global _k_response
+    if _k_response is None:
+        np = _numpy()
+        signal = [1.0] + [0.0] * (K_TAPS - 1)
+        for b, a in K_WEIGHTING:
+            output = []
+            x1 = x2 = y1 = y2 = 0.0
+            for x in signal:
+                y = b[0] * x + b[1] * x1 + b[2] * x2 - a[1] * y1 - a[2] * y2
+                x2, x1, y2, y1 = x1, x, y1, y
+                output.append(y)
+            signal = output
+        _k_response = np.array(signal)
+    return _k_response
+
+
+def stage_progress(on_progress, begin, end):
+    """Convierte el avance (0 a 1) de una etapa en el del proceso completo"""
+    if on_progress is None:
+        return None
+    return lambda fraction: on_progress(begin + (end - begin) * fraction)
+
+
+def to_db(power, reference=0.0):
+    np = _numpy()
+    with np.errstate(divide="ignore"):
+        return reference + 10 * np.log10(power)
+
+
+def decode_pcm(source_file, pcm_file, duration=None, on_progress=None, cancel=None):
+    """Decodifica source_file a PCM float32 de 48 kHz (WAV) en pcm_file"""
+    def report(seconds):
+        on_progress(min(seconds / duration, 1.0))
+
+    process = FFmpegProcess(
+        ["-i", source_file, "-vn"] + PCM_OUTPUT_ARGS + [pcm_file],
+        on_progress=report if on_progress is not None and duration else None,
+    )
+    with cancel.on_cancel(process.abort) if cancel is not None else nullcontext():
+        returncode = process.wait()
+    if returncode != 0:
+        if cancel is not None:
+            cancel.check()
+        raise EngineError(f"Error al analizar el volumen: {process.error_output or 'ffmpeg falló'}")
+
+
+def read_wav_header(handle):
+    """Devuelve (canales, posición de los datos, bytes de datos) de un WAV o RF64 de ffmpeg"""
+    size = os.fstat(handle.fileno()).st_size
+    header = handle.read(12)
+    if len(header) < 12 or header[:4] not in (b"RIFF", b"RF64") or header[8:] != b"WAVE":
+        raise EngineError("Error al analizar el volumen: el PCM no es un archivo WAV")
+    channels = None
+    position = 12
+    while position + 8 <= size:
+        handle.seek(position)
+        chunk, length = struct.unpack("<4sI", handle.read(8))
+        if chunk == b"fmt ":
+            channels = struct.unpack("<H", handle.read(4)[2:])[0]
+        elif chunk == b"data":
+            if channels is None:
+                break
+            # En RF64 el tamaño va en el bloque ds64; los datos llegan hasta el final
+            available = size - position - 8
+            return channels, position + 8, available if length == 0xFFFFFFFF else min(length, available)
+        position += 8 + length + (length & 1)
+    raise EngineError("Error al analizar el volumen: el PCM no tiene datos de audio")
+
+
+def measure_pcm(pcm_file, silence_threshold=-50.0, on_progress=None, cancel=None):
+    """
+    Mide la sonoridad, el pico y los límites del silencio de un PCM escrito
+    por decode_pcm. silence_threshold es el nivel (dBFS, valor eficaz en
+    tramas de 10 ms) por debajo del cual se considera silencio.
+    """
+    np = _numpy()
+    with open(pcm_file, "rb") as handle:
+        channels, data_offset, data_size = read_wav_header(handle)
+    frame_size = channels * 4
+    samples = data_size // frame_size
+    if samples < SUBBLOCK:
+        raise EngineError("Error al analizar el volumen: el audio está vacío o es demasiado corto")
+
+    response = np.fft.rfft(k_weighting_response(), FFT_SIZE)
+    # Las últimas K_TAPS - 1 muestras del bloque anterior, para el overlap-save
+    history = np.zeros((K_TAPS - 1, channels))
+    silence_power = 10 ** (silence_threshold / 10)
+    powers = []
+    peak = 0.0
+    first_sound = last_sound = None
+    page = mmap.PAGESIZE
+    released = 0
+
+    with open(pcm_file, "rb") as handle:
+        mapped = mmap.mmap(handle.fileno(), data_offset + samples * frame_size, access=mmap.ACCESS_READ)
+        try:
+            for start in range(0, samples, BLOCK):
+                if cancel is not None:
+                    cancel.check()
+                count = min(BLOCK, samples - start)
+                block = np.frombuffer(mapped, dtype="<f4", count=count * channels,
+                                      offset=data_offset + start * frame_size)
+                block = block.reshape(count, channels).astype(np.float64)
+
+                peak = max(peak, float(np.abs(block).max()))
+
+                # Silencio: valor eficaz de cada trama (el canal más fuerte)
+                frames = count // FRAME
+                if frames:
+                    frame_power = np.square(block[:frames * FRAME]).reshape(frames, FRAME, channels)
+                    frame_power = frame_power.mean(axis=1).max(axis=1)
+                    loud = np.flatnonzero(frame_power > silence_power)
+                    if loud.size:
+                        offset = start // FRAME
+                        if first_sound is None:
+                            first_sound = offset + int(loud[0])
+                        last_sound = offset + int(loud[-1])
+
+                # Ponderación K por FFT y energía media de cada subbloque de 100 ms
+                padded = np.concatenate((history, block))
+                spectrum = np.fft.rfft(padded, FFT_SIZE, axis=0) * response[:, None]
+                weighted = np.fft.irfft(spectrum, FFT_SIZE, axis=0)
+                weighted = weighted[K_TAPS - 1:K_TAPS - 1 + count]
+                history = padded[-(K_TAPS - 1):]
+                subblocks = count // SUBBLOCK
+                if subblocks:
+                    squares = np.square(weighted[:subblocks * SUBBLOCK]).reshape(subblocks, SUBBLOCK, channels)
+                    powers.append(squares.mean(axis=1).sum(axis=1))
+
+                # Las páginas ya procesadas no vuelven a hacer falta
+                end = (data_offset + (start + count) * frame_size) // page * page
+                if end > released and hasattr(mapped, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+                    mapped.madvise(mmap.MADV_DONTNEED, released, end - released)
+                    released = end
+                if on_progress is not None:
+                    on_progress((start + count) / samples)
+        finally:
+            mapped.close()
+
+    duration = samples / SAMPLE_RATE
+    peak_db = float(to_db(peak * peak)) if peak > 0 else None
+    if first_sound is None:
+        return LoudnessInfo(None, peak_db, 0.0, duration, duration)
+    return LoudnessInfo(
+        integrated_loudness(np.concatenate(powers)),
+        peak_db,
+        first_sound * FRAME / SAMPLE_RATE,
+        min((last_sound + 1) * FRAME / SAMPLE_RATE, duration),
+        duration,
+    )
+
+
+def integrated_loudness(powers):
+    """
+    Sonoridad integrada (LUFS) a partir de la energía ponderada de cada
+    subbloque de 100 ms, con bloques de 400 ms solapados al 75 %.
+    """
+    np = _numpy()
+    if len(powers) < 4:
+        return None
+    cumulative = np.concatenate(([0.0], np.cumsum(powers)))
+    blocks = (cumulative[4:] - cumulative[:-4]) / 4
+    levels = to_db(blocks, -0.691)
+
+    gated = blocks[levels > ABSOLUTE_GATE]
+    if not gated.size:
+        return None
+    relative = float(to_db(gated.mean(), -0.691)) + RELATIVE_GATE
+    gated = blocks[(levels > ABSOLUTE_GATE) & (levels > relative)]
+    return float(to_db(gated.mean(), -0.691))
+
+
+class Normalizer:
+    """
+    Configuración de la etapa de análisis. target es la sonoridad deseada en
+    LUFS (None para no cambiar el volumen); la ganancia se reduce si el pico
+    superaría max_peak dBFS. Con trim_silence se quitan el silencio inicial y
+    el final (por debajo de silence_threshold dBFS).
+    """
+
+    def __init__(self, target=-14.0, max_peak=-1.0, trim_silence=False, silence_threshold=-50.0):
+        self.target = target
+        self.max_peak = max_peak
+        self.trim_silence = trim_silence
+        self.silence_threshold = silence_threshold
+
+    @property
+    def profile(self):
+        """Resumen de los ajustes, para distinguir las salidas en la caché"""
+        parts = []
+        if self.target is not None:
+            parts.append(f"r128={self.target:g}/{self.max_peak:g}")
+        if self.trim_silence:
+            parts.append(f"trim={self.silence_threshold:g}")
+        return ",".join(parts)
+
+    def analyze(self, source_file, pcm_file, duration=None, on_progress=None, cancel=None):
+        """Decodifica a pcm_file y lo mide; devuelve un LoudnessInfo"""
+        _numpy()
+        decode_pcm(source_file, pcm_file, duration, on_progress=stage_progress(on_progress, 0.0, 0.8),
+                   cancel=cancel)
+        return measure_pcm(pcm_file, self.silence_threshold, on_progress=stage_progress(on_progress, 0.8, 1.0),
+                           cancel=cancel)
+
+    def gain(self, info):
+        """Ganancia en dB que lleva el audio a target sin pasar de max_peak"""
+        if self.target is None or info.loudness is None:
+            return 0.0
+        gain = self.target - info.loudness
+        if info.peak is not None:
+            gain = min(gain, self.max_peak - info.peak)
+        return gain
+
+    def input_args(self, info):
+        """Opciones de ffmpeg para leer el PCM (recortado si se pide)"""
+        args = ["-f", "wav"]
+        if self.trim_silence and info.end > info.start:
+            # En PCM sin comprimir la búsqueda es exacta a la muestra
+            args += ["-ss", f"{info.start:.3f}", "-t", f"{info.end - info.start:.3f}"]
+        return args
+
+    def filters(self, info):
+        """Filtro de audio de la codificación, o None si no hay que cambiar el volumen"""
+        gain = self.gain(info)
+        if abs(gain) < 0.01:
+            return None
+        return f"volume={gain:.2f}dB"
+
+    def output_duration(self, info):
+        if self.trim_silence and info.end > info.start:
+            return info.end - info.start
+        return info.duration
+
@@ -0,0 +1,224 @@
+"""
+Métricas y trazas por fase
+----------------------------------------------------
+El motor mide cada fase de un trabajo y la emite como un evento "span" cuyo
+valor es un Span:
+  download_queue  espera en la cola de descargas
+  resolve         consulta de metadatos (caché incluida)
+  download        transferencia y escritura del archivo temporal
+  cover           obtención de la portada (de la caché o descargándola)
+  stream          descarga y codificación a la vez (--stream)
+  convert_queue   espera en la cola de conversión
+  convert         decodificación y codificación (un solo proceso de ffmpeg;
+                  con normalización, también el análisis del volumen)
+  publish         fsync de las salidas y cambio de nombre a su destino
+  cleanup         borrado del archivo temporal
+Cada intento de una fase que se reintenta es un span aparte, con el error.
+
+MetricsCollector recibe esos eventos (como ProgressAggregator, se asigna a
+Engine.on_event o se llama desde él), acumula histogramas y contadores y
+reenvía cada span a sus sinks. Aquí están el de JSON por líneas y un
+servidor HTTP con el formato de texto de Prometheus.
+"""
+
+import json
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+
+# start es la hora (time.time()) de inicio, duration en segundos, bytes los
+# transferidos (solo en download y stream) y error el tipo de la excepción o None
+Span = namedtuple("Span", ["phase", "start", "duration", "bytes", "error"])
+
+# Límites de los histogramas de duración, en segundos
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+
+
+@contextmanager
+def measure(emit, phase, bytes_counter=None):
+    """
+    Mide el bloque y llama a emit(span) al salir, también si falla.
+    bytes_counter es una función que devuelve los bytes transferidos hasta ahora.
+    """
+    start = time.time()
+    started = time.perf_counter()
+    initial_bytes = bytes_counter() if bytes_counter is not None else None
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        transferred = None
+        if bytes_counter is not None:
+            transferred = bytes_counter() - initial_bytes
+        emit(Span(phase, start, time.perf_counter() - started, transferred, error))
+
+
+def queue_span(phase, enqueued_at):
+    """Span de la espera en una cola desde enqueued_at (time.perf_counter())"""
+    waited = max(0.0, time.perf_counter() - enqueued_at)
+    return Span(phase, time.time() - waited, waited, None, None)
+
+
+class Histogram:
+    def __init__(self, buckets=DURATION_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+
+
+class MetricsCollector:
+    """
+    Callback de eventos que acumula las métricas de los spans y de los
+    resultados de los trabajos. sinks reciben (job, span) por cada span.
+    """
+
+    def __init__(self, sinks=()):
+        self.sinks = list(sinks)
+        self._durations = {}
+        self._bytes = {}
+        self._errors = {}
+        self._jobs = {}
+        self._retries = 0
+        self._lock = threading.Lock()
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def __call__(self, event):
+        self.handle(event)
+
+    def handle(self, event):
+        if event.kind == "span":
+            self._record_span(event.value)
+            for sink in self.sinks:
+                sink(event.job, event.value)
+        elif event.kind in ("done", "error", "cancelled"):
+            with self._lock:
+                self._jobs[event.kind] = self._jobs.get(event.kind, 0) + 1
+        elif event.kind == "retry":
+            with self._lock:
+                self._retries += 1
+
+    def _record_span(self, span):
+        with self._lock:
+            histogram = self._durations.get(span.phase)
+            if histogram is None:
+                histogram = self._durations[span.phase] = Histogram()
+            histogram.observe(span.duration)
+            if span.bytes:
+                self._bytes[span.phase] = self._bytes.get(span.phase, 0) + span.bytes
+            if span.error is not None:
+                key = (span.phase, span.error)
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def summary(self):
+        """{fase: (veces, segundos en total)}"""
+        with self._lock:
+            return {phase: (histogram.count, histogram.sum) for phase, histogram in self._durations.items()}
+
+    def render_prometheus(self):
+        """Las métricas en el formato de texto de Prometheus"""
+        lines = []
+        with self._lock:
+            lines.append("# HELP ytmp3_phase_seconds Duración de cada fase de los trabajos.")
+            lines.append("# TYPE ytmp3_phase_seconds histogram")
+            for phase, histogram in sorted(self._durations.items()):
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    lines.append(f'ytmp3_phase_seconds_bucket{{phase="{phase}",le="{bound}"}} {count}')
+                lines.append(f'ytmp3_phase_seconds_bucket{{phase="{phase}",le="+Inf"}} {histogram.count}')
+                lines.append(f'ytmp3_phase_seconds_sum{{phase="{phase}"}} {histogram.sum:.6f}')
+                lines.append(f'ytmp3_phase_seconds_count{{phase="{phase}"}} {histogram.count}')
+
+            lines.append("# HELP ytmp3_bytes_total Bytes transferidos por fase.")
+            lines.append("# TYPE ytmp3_bytes_total counter")
+            for phase, size in sorted(self._bytes.items()):
+                lines.append(f'ytmp3_bytes_total{{phase="{phase}"}} {size}')
+
+            lines.append("# HELP ytmp3_phase_errors_total Intentos de una fase que terminaron con error.")
+            lines.append("# TYPE ytmp3_phase_errors_total counter")
+            for (phase, error), count in sorted(self._errors.items()):
+                lines.append(f'ytmp3_phase_errors_total{{phase="{phase}",error="{error}"}} {count}')
+
+            lines.append("# HELP ytmp3_jobs_total Trabajos terminados por resultado.")
+            lines.append("# TYPE ytmp3_jobs_total counter")
+            for result, count in sorted(self._jobs.items()):
+                lines.append(f'ytmp3_jobs_total{{result="{result}"}} {count}')
+
+            lines.append("# HELP ytmp3_retries_total Reintentos tras errores pasajeros.")
+            lines.append("# TYPE ytmp3_retries_total counter")
+            lines.append(f"ytmp3_retries_total {self._retries}")
+        return "\n".join(lines) + "\n"
+
+
+class JSONLinesSpanSink:
+    """Escribe cada span como un objeto JSON por línea"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, job, span):
+        record = dict(span._asdict(), job_id=job.id, video_id=job.info.video_id if job.info else None)
+        record["start"] = round(span.start, 6)
+        record["duration"] = round(span.duration, 6)
+        line = json.dumps(record, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+
+class MetricsServer:
+    """Sirve collector.render_prometheus() en http://host:port/metrics desde un hilo"""
+
+    def __init__(self, collector, port=9464, host="127.0.0.1"):
+        self.collector = collector
+        self.host = host
+        self.port = port
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        # Solo se importa si se pide el endpoint (ver startup.py)
+        import http.server
+
+        collector = self.collector
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = collector.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer((self.host, self.port), Handler)
+        # Con port=0 el sistema elige uno libre
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ytmp3-metrics", daemon=True)
+        self._thread.start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
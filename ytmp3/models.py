@@ -0,0 +1,129 @@
+"""
+Descripciones de videos y streams de audio independientes de pytubefix.
+Se pueden serializar a diccionarios para guardarlas en caché.
+"""
+
+from collections import namedtuple
+
+# Tramo de un video en segundos (end None: hasta el final); title es el del
+# capítulo, o None para un fragmento elegido por tiempos
+Segment = namedtuple("Segment", ["title", "start", "end"])
+
+
+def get_size_text(bytes_size):
+    """Convierte bytes a texto legible (KB, MB)"""
+    if bytes_size is None:
+        return "Desconocido"
+
+    kb_size = bytes_size / 1024
+    if kb_size < 1024:
+        return f"{kb_size:.1f} KB"
+    else:
+        mb_size = kb_size / 1024
+        return f"{mb_size:.1f} MB"
+
+
+class StreamInfo:
+    """Descripción de un stream de audio independiente de pytubefix"""
+
+    def __init__(self, itag, abr, mime_type, filesize, url=None, codec=None, source=None):
+        self.itag = itag
+        self.abr = abr
+        self.mime_type = mime_type
+        self.filesize = filesize
+        # Códec de audio según YouTube (p. ej. "opus" o "mp4a.40.2")
+        self.codec = codec
+        # URL firmada para descargar el stream directamente (None si no es posible)
+        self.url = url
+        # Objeto Stream de pytubefix del que procede (si existe)
+        self.source = source
+
+    @classmethod
+    def from_pytubefix(cls, stream):
+        # Los streams SABR solo se pueden descargar a través de pytubefix
+        url = None if getattr(stream, "is_sabr", False) else stream.url
+        return cls(
+            stream.itag, stream.abr, stream.mime_type, stream.filesize,
+            url=url, codec=stream.audio_codec, source=stream,
+        )
+
+    def to_dict(self):
+        return {
+            "itag": self.itag,
+            "abr": self.abr,
+            "mime_type": self.mime_type,
+            "filesize": self.filesize,
+            "url": self.url,
+            "codec": self.codec,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+    @property
+    def subtype(self):
+        """Formato del contenedor (mp4, webm...)"""
+        return self.mime_type.split('/')[1] if self.mime_type else "Unknown"
+
+    def label(self):
+        """Texto descriptivo para mostrar en un menú de calidades"""
+        abr = self.abr if self.abr else "Unknown"
+        return f"Calidad: {abr}, Formato: {self.subtype}, Tamaño: {get_size_text(self.filesize)}"
+
+    def __repr__(self):
+        return f"StreamInfo(itag={self.itag!r}, abr={self.abr!r}, mime_type={self.mime_type!r})"
+
+
+class VideoInfo:
+    """Metadatos de un video y sus streams de audio, ordenados por calidad descendente"""
+
+    def __init__(self, video_id, url, title, streams, source=None, duration=None, chapters=None, author=None,
+                 publish_date=None, thumbnail_url=None):
+        self.video_id = video_id
+        self.url = url
+        self.title = title
+        self.streams = streams
+        # Duración en segundos (None si se desconoce)
+        self.duration = duration
+        # Capítulos del video como Segment, en orden
+        self.chapters = chapters or []
+        # Canal, fecha de publicación (AAAA-MM-DD) y URL de la miniatura, para las etiquetas
+        self.author = author
+        self.publish_date = publish_date
+        self.thumbnail_url = thumbnail_url
+        # Objeto YouTube de pytubefix del que procede (si existe)
+        self.source = source
+
+    def to_dict(self):
+        return {
+            "video_id": self.video_id,
+            "url": self.url,
+            "title": self.title,
+            "streams": [stream.to_dict() for stream in self.streams],
+            "duration": self.duration,
+            "chapters": [list(chapter) for chapter in self.chapters],
+            "author": self.author,
+            "publish_date": self.publish_date,
+            "thumbnail_url": self.thumbnail_url,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["video_id"],
+            data["url"],
+            data["title"],
+            [StreamInfo.from_dict(stream) for stream in data["streams"]],
+            duration=data.get("duration"),
+            chapters=[Segment(*chapter) for chapter in data.get("chapters", [])],
+            author=data.get("author"),
+            publish_date=data.get("publish_date"),
+            thumbnail_url=data.get("thumbnail_url"),
+        )
+
+    def stream_by_itag(self, itag):
+        for stream in self.streams:
+            if stream.itag == itag:
+                return stream
+        return None
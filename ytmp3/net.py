@@ -0,0 +1,389 @@
+"""
+Capa HTTP compartida
+----------------------------------------------------
+Un único ConnectionPool mantiene conexiones keep-alive abiertas por host
+(con un máximo configurable) y una caché de DNS, para que cientos de
+trabajos no repitan el saludo TCP/TLS en cada petición.
+
+El pool se expone como un opener de urllib: urlopen() de este módulo lo
+usa siempre, e install() lo instala como opener global para que también lo
+aprovechen las peticiones que hace pytubefix internamente.
+"""
+
+import http.client
+import io
+import socket
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import urllib.response
+
+from .errors import parse_retry_after
+from .ratelimit import TokenBucket
+from .retry import HostGuard
+
+# Cuerpo máximo que se lee de una respuesta de error para poder reutilizar la conexión
+MAX_DRAIN_SIZE = 1024 * 1024
+
+
+class DNSCache:
+    """Resuelve nombres de host y guarda el resultado durante ttl segundos"""
+
+    def __init__(self, ttl=300):
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def resolve(self, host, port):
+        key = (host, port)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                return entry[0]
+
+        family, _, _, _, address = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+        with self._lock:
+            self._entries[key] = (address, now + self.ttl)
+        return address
+
+    def invalidate(self, host, port):
+        with self._lock:
+            self._entries.pop((host, port), None)
+
+
+class PooledResponse(http.client.HTTPResponse):
+    """Respuesta que devuelve su conexión al pool cuando se ha leído entera"""
+
+    on_finish = None
+    _closing_early = False
+
+    def _close_conn(self):
+        super()._close_conn()
+        self._finish(not self._closing_early)
+
+    def close(self):
+        if self.fp is not None:
+            # Se cierra sin haber leído todo: la conexión no es reutilizable
+            self._closing_early = True
+        super().close()
+        self._finish(False)
+
+    def _finish(self, reusable):
+        callback, self.on_finish = self.on_finish, None
+        if callback is not None:
+            callback(reusable and not self.will_close)
+
+
+class _PooledHTTPConnection(http.client.HTTPConnection):
+    response_class = PooledResponse
+
+    def __init__(self, host, port=None, dns_cache=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.dns_cache = dns_cache
+
+    def _open_socket(self):
+        try:
+            address = self.dns_cache.resolve(self.host, self.port)
+            sock = socket.create_connection(address, self.timeout, self.source_address)
+        except OSError:
+            self.dns_cache.invalidate(self.host, self.port)
+            raise
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def connect(self):
+        self.sock = self._open_socket()
+
+
+class _PooledHTTPSConnection(http.client.HTTPSConnection):
+    response_class = PooledResponse
+
+    def __init__(self, host, port=None, dns_cache=None, **kwargs):
+        super().__init__(host, port, **kwargs)
+        self.dns_cache = dns_cache
+
+    _open_socket = _PooledHTTPConnection._open_socket
+
+    def connect(self):
+        self.sock = self._context.wrap_socket(self._open_socket(), server_hostname=self.host)
+
+
+class ConnectionPool:
+    """
+    Conexiones HTTP/HTTPS reutilizables agrupadas por (esquema, host, puerto).
+
+    Como mucho max_per_host conexiones por host están en uso a la vez; las
+    peticiones adicionales esperan a que se libere una.
+
+    Si se asigna health (un health.HealthMonitor), cada petición le informa
+    de si se pudo completar o falló por un problema de red.
+
+    guard (un retry.HostGuard) decide antes de cada petición si el host
+    admite tráfico (circuito cerrado y sin Retry-After pendiente) y aprende
+    de cada respuesta; None lo desactiva.
+
+    Con request_rate, como mucho esas peticiones por segundo a cada host
+    (ver set_request_rate).
+    """
+
+    health = None
+
+    def __init__(self, max_per_host=8, timeout=30, dns_ttl=300):
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.dns_cache = DNSCache(dns_ttl)
+        self.guard = HostGuard()
+        self.request_rate = None
+        self._host_rates = {}
+        # Cargar los certificados de la CA cuesta decenas de ms: solo con la primera conexión HTTPS
+        self._ssl_context = None
+        self._idle = {}
+        self._slots = {}
+        self._lock = threading.Lock()
+
+        self.connections_created = 0
+        self.requests = 0
+        self.reused = 0
+
+    def stats(self):
+        return {
+            "connections": self.connections_created,
+            "requests": self.requests,
+            "reused": self.reused,
+        }
+
+    def set_request_rate(self, rate):
+        """Limita las peticiones por segundo a cada host (None = sin límite); vale en marcha"""
+        with self._lock:
+            self.request_rate = rate
+            buckets = list(self._host_rates.values())
+        for bucket in buckets:
+            bucket.set_rate(rate, burst=1)
+
+    def _throttle(self, host):
+        with self._lock:
+            if self.request_rate is None and not self._host_rates:
+                return
+            bucket = self._host_rates.get(host)
+            if bucket is None:
+                bucket = self._host_rates[host] = TokenBucket(self.request_rate, burst=1)
+        bucket.acquire()
+
+    @property
+    def ssl_context(self):
+        if self._ssl_context is None:
+            self._ssl_context = ssl.create_default_context()
+        return self._ssl_context
+
+    def close(self):
+        """Cierra todas las conexiones inactivas"""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def request(self, method, url, body=None, headers=None, timeout=None):
+        """Hace una petición sin seguir redirecciones ni convertir errores en excepciones"""
+        parts = urllib.parse.urlsplit(url)
+        selector = parts.path or "/"
+        if parts.query:
+            selector += "?" + parts.query
+        return self._request(parts.scheme, parts.netloc, method, selector, body, headers or {}, timeout)
+
+    def _request(self, scheme, host, method, selector, body, headers, timeout):
+        guard = self.guard
+        if guard is not None:
+            guard.before_request(host)
+        self._throttle(host)
+        connection, key, slots, reused = self._acquire(scheme, host, timeout)
+        try:
+            try:
+                response = self._send(connection, method, selector, body, headers, timeout)
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                if not reused:
+                    raise
+                # El servidor cerró la conexión inactiva: se repite con una nueva
+                connection.close()
+                connection = self._new_connection(scheme, host, timeout)
+                reused = False
+                response = self._send(connection, method, selector, body, headers, timeout)
+        except BaseException as e:
+            connection.close()
+            self._release(key, slots, connection, False)
+            if isinstance(e, (OSError, http.client.HTTPException)):
+                if self.health is not None:
+                    self.health.record_failure(e)
+                if guard is not None:
+                    guard.record_failure(host)
+            raise
+
+        if self.health is not None:
+            self.health.record_success()
+        if guard is not None:
+            self._record_status(guard, host, response)
+        with self._lock:
+            self.requests += 1
+            if reused:
+                self.reused += 1
+
+        def on_finish(reusable):
+            self._release(key, slots, connection, reusable)
+
+        if response.isclosed():
+            # Respuestas sin cuerpo (HEAD, 204, 304...)
+            self._release(key, slots, connection, not response.will_close)
+        else:
+            response.on_finish = on_finish
+        return response
+
+    def _record_status(self, guard, host, response):
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        if response.status == 429 or (response.status == 503 and retry_after is not None):
+            guard.record_rate_limit(host, retry_after)
+        elif response.status >= 500:
+            guard.record_failure(host)
+        else:
+            guard.record_success(host)
+
+    def _send(self, connection, method, selector, body, headers, timeout):
+        if connection.sock is not None and isinstance(timeout, (int, float)):
+            connection.sock.settimeout(timeout)
+        connection.request(method, selector, body, headers)
+        return connection.getresponse()
+
+    def _acquire(self, scheme, host, timeout):
+        key = (scheme, host)
+        with self._lock:
+            slots = self._slots.get(key)
+            if slots is None:
+                slots = self._slots[key] = threading.BoundedSemaphore(self.max_per_host)
+        if not slots.acquire(timeout=self.timeout):
+            raise TimeoutError(f"No hay conexiones libres hacia {host}")
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), key, slots, True
+        try:
+            return self._new_connection(scheme, host, timeout), key, slots, False
+        except BaseException:
+            slots.release()
+            raise
+
+    def _new_connection(self, scheme, host, timeout):
+        if not isinstance(timeout, (int, float)):
+            timeout = self.timeout
+        if scheme == "https":
+            connection = _PooledHTTPSConnection(
+                host, dns_cache=self.dns_cache, timeout=timeout, context=self.ssl_context
+            )
+        elif scheme == "http":
+            connection = _PooledHTTPConnection(host, dns_cache=self.dns_cache, timeout=timeout)
+        else:
+            raise ValueError(f"Esquema no soportado: {scheme}")
+        with self._lock:
+            self.connections_created += 1
+        return connection
+
+    def _release(self, key, slots, connection, reusable):
+        if reusable and connection.sock is not None:
+            with self._lock:
+                self._idle.setdefault(key, []).append(connection)
+        else:
+            connection.close()
+        slots.release()
+
+
+class PooledHandler(urllib.request.HTTPHandler, urllib.request.HTTPSHandler):
+    """Handler de urllib que envía las peticiones a través de un ConnectionPool"""
+
+    def __init__(self, pool):
+        urllib.request.HTTPHandler.__init__(self)
+        self.pool = pool
+
+    def http_open(self, req):
+        return self._open(req)
+
+    def https_open(self, req):
+        return self._open(req)
+
+    def _open(self, req):
+        if req._tunnel_host:
+            # HTTPS a través de un proxy: se usa la implementación estándar
+            return self.do_open(http.client.HTTPSConnection, req, context=self.pool.ssl_context)
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update({k: v for k, v in req.headers.items() if k not in headers})
+        headers = {name.title(): value for name, value in headers.items()}
+        try:
+            response = self.pool._request(
+                req.type, req.host, req.get_method(), req.selector, req.data, headers, req.timeout
+            )
+        except OSError as err:
+            raise urllib.error.URLError(err)
+
+        if response.status >= 300:
+            # urllib no cierra las respuestas de error ni las redirecciones de
+            # forma fiable: se leen ya para liberar la conexión
+            response = self._drain(response, req)
+        response.url = req.get_full_url()
+        response.msg = response.reason
+        return response
+
+    def _drain(self, response, req):
+        length = response.length
+        if length is not None and length > MAX_DRAIN_SIZE:
+            response.close()
+            body = b""
+        else:
+            body = response.read()
+        drained = urllib.response.addinfourl(io.BytesIO(body), response.headers, req.get_full_url(), response.status)
+        drained.reason = response.reason
+        return drained
+
+
+default_pool = ConnectionPool()
+_opener = None
+_opener_lock = threading.Lock()
+
+
+def build_opener(pool=None):
+    """Opener de urllib que usa el pool indicado (por defecto, el compartido)"""
+    return urllib.request.build_opener(PooledHandler(pool or default_pool))
+
+
+def get_opener():
+    global _opener
+    with _opener_lock:
+        if _opener is None:
+            _opener = build_opener()
+        return _opener
+
+
+def urlopen(url, data=None, timeout=socket._GLOBAL_DEFAULT_TIMEOUT):
+    """Como urllib.request.urlopen, pero reutilizando las conexiones del pool compartido"""
+    return get_opener().open(url, data, timeout)
+
+
+def install():
+    """Instala el opener del pool como global de urllib (lo usa también pytubefix)"""
+    urllib.request.install_opener(get_opener())
+
+
+def configure(max_per_host=None, timeout=None, dns_ttl=None, request_rate=None):
+    """Ajusta el pool compartido; afecta a las conexiones que se creen a partir de ahora"""
+    if max_per_host is not None:
+        with default_pool._lock:
+            default_pool.max_per_host = max_per_host
+            default_pool._slots.clear()
+    if timeout is not None:
+        default_pool.timeout = timeout
+    if dns_ttl is not None:
+        default_pool.dns_cache.ttl = dns_ttl
+    if request_rate is not None:
+        default_pool.set_request_rate(request_rate)
@@ -0,0 +1,69 @@
+"""
+Listas de reproducción y canales
+----------------------------------------------------
+Expande una URL de lista o de canal en las URLs de sus videos de forma
+perezosa: pytubefix pide cada página (unos 100 videos) solo cuando se han
+consumido las anteriores, así que los primeros trabajos pueden encolarse y
+empezar a descargarse mientras el resto de la lista aún no se ha leído.
+"""
+
+import re
+
+from .engine import extract_video_id
+from .errors import EngineError, connection_error
+
+PLAYLIST_REGEX = r'(https?://)?(www\.|m\.|music\.)?youtube\.com/playlist\?(.*&)?list=([\w-]+)'
+CHANNEL_REGEX = r'(https?://)?(www\.|m\.)?youtube\.com/(@[\w.-]+|channel/[\w-]+|c/[\w.-]+|user/[\w.-]+)/?(videos)?/?$'
+
+
+def is_playlist_url(url):
+    return re.match(PLAYLIST_REGEX, url) is not None
+
+
+def is_channel_url(url):
+    return re.match(CHANNEL_REGEX, url) is not None
+
+
+def is_collection_url(url):
+    """Indica si la URL es de una lista de reproducción o de un canal"""
+    return is_playlist_url(url) or is_channel_url(url)
+
+
+def expand_url(url):
+    """
+    Genera las URLs de los videos de una lista o canal, página a página.
+    Cualquier otra URL se devuelve tal cual.
+    """
+    if not is_collection_url(url):
+        yield url
+        return
+
+    from pytubefix import Channel, Playlist
+
+    try:
+        source = Playlist(url) if is_playlist_url(url) else Channel(url)
+        videos = source.url_generator()
+        seen = set()
+        for video_url in videos:
+            # Una lista puede contener el mismo video varias veces
+            video_id = extract_video_id(video_url)
+            if video_id in seen:
+                continue
+            seen.add(video_id)
+            yield video_url
+    except Exception as e:
+        raise connection_error(e)
+
+
+def expand_urls(urls, on_error=None):
+    """
+    Expande varias URLs seguidas. Si se indica on_error(url, error), un fallo
+    al leer una lista se notifica y se continúa con la siguiente URL.
+    """
+    for url in urls:
+        try:
+            yield from expand_url(url)
+        except EngineError as e:
+            if on_error is None:
+                raise
+            on_error(url, e)
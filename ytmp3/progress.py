@@ -0,0 +1,227 @@
+"""
+Progreso agregado
+----------------------------------------------------
+El motor emite un evento "progress" por cada bloque descargado, cientos por
+segundo en una conexión rápida. ProgressAggregator recibe esos eventos,
+recuerda qué trabajos han cambiado y entrega a los frontends una única
+instantánea de todos ellos como mucho cada interval segundos, con velocidad
+y tiempo restante calculados sobre una ventana móvil. Los cambios de estado
+(y el final de cada trabajo) se entregan enseguida.
+
+Las instantáneas van a sinks: cualquier callable que reciba un
+ProgressSnapshot. Aquí están los de Tk, consola y JSON por líneas.
+"""
+
+import json
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+
+from .engine import BatchProgress, JobState
+from .models import get_size_text
+
+# Progreso de un trabajo; progress es el de la descarga y convert_progress el de
+# la conversión (porcentajes), speed en bytes/s y eta en segundos (None si se desconoce)
+JobProgress = namedtuple(
+    "JobProgress",
+    ["job_id", "title", "state", "progress", "bytes_downloaded", "total_bytes", "speed", "eta",
+     "convert_progress"],
+)
+
+# Eventos frecuentes que se agrupan; el resto se entregan enseguida
+COALESCED_EVENTS = ("progress", "convert_progress")
+# Eventos que no cambian el progreso (las métricas de metrics.py)
+IGNORED_EVENTS = ("span",)
+
+# Instantánea entregada a los sinks: time es la hora (time.time()) y jobs son
+# los trabajos sin terminar
+ProgressSnapshot = namedtuple("ProgressSnapshot", ["time", "jobs", "batch", "speed", "eta"])
+
+
+def format_speed(speed):
+    return f"{get_size_text(speed)}/s" if speed else "--"
+
+
+def format_eta(eta):
+    if eta is None:
+        return "--"
+    minutes, seconds = divmod(int(eta), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes}:{seconds:02d}"
+
+
+class RateMeter:
+    """Velocidad media en bytes/s durante los últimos window segundos"""
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self._samples = deque()
+
+    def add(self, now, total_bytes):
+        self._samples.append((now, total_bytes))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+
+    def rate(self):
+        if len(self._samples) < 2:
+            return 0.0
+        (start, start_bytes), (end, end_bytes) = self._samples[0], self._samples[-1]
+        if end <= start:
+            return 0.0
+        return max(0.0, (end_bytes - start_bytes) / (end - start))
+
+
+class ProgressAggregator:
+    """
+    Callback de eventos (Engine.on_event) que limita y agrupa el progreso.
+
+    interval: segundos mínimos entre dos instantáneas de progreso
+    window: segundos de la ventana para calcular la velocidad
+    """
+
+    def __init__(self, sinks=(), interval=0.25, window=5.0):
+        self.sinks = list(sinks)
+        self.interval = interval
+        self.window = window
+
+        self._jobs = {}
+        self._meters = {}
+        self._last_flush = 0.0
+        self._lock = threading.Lock()
+
+        # Para medir cuánto se reduce el tráfico hacia los frontends
+        self.events_received = 0
+        self.snapshots_sent = 0
+
+    def add_sink(self, sink):
+        self.sinks.append(sink)
+
+    def __call__(self, event):
+        self.handle(event)
+
+    def handle(self, event):
+        if event.kind in IGNORED_EVENTS:
+            return
+        now = time.monotonic()
+        with self._lock:
+            self.events_received += 1
+            self._jobs[event.job.id] = event.job
+            if event.kind in COALESCED_EVENTS and now - self._last_flush < self.interval:
+                return
+            self._last_flush = now
+            snapshot = self._snapshot(now)
+            self.snapshots_sent += 1
+
+        for sink in self.sinks:
+            sink(snapshot)
+
+    def snapshot(self):
+        """Instantánea actual, sin esperar al siguiente evento"""
+        with self._lock:
+            return self._snapshot(time.monotonic())
+
+    def _snapshot(self, now):
+        jobs = []
+        done = failed = cancelled = 0
+        bytes_downloaded = total_bytes = 0
+        percentage = 0.0
+        for job_id, job in self._jobs.items():
+            bytes_downloaded += job.bytes_downloaded
+            total_bytes += job.total_bytes or 0
+            percentage += job.progress
+            if job.state == JobState.DONE:
+                done += 1
+            elif job.state == JobState.FAILED:
+                failed += 1
+            elif job.state == JobState.CANCELLED:
+                cancelled += 1
+            if job.state in JobState.FINISHED:
+                self._meters.pop(job_id, None)
+                continue
+
+            meter = self._meters.get(job_id)
+            if meter is None:
+                meter = self._meters[job_id] = RateMeter(self.window)
+            meter.add(now, job.bytes_downloaded)
+            speed = meter.rate() if job.state == JobState.DOWNLOADING else 0.0
+            eta = None
+            if speed and job.total_bytes:
+                eta = max(0.0, job.total_bytes - job.bytes_downloaded) / speed
+            jobs.append(JobProgress(
+                job_id, job.title, job.state, job.progress,
+                job.bytes_downloaded, job.total_bytes, speed, eta, job.convert_progress,
+            ))
+
+        count = len(self._jobs)
+        batch = BatchProgress(
+            count, done, failed, count - done - failed - cancelled,
+            bytes_downloaded, total_bytes, percentage / count if count else 0.0, cancelled,
+        )
+        speed = sum(job.speed for job in jobs)
+        remaining = sum(max(0, (job.total_bytes or 0) - job.bytes_downloaded) for job in jobs)
+        eta = remaining / speed if speed else None
+        return ProgressSnapshot(time.time(), jobs, batch, speed, eta)
+
+
+class TkSink:
+    """
+    Entrega las instantáneas en el hilo de Tk. Como mucho hay una llamada
+    pendiente en la cola de Tk: si llega otra instantánea antes de que se
+    ejecute, simplemente la sustituye.
+    """
+
+    def __init__(self, root, callback):
+        self.root = root
+        self.callback = callback
+        self._pending = None
+        self._lock = threading.Lock()
+
+    def __call__(self, snapshot):
+        with self._lock:
+            scheduled = self._pending is not None
+            self._pending = snapshot
+        if not scheduled:
+            self.root.after(0, self._deliver)
+
+    def _deliver(self):
+        with self._lock:
+            snapshot, self._pending = self._pending, None
+        if snapshot is not None:
+            self.callback(snapshot)
+
+
+class ConsoleSink:
+    """Muestra una línea con el progreso total"""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stderr
+
+    def __call__(self, snapshot):
+        batch = snapshot.batch
+        print(
+            f"Progreso total: {batch.done + batch.failed + batch.cancelled}/{batch.total} trabajos, "
+            f"{batch.percentage:.1f}%, {format_speed(snapshot.speed)}, "
+            f"quedan {format_eta(snapshot.eta)}",
+            file=self.stream,
+        )
+
+
+class JSONLinesSink:
+    """Escribe cada instantánea como un objeto JSON por línea"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._lock = threading.Lock()
+
+    def __call__(self, snapshot):
+        line = json.dumps({
+            "time": round(snapshot.time, 3),
+            "batch": snapshot.batch._asdict(),
+            "speed": snapshot.speed,
+            "eta": snapshot.eta,
+            "jobs": [job._asdict() for job in snapshot.jobs],
+        }, ensure_ascii=False)
+        with self._lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
@@ -0,0 +1,129 @@
+"""
+Límites de ancho de banda y de peticiones
+----------------------------------------------------
+Cubos de fichas (token bucket) para no saturar un enlace compartido ni
+provocar que el servidor limite las descargas:
+  - RateLimiter limita los bytes por segundo y las peticiones por segundo.
+    El Engine tiene uno para todas las descargas y cada Job el suyo.
+  - El pool de net.py limita además las peticiones por segundo a cada host.
+Todos los límites se pueden cambiar en marcha; las descargas en curso se
+adaptan en menos de una décima de segundo.
+"""
+
+import re
+import threading
+import time
+
+# Espera máxima de una vez, para notar enseguida un cambio de límite o una cancelación
+MAX_SLEEP = 0.1
+
+_UNITS = {"": 1, "K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_rate(text):
+    """Convierte '500K', '2M' o '1.5M' en bytes por segundo"""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([KMG]?)(?:i?B)?\s*", text, re.IGNORECASE)
+    if match is None:
+        raise ValueError(f"Límite no válido: {text!r} (ejemplos: 500K, 2M)")
+    return float(match.group(1)) * _UNITS[match.group(2).upper()]
+
+
+class TokenBucket:
+    """
+    rate: fichas por segundo (None = sin límite)
+    burst: fichas que se pueden acumular (por defecto, las de un segundo)
+
+    Una petición mayor que burst se concede cuando el cubo está lleno y deja
+    una deuda que retrasa a las siguientes, así que la media se respeta.
+    """
+
+    def __init__(self, rate=None, burst=None):
+        self._lock = threading.Lock()
+        self.rate = None
+        self.burst = None
+        self._tokens = 0.0
+        self._updated = time.monotonic()
+        self.set_rate(rate, burst)
+
+    def set_rate(self, rate, burst=None):
+        """Cambia el límite; afecta también a quien esté esperando"""
+        with self._lock:
+            self._refill()
+            unlimited = self.rate is None
+            self.rate = rate if rate and rate > 0 else None
+            self.burst = burst or self.rate
+            if self.rate is not None:
+                # Al pasar de sin límite a con límite se empieza con el cubo lleno
+                self._tokens = self.burst if unlimited else min(self._tokens, self.burst)
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, amount=1, cancel=None):
+        """Espera hasta poder gastar amount fichas; cancel (un CancelToken) interrumpe la espera"""
+        while True:
+            with self._lock:
+                if self.rate is None:
+                    return
+                self._refill()
+                needed = min(amount, self.burst)
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                delay = min((needed - self._tokens) / self.rate, MAX_SLEEP)
+            if cancel is None:
+                time.sleep(delay)
+            else:
+                cancel.wait(delay)
+                cancel.check()
+
+
+class RateLimiter:
+    """
+    bandwidth: bytes por segundo (None = sin límite)
+    requests: peticiones HTTP por segundo (None = sin límite)
+    """
+
+    def __init__(self, bandwidth=None, requests=None):
+        self._bandwidth = TokenBucket(bandwidth)
+        self._requests = TokenBucket(requests, burst=1)
+
+    @property
+    def bandwidth(self):
+        return self._bandwidth.rate
+
+    @property
+    def requests(self):
+        return self._requests.rate
+
+    def set_bandwidth(self, rate):
+        self._bandwidth.set_rate(rate)
+
+    def set_request_rate(self, rate):
+        self._requests.set_rate(rate, burst=1)
+
+    def request(self, cancel=None):
+        """Antes de cada petición"""
+        self._requests.acquire(1, cancel)
+
+    def consume(self, size, cancel=None):
+        """Tras recibir size bytes"""
+        self._bandwidth.acquire(size, cancel)
+
+
+class LimitChain:
+    """Aplica varios RateLimiter a la vez (p. ej. el del motor y el del trabajo)"""
+
+    def __init__(self, *limiters):
+        self.limiters = [limiter for limiter in limiters if limiter is not None]
+
+    def request(self, cancel=None):
+        for limiter in self.limiters:
+            limiter.request(cancel)
+
+    def consume(self, size, cancel=None):
+        for limiter in self.limiters:
+            limiter.consume(size, cancel)
@@ -0,0 +1,191 @@
+"""
+Reintentos y protección de los servidores
+----------------------------------------------------
+RetryPolicy reintenta las operaciones que fallan con un error pasajero
+(errors.TransientError) con espera exponencial y jitter completo, para que
+cientos de trabajos que fallan a la vez no vuelvan a la vez. Si el servidor
+indicó Retry-After, se espera al menos eso.
+
+HostGuard lleva por host un circuito y el bloqueo pedido por el servidor:
+  - tras failure_threshold fallos seguidos el circuito se abre y durante
+    reset_timeout segundos las peticiones fallan sin llegar a la red; después
+    se deja pasar una de prueba y, si va bien, se cierra,
+  - tras un 429 (o un 503 con Retry-After) no se envía nada al host hasta que
+    pase ese tiempo.
+El pool de net.py consulta el HostGuard antes de cada petición.
+"""
+
+import random
+import threading
+import time
+
+from .errors import EngineError, HostUnavailable, JobCancelled, RateLimited
+
+
+def spends_attempt(error):
+    """Las peticiones que HostGuard frena sin enviarlas no gastan intentos: solo esperan"""
+    return not getattr(error, "rejected", False)
+
+
+class RetryPolicy:
+    """
+    max_attempts: intentos en total (1 = sin reintentos)
+    base_delay: espera máxima antes del primer reintento; se duplica en cada uno
+    max_delay: tope de la espera exponencial
+    max_retry_after: tope de lo que se respeta de Retry-After
+    """
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=30.0, max_retry_after=300.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def should_retry(self, attempt, error):
+        """Indica si tras el intento número attempt (desde 1) que falló con error se reintenta"""
+        return attempt < self.max_attempts and getattr(error, "retryable", False)
+
+    def delay(self, attempt, error=None):
+        """Segundos de espera antes del intento attempt + 1"""
+        # Jitter completo: un valor al azar entre 0 y la espera exponencial
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.max_retry_after))
+        return delay
+
+    def call(self, function, cancel=None, on_retry=None):
+        """
+        Llama a function() hasta que funcione o falle con un error que no se
+        reintenta. on_retry(intento, espera, error) se llama antes de cada
+        espera; cancel (un CancelToken) interrumpe la espera.
+        """
+        attempt = 1
+        while True:
+            try:
+                return function()
+            except EngineError as e:
+                if not self.should_retry(attempt, e):
+                    raise
+                delay = self.delay(attempt, e)
+                if on_retry is not None:
+                    on_retry(attempt, delay, e)
+                if cancel is None:
+                    time.sleep(delay)
+                elif cancel.wait(delay):
+                    raise JobCancelled()
+                if spends_attempt(e):
+                    attempt += 1
+
+
+# Una política que no reintenta, para desactivar los reintentos
+NO_RETRY = RetryPolicy(max_attempts=1)
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        # Momento en que salió la petición de prueba con el circuito medio abierto
+        self._probe_started = None
+
+    def remaining(self, now):
+        """Segundos hasta que se permita la petición de prueba (0 si ya se permite)"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.opened_at + self.reset_timeout - now)
+
+    def allow(self, now):
+        if self.state == self.OPEN and self.remaining(now) == 0:
+            self.state = self.HALF_OPEN
+            self._probe_started = None
+        if self.state == self.HALF_OPEN:
+            # Solo una petición de prueba a la vez (otra si la anterior nunca informó)
+            if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                return False
+            self._probe_started = now
+            return True
+        return self.state == self.CLOSED
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probe_started = None
+
+    def record_failure(self, now):
+        self.failures += 1
+        if self.state == self.OPEN:
+            # Peticiones que salieron antes de abrirse: no alargan la espera
+            return
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = now
+            self._probe_started = None
+
+
+class HostGuard:
+    """Circuito y bloqueo por Retry-After de cada host, compartido por todas las peticiones"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, max_retry_after=300.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.max_retry_after = max_retry_after
+        self._breakers = {}
+        self._blocked_until = {}
+        self._lock = threading.Lock()
+
+        # Peticiones rechazadas sin llegar a la red
+        self.rejected = 0
+
+    def _breaker(self, host):
+        breaker = self._breakers.get(host)
+        if breaker is None:
+            breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        return breaker
+
+    def before_request(self, host):
+        """Lanza RateLimited o HostUnavailable si no se debe enviar nada al host ahora"""
+        now = time.monotonic()
+        with self._lock:
+            blocked = self._blocked_until.get(host, 0) - now
+            if blocked > 0:
+                self.rejected += 1
+                raise RateLimited(f"Demasiadas peticiones a {host}. Se reintentará más tarde.", blocked,
+                                  rejected=True)
+            breaker = self._breaker(host)
+            if not breaker.allow(now):
+                self.rejected += 1
+                raise HostUnavailable(
+                    f"{host} no responde tras {breaker.failures} fallos seguidos. Se reintentará más tarde.",
+                    # Con la petición de prueba en curso, se vuelve a mirar en un momento
+                    breaker.remaining(now) or min(1.0, self.reset_timeout),
+                    rejected=True,
+                )
+
+    def record_success(self, host):
+        with self._lock:
+            self._breaker(host).record_success()
+
+    def record_failure(self, host):
+        """Fallo de red o error 5xx"""
+        with self._lock:
+            self._breaker(host).record_failure(time.monotonic())
+
+    def record_rate_limit(self, host, retry_after):
+        """429 (o 503 con Retry-After): nadie envía nada al host hasta que pase retry_after"""
+        if retry_after is None:
+            return
+        with self._lock:
+            until = time.monotonic() + min(retry_after, self.max_retry_after)
+            self._blocked_until[host] = max(self._blocked_until.get(host, 0), until)
+
+    def state(self, host):
+        with self._lock:
+            return self._breaker(host).state
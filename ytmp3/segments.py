@@ -0,0 +1,358 @@
+"""
+Fragmentos y capítulos
+----------------------------------------------------
+Un Job con segments (o chapters) solo convierte esos tramos del video:
+  - del contenedor se lee el índice (sidx en MP4, Cues en WebM), que dice en
+    qué byte empieza cada fragmento de unos segundos de audio;
+  - se descargan la cabecera y los fragmentos que cubren los tramos, en un
+    archivo disperso del tamaño del original (el resto queda sin descargar);
+  - ffmpeg busca con ese mismo índice (-ss antes de -i) y codifica cada tramo
+    a su archivo, todos en un solo proceso.
+Los tramos contiguos o cercanos se leen como una única entrada, de modo que
+partir una mezcla de varias horas en capítulos es una sola pasada.
+
+Si el stream no tiene un índice que ffmpeg pueda usar, o los tramos cubren
+casi todo el archivo, se descarga entero como siempre.
+"""
+
+import re
+import struct
+from collections import namedtuple
+
+from .models import Segment
+
+# Tramos separados por menos de estos segundos se decodifican de una vez
+MERGE_GAP = 30.0
+# Audio que se descarga antes de cada tramo para que el decodificador arranque
+PREROLL = 1.0
+# Bytes que se piden al principio para leer la cabecera y el índice
+HEAD_SIZE = 256 * 1024
+# Si hay que descargar más de esta fracción del archivo, se descarga entero
+WHOLE_FILE_RATIO = 0.9
+
+# start y end en segundos (end None: hasta el final); segments son los
+# índices en la lista original de los tramos que se leen en esta pasada
+Run = namedtuple("Run", ["start", "end", "segments"])
+
+# Un fragmento del índice: segundo en que empieza, byte en que empieza y tamaño
+IndexEntry = namedtuple("IndexEntry", ["time", "offset", "size"])
+
+# entries: fragmentos ordenados; header: bytes del principio que ffmpeg lee
+# siempre; extra: otros rangos (inicio, fin) que necesita (p. ej. Cues al final)
+MediaIndex = namedtuple("MediaIndex", ["entries", "header", "extra"])
+
+
+def parse_time(text):
+    """Segundos a partir de "90", "1:30" o "1:02:03.5"; lanza ValueError si no es válido"""
+    parts = text.strip().split(":")
+    if not 1 <= len(parts) <= 3 or not all(re.fullmatch(r"\d+(\.\d+)?", part) for part in parts):
+        raise ValueError(f"Tiempo no válido: '{text}' (use segundos, M:SS o H:MM:SS)")
+    seconds = 0.0
+    for part in parts:
+        seconds = seconds * 60 + float(part)
+    return seconds
+
+
+def parse_segment(text):
+    """Segment a partir de "1:30-2:45"; sin inicio empieza en 0 y sin fin llega al final"""
+    start, separator, end = text.partition("-")
+    if not separator:
+        raise ValueError(f"Fragmento no válido: '{text}' (use INICIO-FIN, p. ej. 1:30-2:45)")
+    segment = Segment(None, parse_time(start) if start.strip() else 0.0, parse_time(end) if end.strip() else None)
+    if segment.end is not None and segment.end <= segment.start:
+        raise ValueError(f"Fragmento no válido: '{text}' (el fin debe ser posterior al inicio)")
+    return segment
+
+
+def format_time(seconds):
+    """Tiempo para un nombre de archivo, p. ej. "1h02m03s" o "02m03s" """
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, seconds = divmod(rest, 60)
+    if hours:
+        return f"{hours}h{minutes:02d}m{seconds:02d}s"
+    return f"{minutes:02d}m{seconds:02d}s"
+
+
+def segment_label(segment):
+    """Texto que distingue el archivo del fragmento: el título del capítulo o los tiempos"""
+    if segment.title:
+        return segment.title
+    end = format_time(segment.end) if segment.end is not None else "fin"
+    return f"{format_time(segment.start)}-{end}"
+
+
+def group_runs(segments, max_gap=MERGE_GAP):
+    """Agrupa los tramos cercanos (en orden de inicio) en pasadas de lectura"""
+    runs = []
+    for index in sorted(range(len(segments)), key=lambda index: segments[index].start):
+        segment = segments[index]
+        if runs and runs[-1].end is not None and segment.start <= runs[-1].end + max_gap:
+            last = runs[-1]
+            end = None if segment.end is None else max(last.end, segment.end)
+            runs[-1] = Run(last.start, end, last.segments + [index])
+        else:
+            runs.append(Run(segment.start, segment.end, [index]))
+    return runs
+
+
+def plan_ranges(fetch, size, segments):
+    """
+    Rangos de bytes (inicio, fin incluidos) que hay que descargar para
+    convertir los tramos, o None si hay que descargar el archivo entero.
+    fetch(inicio, longitud) devuelve esos bytes del stream, o None si el
+    servidor no admite rangos.
+    """
+    if not size:
+        return None
+    index = read_index(fetch, size)
+    if index is None:
+        return None
+    ranges = byte_ranges(index, group_runs(segments), size)
+    if sum(end - start + 1 for start, end in ranges) >= size * WHOLE_FILE_RATIO:
+        return None
+    return ranges
+
+
+def byte_ranges(index, runs, size):
+    """Rangos de bytes con la cabecera, el primer fragmento y los que cubren cada pasada"""
+    entries = index.entries
+    # ffmpeg lee el primer fragmento al abrir el archivo
+    ranges = [(0, index.header - 1), (entries[0].offset, entries[0].offset + entries[0].size - 1)]
+    ranges += index.extra
+    for run in runs:
+        start = max(0.0, run.start - PREROLL)
+        selected = [
+            entry for position, entry in enumerate(entries)
+            if (run.end is None or entry.time < run.end)
+            and (position + 1 == len(entries) or entries[position + 1].time > start)
+        ]
+        if selected:
+            ranges.append((selected[0].offset, min(selected[-1].offset + selected[-1].size, size) - 1))
+    return merge_ranges(ranges)
+
+
+def merge_ranges(ranges):
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def read_index(fetch, size):
+    """MediaIndex del stream (MP4 con sidx o WebM con Cues), o None si no lo tiene"""
+    head = fetch(0, min(HEAD_SIZE, size))
+    if not head or len(head) < 16:
+        return None
+    if head[4:8] == b"ftyp":
+        return _mp4_index(fetch, size, head)
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        return _webm_index(fetch, size, head)
+    return None
+
+
+def _read_bytes(fetch, head, offset, length):
+    """Bytes del stream, de la cabecera ya descargada si están en ella"""
+    if offset + length <= len(head):
+        return head[offset:offset + length]
+    return fetch(offset, length)
+
+
+# MP4 fragmentado (DASH): ftyp, moov, sidx y después pares moof + mdat
+
+def _mp4_index(fetch, size, head):
+    offset = 0
+    while offset + 8 <= size:
+        header = _read_bytes(fetch, head, offset, min(16, size - offset))
+        if not header or len(header) < 8:
+            return None
+        box_size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if box_size == 1:
+            box_size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        if box_size < header_size:
+            return None
+        if box_type == b"sidx":
+            body = _read_bytes(fetch, head, offset + header_size, box_size - header_size)
+            entries = _parse_sidx(body, offset + box_size)
+            # ffmpeg solo salta con el sidx si este llega hasta el final del archivo
+            if not entries or entries[-1].offset + entries[-1].size != size:
+                return None
+            return MediaIndex(entries, offset + box_size, [])
+        if box_type in (b"moof", b"mdat"):
+            return None
+        offset += box_size
+    return None
+
+
+def _parse_sidx(body, anchor):
+    version = body[0]
+    timescale = struct.unpack(">I", body[8:12])[0]
+    if version == 0:
+        earliest, first_offset = struct.unpack(">II", body[12:20])
+        position = 20
+    else:
+        earliest, first_offset = struct.unpack(">QQ", body[12:28])
+        position = 28
+    count = struct.unpack(">H", body[position + 2:position + 4])[0]
+    position += 4
+    if not timescale:
+        return None
+
+    entries = []
+    offset = anchor + first_offset
+    time = earliest
+    for _ in range(count):
+        reference, duration, _sap = struct.unpack(">III", body[position:position + 12])
+        position += 12
+        if reference >> 31:
+            # Índices de varios niveles: no se usan en los streams de audio de YouTube
+            return None
+        reference_size = reference & 0x7FFFFFFF
+        entries.append(IndexEntry(time / timescale, offset, reference_size))
+        offset += reference_size
+        time += duration
+    return entries
+
+
+# WebM (Matroska): cabecera EBML y un Segment con SeekHead, Info, Tracks,
+# Cues y los Cluster; las Cues pueden estar antes o después de los Cluster
+
+EBML_HEADER = 0x1A45DFA3
+SEGMENT = 0x18538067
+SEEK_HEAD = 0x114D9B74
+SEEK = 0x4DBB
+SEEK_ID = 0x53AB
+SEEK_POSITION = 0x53AC
+INFO = 0x1549A966
+TIMECODE_SCALE = 0x2AD7B1
+CUES = 0x1C53BB6B
+CUE_POINT = 0xBB
+CUE_TIME = 0xB3
+CUE_TRACK_POSITIONS = 0xB7
+CUE_CLUSTER_POSITION = 0xF1
+CLUSTER = 0x1F43B675
+
+
+def _read_vint(data, position, keep_marker=False):
+    """Entero de longitud variable de EBML: (valor o None si es "desconocido", posición siguiente)"""
+    first = data[position]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or position + length > len(data):
+        raise ValueError("EBML no válido")
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[position + 1:position + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = None
+    return value, position + length
+
+
+def _read_element(data, position):
+    element_id, position = _read_vint(data, position, keep_marker=True)
+    element_size, position = _read_vint(data, position)
+    return element_id, element_size, position
+
+
+def _children(data, start, end):
+    """(id, inicio del contenido, fin del contenido) de los elementos hijos"""
+    position = start
+    while position < end:
+        element_id, element_size, content = _read_element(data, position)
+        if element_size is None:
+            return
+        yield element_id, content, content + element_size
+        position = content + element_size
+
+
+def _read_uint(data, start, end):
+    return int.from_bytes(data[start:end], "big")
+
+
+def _webm_index(fetch, size, head):
+    try:
+        element_id, element_size, content = _read_element(head, 0)
+        if element_id != EBML_HEADER:
+            return None
+        element_id, segment_size, segment_start = _read_element(head, content + element_size)
+        if element_id != SEGMENT:
+            return None
+
+        timecode_scale = 1000000
+        cues = None
+        cues_position = None
+        extra = []
+        position = segment_start
+        while True:
+            element_id, element_size, content = _read_element(head, position)
+            if element_id == CLUSTER:
+                media_start = position
+                break
+            if element_size is None or content + element_size > len(head):
+                return None
+            if element_id == SEEK_HEAD:
+                for seek_id, seek_start, seek_end in _children(head, content, content + element_size):
+                    if seek_id != SEEK:
+                        continue
+                    fields = {child: (start, end) for child, start, end in _children(head, seek_start, seek_end)}
+                    if SEEK_ID in fields and SEEK_POSITION in fields and _read_uint(head, *fields[SEEK_ID]) == CUES:
+                        cues_position = segment_start + _read_uint(head, *fields[SEEK_POSITION])
+            elif element_id == INFO:
+                for child, start, end in _children(head, content, content + element_size):
+                    if child == TIMECODE_SCALE:
+                        timecode_scale = _read_uint(head, start, end)
+            elif element_id == CUES:
+                cues = (head, content, content + element_size)
+            position = content + element_size
+
+        if cues is None:
+            # Cues después de los Cluster: se piden aparte y también se descargan
+            if cues_position is None or cues_position >= size:
+                return None
+            header = fetch(cues_position, 16)
+            if not header:
+                return None
+            element_id, element_size, content = _read_element(header, 0)
+            if element_id != CUES or element_size is None:
+                return None
+            total = content + element_size
+            data = fetch(cues_position, total)
+            if not data or len(data) < total:
+                return None
+            cues = (data, content, total)
+            extra.append((cues_position, cues_position + total - 1))
+
+        positions = []
+        data, start, end = cues
+        for point_id, point_start, point_end in _children(data, start, end):
+            if point_id != CUE_POINT:
+                continue
+            time = cluster = None
+            for child, child_start, child_end in _children(data, point_start, point_end):
+                if child == CUE_TIME:
+                    time = _read_uint(data, child_start, child_end)
+                elif child == CUE_TRACK_POSITIONS and cluster is None:
+                    for field, field_start, field_end in _children(data, child_start, child_end):
+                        if field == CUE_CLUSTER_POSITION:
+                            cluster = _read_uint(data, field_start, field_end)
+            if time is not None and cluster is not None:
+                positions.append((time * timecode_scale / 1e9, segment_start + cluster))
+    except (ValueError, IndexError):
+        return None
+
+    positions.sort()
+    if not positions:
+        return None
+    # Cada fragmento llega hasta el siguiente; el último, hasta el final (o las Cues)
+    limit = extra[0][0] if extra else size
+    entries = []
+    for number, (time, offset) in enumerate(positions):
+        following = positions[number + 1][1] if number + 1 < len(positions) else limit
+        entries.append(IndexEntry(time, offset, following - offset))
+    return MediaIndex(entries, media_start, extra)
@@ -0,0 +1,146 @@
+"""
+Selección automática de stream
+----------------------------------------------------
+Una política declarativa elige el stream de audio de cada trabajo sin pasar
+por el menú de calidades, justo después de resolver los metadatos.
+
+La política es una lista de términos separados por comas:
+    best            mayor bitrate (por defecto)
+    smallest        archivo más pequeño
+    cheapest        menor coste estimado de descarga + conversión
+    codec=opus      solo streams de ese códec (opus, aac)
+    min-abr=128     bitrate mínimo en kbps
+    max-abr=160     bitrate máximo en kbps
+    remux           preferir streams que se copian sin recodificar
+
+Ejemplos: "best,codec=opus", "smallest,min-abr=128", "cheapest,min-abr=128".
+"""
+
+import re
+
+# Velocidad de codificación aproximada de ffmpeg, en segundos de audio por
+# segundo de CPU, para estimar el coste de convertir cada stream
+ENCODE_SPEED = {
+    "libmp3lame": 60,
+    "aac": 80,
+    "libopus": 50,
+}
+# Copiar el audio sin recodificar apenas cuesta: solo se reescribe el contenedor
+COPY_SPEED = 2000
+
+# Ancho de banda supuesto para estimar el tiempo de descarga (bytes/s)
+DEFAULT_BANDWIDTH = 2 * 1024 * 1024
+
+ORDERS = ("best", "smallest", "cheapest")
+CODEC_FAMILIES = {"opus": ("opus",), "aac": ("mp4a", "aac")}
+
+
+def abr_kbps(stream):
+    """Bitrate del stream en kbps (0 si se desconoce)"""
+    match = re.match(r"(\d+)", stream.abr or "")
+    return int(match.group(1)) if match else 0
+
+
+def codec_family(stream):
+    codec = stream.codec or ""
+    for family, prefixes in CODEC_FAMILIES.items():
+        if codec.startswith(prefixes):
+            return family
+    return codec or None
+
+
+class SelectionPolicy:
+    """Elige un stream según los filtros y el orden indicados"""
+
+    def __init__(self, order="best", codec=None, min_abr=None, max_abr=None, remux=False,
+                 bandwidth=DEFAULT_BANDWIDTH):
+        if order not in ORDERS:
+            raise ValueError(f"Orden de selección no válido: {order}")
+        self.order = order
+        self.codec = codec
+        self.min_abr = min_abr
+        self.max_abr = max_abr
+        self.remux = remux
+        self.bandwidth = bandwidth
+
+    @classmethod
+    def parse(cls, text):
+        """Crea la política a partir de su forma textual; lanza ValueError si no es válida"""
+        options = {}
+        for term in filter(None, (term.strip() for term in text.split(","))):
+            name, _, value = term.partition("=")
+            if name in ORDERS and not value:
+                options["order"] = name
+            elif name == "remux" and not value:
+                options["remux"] = True
+            elif name == "codec" and value in CODEC_FAMILIES:
+                options["codec"] = value
+            elif name in ("min-abr", "max-abr") and value.isdigit():
+                options[name.replace("-", "_")] = int(value)
+            else:
+                raise ValueError(f"Término de selección no válido: {term}")
+        return cls(**options)
+
+    def __str__(self):
+        terms = [self.order]
+        if self.codec:
+            terms.append(f"codec={self.codec}")
+        if self.min_abr is not None:
+            terms.append(f"min-abr={self.min_abr}")
+        if self.max_abr is not None:
+            terms.append(f"max-abr={self.max_abr}")
+        if self.remux:
+            terms.append("remux")
+        return ",".join(terms)
+
+    def matches(self, stream):
+        abr = abr_kbps(stream)
+        if self.codec and codec_family(stream) != self.codec:
+            return False
+        if self.min_abr is not None and abr < self.min_abr:
+            return False
+        if self.max_abr is not None and abr > self.max_abr:
+            return False
+        return True
+
+    def cost(self, stream, transcoder):
+        """Segundos estimados para descargar y convertir el stream (a todas las salidas del transcoder)"""
+        size = stream.filesize or 0
+        abr = abr_kbps(stream)
+        duration = size * 8 / (abr * 1000) if abr else 0
+        convert = 0.0
+        for output in transcoder.outputs:
+            if output.will_copy(stream.codec):
+                speed = COPY_SPEED
+            else:
+                speed = ENCODE_SPEED.get(output.output_format.encoder, 50)
+            convert += duration / speed
+        return size / self.bandwidth + convert
+
+    def sort_key(self, stream, transcoder):
+        """Clave de ordenación: se elige el stream con la clave menor"""
+        abr = abr_kbps(stream)
+        if self.order == "smallest":
+            key = (stream.filesize or float("inf"), -abr)
+        elif self.order == "cheapest":
+            key = (self.cost(stream, transcoder), -abr)
+        else:
+            key = (-abr,)
+        if self.remux:
+            # Primero los que se copian sin recodificar; dentro de cada grupo, el orden pedido
+            key = (not transcoder.will_copy(stream.codec),) + key
+        return key
+
+    def select(self, streams, transcoder):
+        """
+        Devuelve el stream elegido. Si ningún stream cumple los filtros se
+        ignoran, para que un trabajo por lotes no falle por una preferencia.
+        """
+        if not streams:
+            return None
+        candidates = [stream for stream in streams if self.matches(stream)] or list(streams)
+        return min(candidates, key=lambda stream: self.sort_key(stream, transcoder))
+
+
+# Política por defecto: el comportamiento de siempre (mayor calidad)
+DEFAULT_POLICY = SelectionPolicy()
@@ -0,0 +1,400 @@
+"""
+Archivos temporales y publicación atómica
+----------------------------------------------------
+En la carpeta de destino nunca queda un archivo a medias. StagingArea usa
+una carpeta de trabajo (por defecto ~/.cache/ytmp3/staging; mejor si está
+en un disco local rápido o en tmpfs) con:
+  downloads/       descargas en curso, con nombres por ID de video e itag,
+                   que se reanudan de una ejecución a otra (ver downloader.py)
+                   y que comparten los procesos que usan la misma carpeta:
+                   cada una tiene su DownloadLock
+  work/<sesión>/   lo que escribe ffmpeg; cada proceso tiene su sesión,
+                   bloqueada con flock mientras vive
+
+publish() hace fsync de los archivos terminados, anota sus destinos en un
+manifiesto y los mueve con os.replace, que los sustituye de una vez (si el
+destino está en otro sistema de archivos, primero se copian a un temporal
+oculto junto a él). Al abrir una sesión, recover() termina de publicar lo
+que dejó a medias un proceso que murió y borra el resto de sus archivos.
+"""
+
+import errno
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: las sesiones se dan por abandonadas según su antigüedad
+    fcntl = None
+
+# Sin fcntl no se sabe si una sesión sigue viva: se espera este tiempo
+STALE_SESSION_AGE = 24 * 3600
+# Descargas sin tocar durante más de esto se dan por abandonadas
+STALE_DOWNLOAD_AGE = 7 * 24 * 3600
+# El PCM de la normalización solo existe mientras dura una conversión
+STALE_PCM_AGE = 3600
+
+MANIFEST_SUFFIX = ".publish.json"
+# Los archivos de una descarga empiezan por su nombre, que acaba en esto
+DOWNLOAD_SUFFIX = ".tmp"
+# Cada cuánto se vuelve a intentar tomar un DownloadLock ocupado
+LOCK_POLL_INTERVAL = 0.2
+
+# published: archivos que se terminaron de publicar; removed: archivos borrados
+RecoveryReport = namedtuple("RecoveryReport", ["published", "removed"])
+
+
+def age(path):
+    """Segundos desde la última modificación de path (0 si ya no existe)"""
+    try:
+        return time.time() - os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+def fsync_file(path):
+    # En Windows fsync necesita un descriptor con permiso de escritura
+    with open(path, "rb+") as handle:
+        os.fsync(handle.fileno())
+
+
+def fsync_directory(path):
+    """Asegura en disco los cambios de nombre dentro de la carpeta (no aplica en Windows)"""
+    if os.name == "nt":
+        return
+    descriptor = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(descriptor)
+    finally:
+        os.close(descriptor)
+
+
+def move_file(staged_file, output_file):
+    """
+    Mueve un archivo ya sincronizado a su destino: output_file queda con el
+    contenido anterior o con el nuevo, nunca a medias.
+    """
+    try:
+        os.replace(staged_file, output_file)
+        return
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    # Otro sistema de archivos: se copia junto al destino y se renombra allí
+    directory, name = os.path.split(os.path.abspath(output_file))
+    temp_file = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.part")
+    try:
+        shutil.copyfile(staged_file, temp_file)
+        fsync_file(temp_file)
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    os.remove(staged_file)
+
+
+def write_json(path, data):
+    """Escribe data en path de forma atómica y sincronizada"""
+    temp_file = f"{path}.tmp"
+    with open(temp_file, "w", encoding="utf-8") as handle:
+        json.dump(data, handle)
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temp_file, path)
+
+
+def publish_files(files, manifest):
+    """Mueve [(archivo, destino), ...] a su destino, dejando manifest mientras tanto"""
+    files = [(staged_file, os.path.abspath(output_file)) for staged_file, output_file in files]
+    for staged_file, _ in files:
+        fsync_file(staged_file)
+    write_json(manifest, files)
+    for staged_file, output_file in files:
+        move_file(staged_file, output_file)
+    for directory in sorted({os.path.dirname(output_file) for _, output_file in files}):
+        fsync_directory(directory)
+    os.remove(manifest)
+
+
+def download_file(name):
+    """Archivo de la descarga a la que pertenece name (el .part, el .lock, un .pcm...), o None"""
+    index = name.find(DOWNLOAD_SUFFIX)
+    if index < 0:
+        return None
+    return name[:index + len(DOWNLOAD_SUFFIX)]
+
+
+# Sin fcntl (Windows) los locks solo excluyen a los hilos de este proceso:
+# lock -> [trabajos con el lock compartido, si alguien lo tiene en exclusiva]
+_local_holders = {}
+_local_lock = threading.Lock()
+
+
+class DownloadLock:
+    """
+    Lock de una descarga de downloads/ entre procesos (flock sobre
+    <archivo>.lock). Quien usa el archivo tiene el lock compartido; para
+    descargarlo o borrar cualquiera de sus archivos hace falta tenerlo en
+    exclusiva, así que nadie borra lo que otro proceso está usando.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        # Archivos de la descarga: el terminado, el parcial y su estado
+        self.files = [path, f"{path}.part", f"{path}.part.json"]
+        self.shared = None
+        self._descriptor = None
+
+    def try_acquire(self, shared):
+        """Toma el lock compartido o exclusivo si está libre; devuelve False si otro lo tiene"""
+        if self.shared == shared:
+            return True
+        # Se suelta antes de cambiarlo: dos que lo tienen compartido y lo quieren
+        # en exclusiva no se esperan el uno al otro
+        self._unlock()
+        if fcntl is None:
+            return self._try_local(shared)
+        while True:
+            if self._descriptor is None:
+                os.makedirs(os.path.dirname(self.lock_path), exist_ok=True)
+                self._descriptor = os.open(self.lock_path, os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(self._descriptor, (fcntl.LOCK_SH if shared else fcntl.LOCK_EX) | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            # El último en soltar la descarga borra el .lock: si pasó entre el
+            # open y el flock, este lock ya no excluye a nadie y se abre el nuevo
+            try:
+                current = os.path.samestat(os.fstat(self._descriptor), os.stat(self.lock_path))
+            except FileNotFoundError:
+                current = False
+            if current:
+                self.shared = shared
+                return True
+            os.close(self._descriptor)
+            self._descriptor = None
+
+    def release(self, remove=False):
+        """
+        Suelta el lock. Con remove se borran los archivos de la descarga si
+        ningún otro trabajo la usa; si no, se dejan para el último.
+        """
+        if remove:
+            self.try_acquire(False)
+        if self.shared is False:
+            if remove:
+                for path in self.files:
+                    if os.path.exists(path):
+                        os.remove(path)
+            if not any(os.path.exists(path) for path in self.files):
+                # Sin descarga no hace falta el lock (ver try_acquire)
+                self._remove_lock_file()
+        self._unlock()
+        if self._descriptor is not None:
+            os.close(self._descriptor)
+            self._descriptor = None
+
+    def _remove_lock_file(self):
+        if fcntl is not None and os.path.exists(self.lock_path):
+            os.remove(self.lock_path)
+
+    def _unlock(self):
+        if self.shared is None:
+            return
+        if fcntl is None:
+            with _local_lock:
+                holders = _local_holders[self.lock_path]
+                if self.shared:
+                    holders[0] -= 1
+                else:
+                    holders[1] = False
+                if holders == [0, False]:
+                    del _local_holders[self.lock_path]
+        else:
+            fcntl.flock(self._descriptor, fcntl.LOCK_UN)
+        self.shared = None
+
+    def _try_local(self, shared):
+        with _local_lock:
+            holders = _local_holders.setdefault(self.lock_path, [0, False])
+            if holders[1] or (not shared and holders[0]):
+                return False
+            if shared:
+                holders[0] += 1
+            else:
+                holders[1] = True
+            self.shared = shared
+            return True
+
+
+class StagingArea:
+    """
+    Carpeta de los archivos temporales de un Engine. La sesión se abre (y se
+    recuperan las anteriores) con el primer uso, o antes con open().
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            # cache.py importa sqlite3: solo se carga si no se indica la carpeta
+            from .cache import default_cache_dir
+            directory = os.path.join(default_cache_dir(), "staging")
+        self.directory = directory
+        self.downloads_dir = os.path.join(directory, "downloads")
+        self.sessions_dir = os.path.join(directory, "work")
+        # Resultado de recover() al abrir la sesión
+        self.recovery = None
+        self._work_dir = None
+        self._lock_handle = None
+        self._lock = threading.Lock()
+
+    def open(self):
+        """Recupera las sesiones abandonadas y abre la de este proceso; devuelve un RecoveryReport"""
+        with self._lock:
+            if self._work_dir is None:
+                self.recovery = self.recover()
+                self._work_dir = self._open_session()
+            return self.recovery
+
+    @property
+    def work_dir(self):
+        self.open()
+        return self._work_dir
+
+    def download_path(self, name):
+        """Ruta estable de una descarga, para reanudarla en otra ejecución"""
+        os.makedirs(self.downloads_dir, exist_ok=True)
+        return os.path.join(self.downloads_dir, name)
+
+    def work_path(self, name):
+        """Ruta de un archivo de esta sesión"""
+        return os.path.join(self.work_dir, name)
+
+    def publish(self, files):
+        """
+        Publica [(archivo de la sesión, destino), ...] como una unidad: si el
+        proceso muere a mitad, la siguiente sesión termina de moverlos.
+        """
+        publish_files(files, self.work_path(f"{uuid.uuid4().hex}{MANIFEST_SUFFIX}"))
+
+    def close(self):
+        """Borra la sesión (lo que quede en ella son restos de trabajos fallidos)"""
+        with self._lock:
+            if self._work_dir is None:
+                return
+            shutil.rmtree(self._work_dir, ignore_errors=True)
+            self._lock_handle.close()
+            self._work_dir = None
+            self._lock_handle = None
+
+    def recover(self):
+        """Publica lo pendiente de las sesiones abandonadas y borra sus restos y las descargas viejas"""
+        published = removed = 0
+        if os.path.isdir(self.sessions_dir):
+            for name in os.listdir(self.sessions_dir):
+                session = os.path.join(self.sessions_dir, name)
+                if not os.path.isdir(session):
+                    continue
+                abandoned, descriptor = self._take_over(session)
+                if not abandoned:
+                    continue
+                # Con el lock tomado, ningún otro proceso recupera esta sesión a la vez
+                try:
+                    for entry in sorted(os.listdir(session)):
+                        if entry.endswith(MANIFEST_SUFFIX):
+                            published += self._finish_publish(os.path.join(session, entry))
+                    removed += sum(1 for entry in os.listdir(session) if entry != "lock")
+                    shutil.rmtree(session, ignore_errors=True)
+                finally:
+                    if descriptor is not None:
+                        os.close(descriptor)
+
+        if os.path.isdir(self.downloads_dir):
+            now = time.time()
+            for name in sorted(os.listdir(self.downloads_dir)):
+                path = os.path.join(self.downloads_dir, name)
+                try:
+                    age = now - os.path.getmtime(path)
+                except OSError:
+                    continue
+                if age > STALE_DOWNLOAD_AGE or (name.endswith(".pcm") and age > STALE_PCM_AGE):
+                    removed += self._remove_download_file(path)
+        return RecoveryReport(published, removed)
+
+    def _remove_download_file(self, path):
+        """Borra un archivo viejo de downloads/ salvo si otro proceso usa su descarga; devuelve 1 si lo borró"""
+        owner = download_file(os.path.basename(path))
+        if owner is None:
+            os.remove(path)
+            return 1
+        lock = DownloadLock(os.path.join(self.downloads_dir, owner))
+        if not lock.try_acquire(False):
+            return 0
+        try:
+            if path == lock.lock_path or not os.path.exists(path):
+                return 0
+            os.remove(path)
+            return 1
+        finally:
+            lock.release()
+
+    def _finish_publish(self, manifest):
+        try:
+            with open(manifest, encoding="utf-8") as handle:
+                files = json.load(handle)
+        except (OSError, ValueError):
+            # El manifiesto se escribe de forma atómica: si no se lee, no llegó a publicarse nada
+            return 0
+        # Los que ya no están en la sesión se movieron antes de que el proceso muriera
+        pending = [(staged_file, output_file) for staged_file, output_file in files if os.path.exists(staged_file)]
+        for staged_file, output_file in pending:
+            move_file(staged_file, output_file)
+        for directory in sorted({os.path.dirname(output_file) for _, output_file in pending}):
+            fsync_directory(directory)
+        os.remove(manifest)
+        return len(pending)
+
+    def _open_session(self):
+        # La sesión se prepara con otro nombre y solo aparece en work/ con el lock ya tomado
+        name = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        pending = os.path.join(self.sessions_dir, f".{name}.new")
+        os.makedirs(pending)
+        handle = open(os.path.join(pending, "lock"), "w")
+        if fcntl is not None:
+            fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        session = os.path.join(self.sessions_dir, name)
+        os.rename(pending, session)
+        self._lock_handle = handle
+        return session
+
+    def _take_over(self, session):
+        """
+        Indica si la sesión está abandonada; devuelve (abandonada, descriptor
+        del lock tomado o None). Nunca crea el lock: una sesión sin él está a
+        medio crear y solo se da por abandonada si es vieja.
+        """
+        lock_path = os.path.join(session, "lock")
+        if fcntl is None or not os.path.exists(lock_path):
+            return age(lock_path if os.path.exists(lock_path) else session) > STALE_SESSION_AGE, None
+        try:
+            descriptor = os.open(lock_path, os.O_RDWR)
+        except OSError:
+            # La ha borrado otro proceso que la estaba recuperando
+            return False, None
+        try:
+            fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(descriptor)
+            return False, None
+        if not os.path.exists(lock_path):
+            # Otro proceso la recuperó entre el open y el flock
+            os.close(descriptor)
+            return False, None
+        return True, descriptor
@@ -0,0 +1,45 @@
+"""
+Arranque rápido
+----------------------------------------------------
+Las interfaces gráficas muestran la ventana antes de importar pytubefix, el
+motor y sus dependencias (asyncio, sqlite3, multiprocessing, http.client...).
+prewarm() los importa en un hilo aparte en cuanto la ventana aparece, y el
+botón Buscar se habilita cuando terminan de cargarse.
+
+benchmarks/startup.py mide el tiempo de importación con -X importtime.
+"""
+
+import importlib
+import threading
+
+# Módulos que tardan en importarse y no hacen falta para pintar la ventana
+HEAVY_MODULES = (
+    "pytubefix",
+    "ytmp3.engine",
+    "ytmp3.progress",
+    "ytmp3.aio",
+    "ytmp3.cache",
+    "ytmp3.farm",
+    "ytmp3.health",
+)
+
+
+def import_modules(modules=HEAVY_MODULES):
+    """Importa los módulos; los que fallan se ignoran (darán el error al usarse)"""
+    for name in modules:
+        try:
+            importlib.import_module(name)
+        except Exception:
+            pass
+
+
+def prewarm(then=None, modules=HEAVY_MODULES):
+    """Importa los módulos en un hilo aparte y después llama a then() en ese mismo hilo"""
+    def run():
+        import_modules(modules)
+        if then is not None:
+            then()
+
+    thread = threading.Thread(target=run, name="ytmp3-prewarm", daemon=True)
+    thread.start()
+    return thread
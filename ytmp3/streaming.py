@@ -0,0 +1,97 @@
+"""
+Descarga en streaming hacia el codificador
+----------------------------------------------------
+Los fragmentos descargados se escriben directamente en la entrada estándar
+de ffmpeg, de modo que la conversión avanza a la vez que la transferencia y
+no se escribe ningún archivo temporal en disco.
+"""
+
+import os
+import subprocess
+import urllib.request
+from contextlib import nullcontext
+
+from . import net
+from .errors import EngineError
+from .ffmpeg import FFmpegProcess
+
+# Igual que pytubefix: YouTube limita la velocidad de las peticiones muy grandes
+RANGE_SIZE = 9 * 1024 * 1024
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_stream_chunks(url, filesize=None, chunk_size=CHUNK_SIZE, range_size=RANGE_SIZE, timeout=30, limit=None,
+                       cancel=None):
+    """
+    Descarga la URL en rangos consecutivos y va devolviendo los fragmentos.
+    limit (un ratelimit.RateLimiter o LimitChain) frena peticiones y fragmentos.
+    """
+    downloaded = 0
+    while filesize is None or downloaded < filesize:
+        headers = {"User-Agent": "Mozilla/5.0", "accept-language": "en-US,en"}
+        if filesize is not None:
+            stop_pos = min(downloaded + range_size, filesize) - 1
+            headers["Range"] = f"bytes={downloaded}-{stop_pos}"
+
+        request = urllib.request.Request(url, headers=headers)
+        if limit is not None:
+            limit.request(cancel)
+        with net.urlopen(request, timeout=timeout) as response:
+            while True:
+                chunk = response.read(chunk_size)
+                if not chunk:
+                    break
+                downloaded += len(chunk)
+                if limit is not None:
+                    limit.consume(len(chunk), cancel)
+                yield chunk
+
+            # Sin tamaño conocido, o si el servidor ignoró el rango, ya está todo
+            if filesize is None or response.status != 206:
+                return
+
+
+def encode_stream(chunks, output_file, encoder_args=None, on_chunk=None, cancel=None):
+    """
+    Escribe los fragmentos en la entrada de ffmpeg mientras éste codifica.
+    on_chunk recibe el tamaño de cada fragmento entregado al codificador.
+    Si se cancela (cancel es un CancelToken), ffmpeg se detiene enseguida.
+    """
+    if encoder_args is None:
+        encoder_args = ["-vn", "-ar", "44100", "-c:a", "libmp3lame"]
+
+    process = FFmpegProcess(["-i", "pipe:0"] + encoder_args + [output_file], stdin=subprocess.PIPE)
+    try:
+        for chunk in chunks:
+            if cancel is not None:
+                cancel.check()
+            try:
+                process.stdin.write(chunk)
+            except BrokenPipeError:
+                # ffmpeg terminó antes de tiempo; el código de salida dirá por qué
+                break
+            if on_chunk is not None:
+                on_chunk(len(chunk))
+        try:
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+    except BaseException:
+        process.kill()
+        _remove(output_file)
+        raise
+
+    with cancel.on_cancel(process.abort) if cancel is not None else nullcontext():
+        returncode = process.wait()
+    if returncode != 0:
+        _remove(output_file)
+        if cancel is not None:
+            cancel.check()
+        extension = os.path.splitext(output_file)[1].lstrip(".").upper() or "MP3"
+        raise EngineError(f"Error al convertir a {extension}: {process.error_output or 'ffmpeg falló'}")
+    return output_file
+
+
+def _remove(path):
+    if os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,119 @@
+"""
+Etiquetas y portada
+----------------------------------------------------
+Las etiquetas (título, canal, fecha de publicación e ID del video) y la
+portada se escriben en la misma pasada de ffmpeg que codifica el audio, sin
+volver a leer el archivo de salida:
+  - MP3 (ID3v2) y M4A llevan la portada como un stream de imagen adjunto
+    (attached_pic), que ffmpeg copia de la miniatura sin recodificarla;
+  - Ogg/Opus no admite streams de imagen, así que la portada va en el
+    comentario METADATA_BLOCK_PICTURE, como la escriben los demás programas.
+La miniatura se descarga y se reduce una sola vez por video (ver
+cache.ThumbnailCache).
+"""
+
+import base64
+import os
+import re
+import struct
+import subprocess
+from collections import namedtuple
+
+from .errors import EngineError
+from .ffmpeg import FFmpegProcess
+from .segments import segment_label
+
+# Formatos que guardan la portada como stream de imagen adjunto
+ATTACHED_PICTURE_FORMATS = ("mp3", "m4a")
+# Cada argumento de un proceso está limitado a 128 KB en Linux; una portada
+# reducida ocupa bastante menos, pero una mayor se omite antes que fallar
+MAX_PICTURE_COMMENT = 100 * 1024
+
+# title, artist (el canal) y date (AAAA-MM-DD) pueden ser None; cover es la
+# ruta de la portada en JPEG, o None si no hay. album y track ("2/12") solo
+# se usan al partir un video en fragmentos o capítulos
+Tags = namedtuple("Tags", ["title", "artist", "date", "video_id", "cover", "album", "track"],
+                  defaults=(None, None))
+
+
+def tags_for(info, cover=None):
+    """Tags de un models.VideoInfo"""
+    return Tags(info.title, info.author, info.publish_date, info.video_id, cover)
+
+
+def segment_tags(tags, segment, number, count):
+    """Tags del archivo de un tramo: el título del tramo, en un álbum con el del video"""
+    title = segment_label(segment)
+    return tags._replace(title=title if segment.title else f"{tags.title} ({title})", album=tags.title,
+                         track=f"{number}/{count}")
+
+
+def embeds_picture(extension):
+    """Indica si la portada de este formato va en un stream de imagen adjunto"""
+    return extension in ATTACHED_PICTURE_FORMATS
+
+
+def metadata_args(tags, extension):
+    """Opciones -metadata de ffmpeg para una salida (y la portada de Ogg/Opus)"""
+    values = [
+        ("title", tags.title),
+        ("artist", tags.artist),
+        ("date", tags.date),
+        ("album", tags.album),
+        ("track", tags.track),
+        ("comment", f"https://www.youtube.com/watch?v={tags.video_id}" if tags.video_id else None),
+        # ID3 lo guarda como TXXX y Ogg como un comentario más; MP4 lo ignora (queda el comment)
+        ("youtube_id", tags.video_id),
+    ]
+    if tags.cover and not embeds_picture(extension):
+        values.append(("METADATA_BLOCK_PICTURE", picture_comment(tags.cover)))
+    args = []
+    for key, value in values:
+        if value:
+            args += ["-metadata", f"{key}={value}"]
+    return args
+
+
+def read_video_id(path):
+    """
+    ID del video de un archivo con las etiquetas de metadata_args (youtube_id,
+    o el enlace del comentario en M4A), o None si no las tiene.
+    """
+    try:
+        # Las etiquetas generales y las del stream de audio, donde las guarda Ogg
+        process = FFmpegProcess(
+            ["-i", path, "-f", "ffmetadata", "-", "-map_metadata", "0:s:a", "-f", "ffmetadata", "-"],
+            stdout=subprocess.PIPE,
+        )
+    except EngineError:
+        return None
+    output = process.stdout.read().decode("utf-8", "replace")
+    if process.wait() != 0:
+        return None
+    video_id = None
+    for line in output.splitlines():
+        key, _, value = line.partition("=")
+        # ffmetadata escapa "=", ";", "#" y "\\" con una barra
+        value = re.sub(r"\\(.)", r"\1", value)
+        if key.lower() == "youtube_id" and value:
+            return value
+        match = re.search(r"youtube\.com/watch\?v=([\w-]{11})", value) if key.lower() == "comment" else None
+        if match:
+            video_id = match.group(1)
+    return video_id
+
+
+def picture_comment(path):
+    """
+    Bloque PICTURE de FLAC en base64 (tipo 3, portada delantera), el formato
+    del comentario METADATA_BLOCK_PICTURE. None si la imagen es demasiado grande.
+    """
+    with open(path, "rb") as handle:
+        data = handle.read()
+    mime = b"image/png" if os.path.splitext(path)[1].lower() == ".png" else b"image/jpeg"
+    # Tipo, MIME, descripción vacía, ancho, alto, profundidad y colores (0: desconocidos) y los datos
+    block = struct.pack(">II", 3, len(mime)) + mime + struct.pack(">IIIIII", 0, 0, 0, 0, 0, len(data)) + data
+    comment = base64.b64encode(block).decode("ascii")
+    if len(comment) > MAX_PICTURE_COMMENT:
+        return None
+    return comment
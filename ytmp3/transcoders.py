@@ -0,0 +1,448 @@
+"""
+Transcodificadores
+----------------------------------------------------
+Interfaz común para convertir el audio descargado al formato de salida.
+El backend principal llama a ffmpeg directamente; moviepy (que decodifica
+a arrays de NumPy en Python) queda solo como alternativa si no hay ffmpeg.
+Con normalize (un loudness.Normalizer), ffmpeg analiza antes el volumen y
+la codificación aplica la ganancia y el recorte de silencios.
+FanOutTranscoder convierte una misma descarga a varios archivos a la vez.
+Con segments solo se convierten esos tramos, cada uno a sus archivos, y con
+tags se escriben las etiquetas y la portada en la misma pasada (ver tagging.py).
+"""
+
+import os
+import uuid
+from collections import namedtuple
+from contextlib import nullcontext
+
+from .errors import EngineError, JobCancelled
+from .ffmpeg import FFmpegProcess, find_ffmpeg
+from .loudness import stage_progress
+from .segments import group_runs
+from .tagging import embeds_picture, metadata_args, segment_tags
+
+# extension: extensión del archivo de salida
+# encoder: codificador de ffmpeg
+# copy_codecs: prefijos de códec de origen que se pueden copiar sin recodificar
+OutputFormat = namedtuple("OutputFormat", ["extension", "encoder", "copy_codecs"])
+
+OUTPUT_FORMATS = {
+    "mp3": OutputFormat("mp3", "libmp3lame", ("mp3",)),
+    "m4a": OutputFormat("m4a", "aac", ("mp4a",)),
+    "opus": OutputFormat("opus", "libopus", ("opus",)),
+}
+
+DEFAULT_SAMPLE_RATE = 44100
+
+
+def get_output_format(name):
+    try:
+        return OUTPUT_FORMATS[name]
+    except KeyError:
+        raise EngineError(f"Formato de salida no soportado: {name}")
+
+
+class Transcoder:
+    """Interfaz de los backends de conversión"""
+
+    name = None
+    # Si transcode() acepta tags; el Engine no se las pasa a los que no lo declaran
+    writes_tags = False
+
+    def __init__(self, output_format="mp3", sample_rate=DEFAULT_SAMPLE_RATE, bitrate=None, normalize=None):
+        self.output_format = get_output_format(output_format)
+        self.sample_rate = sample_rate
+        self.bitrate = bitrate
+        self.normalize = normalize
+
+    @property
+    def extension(self):
+        return self.output_format.extension
+
+    @property
+    def output_sample_rate(self):
+        # libopus solo admite 48 kHz y submúltiplos
+        if self.output_format.encoder == "libopus":
+            return 48000
+        return self.sample_rate
+
+    @property
+    def backend(self):
+        """Transcoder que convierte de verdad (distinto si este solo reparte el trabajo)"""
+        return self
+
+    @property
+    def outputs(self):
+        """Configuración de cada archivo de salida (hay varios solo en FanOutTranscoder)"""
+        return [self]
+
+    @property
+    def custom_sample_rate(self):
+        """Frecuencia de muestreo si se pidió una distinta de la habitual, o None"""
+        if self.sample_rate != DEFAULT_SAMPLE_RATE and self.output_sample_rate == self.sample_rate:
+            return self.sample_rate
+        return None
+
+    @property
+    def profile(self):
+        """Ajustes que cambian el resultado; forman parte de la clave de la caché de salidas"""
+        parts = [self.bitrate or ""]
+        if self.custom_sample_rate:
+            parts.append(f"{self.custom_sample_rate}Hz")
+        if self.normalize is not None and self.normalize.profile:
+            parts.append(self.normalize.profile)
+        if len(parts) == 1:
+            return self.bitrate
+        return "+".join(parts)
+
+    @property
+    def label(self):
+        """Descripción corta de la salida, p. ej. "MP3 320k" """
+        parts = [self.extension.upper(), self.bitrate]
+        if self.custom_sample_rate:
+            parts.append(f"{self.custom_sample_rate} Hz")
+        return " ".join(part for part in parts if part)
+
+    @property
+    def error_prefix(self):
+        return f"Error al convertir a {self.extension.upper()}"
+
+    def output_suffixes(self):
+        """
+        Terminación del nombre de cada archivo de salida, en el orden de
+        outputs. Si dos salidas tienen la misma extensión se distinguen por el
+        bitrate y la frecuencia de muestreo (p. ej. ".320k.mp3").
+        """
+        extensions = [output.extension for output in self.outputs]
+        suffixes = []
+        for output in self.outputs:
+            suffix = f".{output.extension}"
+            if extensions.count(output.extension) > 1:
+                tag = "-".join(str(part) for part in (output.bitrate, output.custom_sample_rate) if part)
+                suffix = f".{tag or 'default'}{suffix}"
+            # Dos salidas iguales: se numeran
+            if suffix in suffixes:
+                suffix = f".{len(suffixes) + 1}{suffix}"
+            suffixes.append(suffix)
+        return suffixes
+
+    def can_copy(self, source_codec):
+        """Indica si el audio de origen se puede copiar al contenedor de salida sin recodificar"""
+        if not source_codec or self.normalize is not None:
+            return False
+        return source_codec.startswith(self.output_format.copy_codecs)
+
+    def will_copy(self, source_codec):
+        """Indica si este backend copiará realmente el audio en lugar de recodificarlo"""
+        return False
+
+    def transcode(self, source_file, output_file, source_codec=None, duration=None, on_progress=None,
+                  cancel=None, segments=None, tags=None):
+        """
+        Convierte source_file en output_file. on_progress(fracción) informa del
+        avance si se conoce la duración (en segundos); si se cancela (cancel es
+        un CancelToken) la conversión se detiene y se borra la salida parcial.
+        segments (lista de models.Segment) limita la conversión a esos tramos;
+        output_file es entonces una lista con los archivos de cada tramo.
+        tags (un tagging.Tags) son las etiquetas y la portada de la salida; solo
+        se pasa si el backend declara writes_tags.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Libera los recursos del backend (procesos, etc.)"""
+
+
+class FFmpegTranscoder(Transcoder):
+    """Convierte llamando a ffmpeg en un subproceso"""
+
+    name = "ffmpeg"
+    writes_tags = True
+
+    def will_copy(self, source_codec):
+        return self.can_copy(source_codec)
+
+    def output_args(self, source_codec=None, cover=False):
+        """
+        Argumentos de ffmpeg para la salida, sin el archivo de destino. Con
+        cover, el stream de imagen que se elija se copia como portada.
+        """
+        args = ["-c:v", "copy", "-disposition:v", "attached_pic"] if cover else ["-vn"]
+        if self.can_copy(source_codec):
+            # Remux sin recodificar: solo se cambia el contenedor
+            return args + ["-c:a", "copy"]
+
+        args += ["-c:a", self.output_format.encoder]
+        if self.output_sample_rate:
+            args += ["-ar", str(self.output_sample_rate)]
+        if self.bitrate:
+            args += ["-b:a", self.bitrate]
+        return args
+
+    def transcode(self, source_file, output_file, source_codec=None, duration=None, on_progress=None,
+                  cancel=None, segments=None, tags=None):
+        # output_file es una ruta, o una lista con una por salida (ver FanOutTranscoder)
+        output_files = [output_file] if isinstance(output_file, str) else list(output_file)
+        if segments:
+            if self.normalize is not None:
+                raise EngineError("La normalización de volumen no se puede combinar con fragmentos o capítulos")
+            args, longest = self._segments_args(source_file, segments, output_files, source_codec, tags)
+            self._run(args, output_files, longest or duration, on_progress, cancel)
+            return output_file
+
+        if self.normalize is None:
+            args = ["-i", source_file] + self._cover_input(tags)
+            args += self._outputs_args(output_files, source_codec, tags=tags)
+            self._run(args, output_files, duration, on_progress, cancel)
+            return output_file
+
+        # Se decodifica una vez a PCM: el análisis y la codificación leen ese archivo,
+        # que es de esta conversión aunque otras usen la misma descarga
+        pcm_file = f"{source_file}.{uuid.uuid4().hex[:8]}.pcm"
+        try:
+            info = self.normalize.analyze(source_file, pcm_file, duration,
+                                          on_progress=stage_progress(on_progress, 0.0, 0.3), cancel=cancel)
+            args = self.normalize.input_args(info) + ["-i", pcm_file] + self._cover_input(tags)
+            args += self._outputs_args(output_files, filters=self.normalize.filters(info), tags=tags)
+            self._run(args, output_files, self.normalize.output_duration(info),
+                      stage_progress(on_progress, 0.3, 1.0), cancel)
+        finally:
+            if os.path.exists(pcm_file):
+                os.remove(pcm_file)
+        return output_file
+
+    def stream_args(self, source_codec=None, tags=None):
+        """
+        Argumentos que siguen a la entrada por tubería en streaming.encode_stream:
+        la portada como segunda entrada, la salida y sus etiquetas.
+        """
+        return self._cover_input(tags) + self._output_stream_args(self, source_codec, tags, 0, 1)
+
+    def _cover_input(self, tags):
+        """Entrada con la portada, si alguna salida la lleva como stream de imagen"""
+        if tags is None or not tags.cover or not any(embeds_picture(output.extension) for output in self.outputs):
+            return []
+        return ["-i", tags.cover]
+
+    def _output_stream_args(self, output, source_codec, tags, audio_input, cover_input):
+        """Streams, códecs y etiquetas de una salida; la portada sale de la entrada cover_input"""
+        if tags is None:
+            return output.output_args(source_codec)
+        cover = bool(tags.cover) and embeds_picture(output.extension)
+        args = ["-map", f"{audio_input}:a"]
+        if cover:
+            args += ["-map", f"{cover_input}:v"]
+        return args + output.output_args(source_codec, cover=cover) + metadata_args(tags, output.extension)
+
+    def _outputs_args(self, output_files, source_codec=None, filters=None, tags=None):
+        """Opciones y archivo de cada salida; ffmpeg decodifica la entrada una vez para todas"""
+        if len(output_files) != len(self.outputs):
+            raise EngineError(f"{self.error_prefix}: se esperaban {len(self.outputs)} archivos de salida")
+        args = []
+        for output, path in zip(self.outputs, output_files):
+            if filters:
+                args += ["-af", filters]
+            args += self._output_stream_args(output, source_codec, tags, 0, 1) + [path]
+        return args
+
+    def _segments_args(self, source_file, segments, output_files, source_codec=None, tags=None):
+        """
+        Una entrada por pasada de group_runs, buscando con -ss antes de -i, y
+        las salidas de cada tramo recortadas con -ss/-to relativos a su pasada
+        (output_files va por tramos y, dentro de cada uno, por salidas).
+        Devuelve los argumentos y la duración del tramo más largo, que es lo
+        que marca el avance de ffmpeg (o None si alguno llega hasta el final).
+        """
+        outputs = self.outputs
+        if len(output_files) != len(segments) * len(outputs):
+            raise EngineError(f"{self.error_prefix}: se esperaban {len(segments) * len(outputs)} archivos de salida")
+        runs = group_runs(segments)
+        args = []
+        for run in runs:
+            args += ["-ss", f"{run.start:.3f}"]
+            if run.end is not None:
+                args += ["-to", f"{run.end:.3f}"]
+            args += ["-i", source_file]
+        covers = {}
+        if self._cover_input(tags):
+            # La portada tiene tiempo 0 y el -ss de salida la descartaría: cada
+            # tramo la lee desplazada hasta su inicio
+            for run in runs:
+                for index in run.segments:
+                    covers[index] = len(runs) + len(covers)
+                    args += ["-itsoffset", f"{segments[index].start - run.start:.3f}", "-i", tags.cover]
+        for input_index, run in enumerate(runs):
+            for index in run.segments:
+                segment = segments[index]
+                if tags is not None:
+                    output_tags = segment_tags(tags, segment, index + 1, len(segments))
+                for position, output in enumerate(outputs):
+                    args += ["-ss", f"{segment.start - run.start:.3f}"]
+                    if segment.end is not None:
+                        args += ["-to", f"{segment.end - run.start:.3f}"]
+                    if tags is None:
+                        args += ["-map", f"{input_index}:a"] + output.output_args(source_codec)
+                    else:
+                        args += self._output_stream_args(output, source_codec, output_tags, input_index,
+                                                         covers.get(index))
+                    args += [output_files[index * len(outputs) + position]]
+        if any(segment.end is None for segment in segments):
+            return args, None
+        return args, max(segment.end - segment.start for segment in segments)
+
+    def _run(self, args, output_files, duration, on_progress, cancel):
+        def report(seconds):
+            on_progress(min(seconds / duration, 1.0))
+
+        process = FFmpegProcess(
+            args,
+            on_progress=report if on_progress is not None and duration else None,
+        )
+        with cancel.on_cancel(process.abort) if cancel is not None else nullcontext():
+            returncode = process.wait()
+        if returncode != 0:
+            for path in output_files:
+                if os.path.exists(path):
+                    os.remove(path)
+            if cancel is not None:
+                cancel.check()
+            raise EngineError(f"{self.error_prefix}: {process.error_output or 'ffmpeg falló'}")
+
+
+class FanOutTranscoder(FFmpegTranscoder):
+    """
+    Convierte una descarga a varios archivos con un solo proceso de ffmpeg:
+    el audio se decodifica una vez y los codificadores de todas las salidas
+    trabajan a la vez. outputs son FFmpegTranscoder con el formato, el
+    bitrate y la frecuencia de muestreo de cada archivo; transcode() recibe
+    una lista con una ruta por salida.
+    """
+
+    name = "fanout"
+
+    def __init__(self, outputs, normalize=None):
+        if not outputs:
+            raise EngineError("Hace falta al menos un formato de salida")
+        first = outputs[0]
+        super().__init__(first.extension, first.sample_rate, first.bitrate, normalize)
+        self._outputs = list(outputs)
+        # El análisis de volumen es común; cada salida lo refleja en su clave de caché
+        for output in self._outputs:
+            output.normalize = normalize
+
+    @property
+    def outputs(self):
+        return self._outputs
+
+    @property
+    def error_prefix(self):
+        return f"Error al convertir a {', '.join(output.label for output in self.outputs)}"
+
+    def will_copy(self, source_codec):
+        return any(output.can_copy(source_codec) for output in self.outputs)
+
+
+def parse_outputs(text):
+    """
+    Lee una lista de salidas como "mp3:320k,mp3:128k,opus" (formato, bitrate
+    y frecuencia de muestreo opcionales, separados por ':') y devuelve sus
+    FFmpegTranscoder. Lanza ValueError si no es válida.
+    """
+    outputs = []
+    for item in text.split(","):
+        parts = [part.strip() for part in item.split(":")]
+        if not parts[0] or len(parts) > 3:
+            raise ValueError(f"Salida no válida: '{item}' (formato[:bitrate[:frecuencia]])")
+        if parts[0] not in OUTPUT_FORMATS:
+            raise ValueError(f"Formato de salida no soportado: {parts[0]}")
+        bitrate = parts[1] if len(parts) > 1 and parts[1] else None
+        sample_rate = DEFAULT_SAMPLE_RATE
+        if len(parts) > 2 and parts[2]:
+            if not parts[2].isdigit():
+                raise ValueError(f"Frecuencia de muestreo no válida: {parts[2]}")
+            sample_rate = int(parts[2])
+        outputs.append(FFmpegTranscoder(parts[0], sample_rate, bitrate))
+    return outputs
+
+
+class MoviepyTranscoder(Transcoder):
+    """Convierte con moviepy.AudioFileClip (más lento y con más memoria)"""
+
+    name = "moviepy"
+    writes_tags = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.normalize is not None:
+            raise EngineError("La normalización de volumen solo está disponible con ffmpeg")
+
+    def transcode(self, source_file, output_file, source_codec=None, duration=None, on_progress=None,
+                  cancel=None, segments=None, tags=None):
+        if segments:
+            raise EngineError("Los fragmentos y capítulos solo están disponibles con ffmpeg")
+        from moviepy import AudioFileClip
+
+        # moviepy solo admite opciones de salida: las etiquetas sí, la portada no
+        ffmpeg_params = metadata_args(tags._replace(cover=None), self.extension) if tags is not None else None
+
+        try:
+            audio_clip = AudioFileClip(source_file)
+            try:
+                audio_clip.write_audiofile(
+                    output_file,
+                    fps=self.output_sample_rate,
+                    codec=self.output_format.encoder,
+                    bitrate=self.bitrate,
+                    ffmpeg_params=ffmpeg_params,
+                    logger=_moviepy_logger(on_progress, cancel),
+                )
+            finally:
+                audio_clip.close()
+        except Exception as e:
+            if os.path.exists(output_file):
+                os.remove(output_file)
+            if isinstance(e, JobCancelled):
+                raise
+            raise EngineError(f"{self.error_prefix}: {str(e)}")
+        return output_file
+
+
+def _moviepy_logger(on_progress, cancel):
+    """Logger de proglog que informa del avance de moviepy y permite interrumpirlo"""
+    if on_progress is None and cancel is None:
+        return None
+
+    from proglog import ProgressBarLogger
+
+    class Logger(ProgressBarLogger):
+        def bars_callback(self, bar, attr, value, old_value=None):
+            if cancel is not None:
+                cancel.check()
+            total = self.bars[bar].get("total")
+            if attr == "index" and on_progress is not None and total:
+                on_progress(min(value / total, 1.0))
+
+    return Logger()
+
+
+TRANSCODERS = {
+    FFmpegTranscoder.name: FFmpegTranscoder,
+    MoviepyTranscoder.name: MoviepyTranscoder,
+}
+
+
+def get_transcoder(name="auto", **options):
+    """Crea un transcodificador; "auto" usa ffmpeg si está disponible y si no moviepy"""
+    if name == "auto":
+        try:
+            find_ffmpeg()
+            name = FFmpegTranscoder.name
+        except EngineError:
+            name = MoviepyTranscoder.name
+
+    try:
+        transcoder_class = TRANSCODERS[name]
+    except KeyError:
+        raise EngineError(f"Transcodificador desconocido: {name}")
+    return transcoder_class(**options)
@@ -0,0 +1,123 @@
+"""
+Trabajador de la cola compartida
+----------------------------------------------------
+Worker toma tareas del Broker y las procesa con un Engine, como la línea de
+comandos pero sin lista propia: varios trabajadores, en la misma máquina o
+en otras, se reparten la cola. Mientras procesa una tarea renueva su
+arrendamiento; si la tarea falla se devuelve al broker para reintentarla.
+"""
+
+import os
+import socket
+import threading
+
+from .broker import LEASE_TIME
+from .engine import Job
+
+
+def default_worker_name():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class Worker:
+    """
+    broker: Broker del que se toman las tareas
+    engine: Engine que las procesa
+    capacity: tareas en proceso a la vez (por defecto, los hilos de descarga del motor)
+    output_dir: carpeta que sustituye a la de cada tarea (p. ej. otro punto de montaje)
+    """
+
+    def __init__(self, broker, engine, name=None, capacity=None, lease_time=LEASE_TIME,
+                 poll_interval=1.0, output_dir=None):
+        self.broker = broker
+        self.engine = engine
+        self.name = name or default_worker_name()
+        self.capacity = max(1, capacity or engine.download_workers)
+        self.lease_time = lease_time
+        self.poll_interval = poll_interval
+        self.output_dir = output_dir
+
+        self.completed = 0
+        self.failed = 0
+        self._active = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._finished = threading.Event()
+
+    def run(self, exit_when_idle=False):
+        """
+        Procesa tareas hasta que se llame a stop() o, con exit_when_idle, hasta
+        que la cola se vacíe. Devuelve al terminar, sin tareas en proceso.
+        """
+        self._finished.clear()
+        heartbeat = threading.Thread(target=self._heartbeat, name="ytmp3-worker-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while not self._stop.is_set():
+                self._wake.clear()
+                if self._active_count() < self.capacity:
+                    task = self.broker.lease(self.name, self.lease_time)
+                    if task is not None:
+                        self._start(task)
+                        continue
+                    if exit_when_idle and not self._active_count() and not self.broker.pending():
+                        break
+                self._wake.wait(self.poll_interval)
+        finally:
+            self._stop.set()
+            # Los arrendamientos se siguen renovando hasta que terminan las tareas en curso
+            self.engine.wait(self._active_jobs())
+            self._finished.set()
+            heartbeat.join()
+
+    def stop(self, cancel=False):
+        """
+        Deja de tomar tareas. Las que están en proceso terminan, o con
+        cancel=True se cancelan y vuelven a la cola para otro trabajador.
+        """
+        self._stop.set()
+        self._wake.set()
+        if cancel:
+            # Otro trabajador de la misma máquina reanuda lo ya descargado
+            self.engine.cancel(self._active_jobs(), keep_download=True)
+
+    def _start(self, task):
+        job = Job(task.url, self.output_dir or task.output_dir, itag=task.itag, on_event=self._on_job_event)
+        with self._lock:
+            self._active[job.id] = (task, job)
+        self.engine.submit(job)
+
+    def _on_job_event(self, event):
+        if event.kind not in ("done", "error", "cancelled"):
+            return
+        with self._lock:
+            task, job = self._active.pop(event.job.id)
+        if event.kind == "done":
+            self.broker.complete(task.id, self.name, event.value)
+            self.completed += 1
+        elif event.kind == "error":
+            # Un error permanente (video inexistente, restringido...) no gasta más intentos
+            self.broker.fail(task.id, self.name, event.value, retry=event.value.retryable)
+            self.failed += 1
+        else:
+            # Cancelada al detener el trabajador: no cuenta como intento
+            self.broker.release(task.id, self.name)
+        self._wake.set()
+
+    def _active_count(self):
+        with self._lock:
+            return len(self._active)
+
+    def _active_jobs(self):
+        with self._lock:
+            return [job for task, job in self._active.values()]
+
+    def _heartbeat(self):
+        """Renueva los arrendamientos; si se pierde uno (otro trabajador tomó la tarea), la cancela"""
+        while not self._finished.wait(self.lease_time / 3):
+            with self._lock:
+                active = list(self._active.values())
+            for task, job in active:
+                if not self.broker.renew(task.id, self.name, self.lease_time):
+                    job.cancel(keep_download=True)